@@ -1,16 +1,64 @@
-from fastapi import APIRouter, HTTPException
+import time
+import asyncio
+from contextlib import aclosing
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from loguru import logger
 
 from app.models.schemas import (
     DiagnosisRequest, DiagnosisStartResponse, DiagnosisStatusResponse, 
-    DiagnosisStatus, ExportRequest, ExportResponse, FeedbackRequest, FeedbackResponse
+    DiagnosisStatus, ExportRequest, ExportResponse, FeedbackRequest, FeedbackResponse,
+    DiagnosisBatchRequest, DiagnosisBatchResponse, DiagnosisBatchItem
 )
-from app.core.tasks import process_diagnosis, generate_report, get_task_status
+from app.core.tasks import (
+    process_diagnosis, process_diagnosis_batch, generate_report, get_task_status,
+    execute_diagnosis, execute_diagnosis_batch, report_progress, broker_priority
+)
+from app.core.local_executor import get_local_executor, ExecutorSaturatedError
+from app.core.progress import progress_broker, is_terminal
+from app.api.v1.progress import watch_progress, sse_event, SSE_HEADERS, SSE_HEARTBEAT
+from app.config import settings
 from app.utils.io_helpers import DatabaseHelper, ValidationHelper
 from app.utils.prometheus_metrics import metrics, increment_active_sessions, decrement_active_sessions
 
 router = APIRouter()
 
+def _dispatch_diagnosis(session_id: str, diagnosis_data: dict) -> Optional[asyncio.Future]:
+    """Run a diagnosis on Celery or the local executor, per EXECUTION_MODE.
+    
+    Returns the local job's future, or None when the work went to Celery.
+    """
+    if settings.execution_mode == "celery":
+        task = process_diagnosis.apply_async(
+            (session_id, diagnosis_data),
+            priority=broker_priority(diagnosis_data.get("priority", "normal"))
+        )
+        DatabaseHelper.update_session(session_id, {"task_id": task.id})
+        return None
+    
+    def progress(percent: int, message: str, **extra):
+        report_progress(None, None, session_id, percent, message, **extra)
+    
+    return get_local_executor().submit(lambda: execute_diagnosis(session_id, diagnosis_data, progress))
+
+def _dispatch_diagnosis_batch(batch_id: str, items: list) -> Optional[asyncio.Future]:
+    """Run a diagnosis batch on Celery or the local executor, per EXECUTION_MODE.
+    
+    A local batch takes a single executor slot. Returns the local job's
+    future, or None when the work went to Celery.
+    """
+    if settings.execution_mode == "celery":
+        # Batches are bulk work, so interactive diagnoses on the same queue go first
+        task = process_diagnosis_batch.apply_async((batch_id, items), priority=broker_priority("low"))
+        DatabaseHelper.update_batch(batch_id, {"task_id": task.id})
+        return None
+    
+    def progress(percent: int, message: str, **extra):
+        report_progress(None, None, batch_id, percent, message, **extra)
+    
+    return get_local_executor().submit(lambda: execute_diagnosis_batch(batch_id, items, progress))
+
 @router.post("/diagnosis/start", response_model=DiagnosisStartResponse)
 async def start_diagnosis(request: DiagnosisRequest):
     """Start a new diagnosis session"""
@@ -25,7 +73,7 @@ async def start_diagnosis(request: DiagnosisRequest):
         session_id = DatabaseHelper.create_session(request.dict())
         
         # Start background diagnosis processing
-        task = process_diagnosis.delay(session_id, request.dict())
+        _dispatch_diagnosis(session_id, request.dict())
         
         # Track metrics
         increment_active_sessions()
@@ -40,11 +88,278 @@ async def start_diagnosis(request: DiagnosisRequest):
         
     except HTTPException:
         raise
+    except ExecutorSaturatedError as e:
+        metrics.record_background_task("diagnosis", success=False)
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to start diagnosis: {e}")
         metrics.record_background_task("diagnosis", success=False)
         raise HTTPException(status_code=500, detail=f"Failed to start diagnosis: {str(e)}")
 
+@router.post("/diagnosis", response_model=DiagnosisStatusResponse)
+async def run_diagnosis(request: DiagnosisRequest, response: Response):
+    """Run a diagnosis and return its result if it finishes within the deadline.
+    
+    A run that takes longer keeps going in the background and the call
+    returns 202 with the session id to follow up on.
+    """
+    validation_errors = ValidationHelper.validate_diagnosis_request(request.dict())
+    if validation_errors:
+        raise HTTPException(status_code=400, detail=validation_errors)
+    
+    from app.core.result_store import result_store
+    
+    session_id = DatabaseHelper.create_session(request.dict())
+    timeout = settings.diagnosis_sync_timeout_sec
+    
+    try:
+        if settings.execution_mode == "celery":
+            # Subscribe before dispatching so the completion event cannot be missed
+            async with progress_broker.subscribe(session_id) as subscription:
+                _dispatch_diagnosis(session_id, request.dict())
+                increment_active_sessions()
+                
+                deadline = time.monotonic() + timeout
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    event = await subscription.next(timeout=remaining)
+                    if event is not None and is_terminal(event):
+                        break
+        else:
+            job = _dispatch_diagnosis(session_id, request.dict())
+            increment_active_sessions()
+            
+            try:
+                await asyncio.wait_for(asyncio.shield(job), timeout)
+            except asyncio.TimeoutError:
+                raise
+            except Exception:
+                # The failure has already been written to the result store
+                pass
+        
+        metrics.record_background_task("diagnosis", success=True)
+        
+    except asyncio.TimeoutError:
+        response.status_code = 202
+        return DiagnosisStatusResponse(
+            status=DiagnosisStatus.PROCESSING,
+            message=f"Diagnosis still running after {timeout:g}s; follow /diagnosis/{session_id}/stream",
+            sessionId=session_id
+        )
+    except ExecutorSaturatedError as e:
+        metrics.record_background_task("diagnosis", success=False)
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to run diagnosis: {e}")
+        metrics.record_background_task("diagnosis", success=False)
+        raise HTTPException(status_code=500, detail=f"Failed to run diagnosis: {str(e)}")
+    
+    return _session_status(session_id, await asyncio.to_thread(result_store.get, session_id))
+
+@router.post("/diagnosis/batch", response_model=DiagnosisBatchResponse)
+async def start_diagnosis_batch(request: DiagnosisBatchRequest):
+    """Start diagnoses for many patients with shared retrieval"""
+    
+    try:
+        if len(request.items) > settings.diagnosis_batch_max_items:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Batch too large: {len(request.items)} items (max {settings.diagnosis_batch_max_items})"
+            )
+        
+        # Validate every item up front so a batch is accepted or rejected as a whole
+        validation_errors = {}
+        for index, item in enumerate(request.items):
+            errors = ValidationHelper.validate_diagnosis_request(item.dict())
+            if errors:
+                validation_errors[str(index)] = errors
+        if validation_errors:
+            raise HTTPException(status_code=400, detail=validation_errors)
+        
+        items = []
+        for item in request.items:
+            session_id = DatabaseHelper.create_session(item.dict())
+            items.append({"sessionId": session_id, "request": item.dict()})
+        
+        batch_id = DatabaseHelper.create_batch([item["sessionId"] for item in items])
+        _dispatch_diagnosis_batch(batch_id, items)
+        
+        metrics.record_background_task("diagnosis_batch", success=True)
+        logger.info(f"Started diagnosis batch {batch_id} with {len(items)} items")
+        
+        batch = DatabaseHelper.get_batch(batch_id)
+        return _batch_snapshot(batch, await asyncio.to_thread(_batch_item_outcomes, batch))
+        
+    except HTTPException:
+        raise
+    except ExecutorSaturatedError as e:
+        metrics.record_background_task("diagnosis_batch", success=False)
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to start diagnosis batch: {e}")
+        metrics.record_background_task("diagnosis_batch", success=False)
+        raise HTTPException(status_code=500, detail=f"Failed to start diagnosis batch: {str(e)}")
+
+def _batch_item_outcomes(batch: dict) -> dict:
+    """Resolve the current outcome of each session in a batch.
+    
+    Reads the result store and Celery synchronously, so async callers run it
+    in a thread.
+    """
+    from app.core.result_store import result_store
+    
+    # One pipelined read for the whole batch rather than a lookup per session
+    stored_batch, *stored_outcomes = result_store.get_many([batch["id"], *batch["session_ids"]])
+    
+    if batch.get("task_id"):
+        status = get_task_status(batch["task_id"])
+    else:
+        # Locally run batches report only through the result store
+        status = stored_batch or {"status": "processing"}
+    reported = status.get("items", {})
+    
+    outcomes = {}
+    for session_id, stored in zip(batch["session_ids"], stored_outcomes):
+        if stored and stored["status"] in ("completed", "error"):
+            outcomes[session_id] = stored
+        elif status["status"] == "error":
+            outcomes[session_id] = {"status": "error", "error": status.get("error")}
+        else:
+            outcomes[session_id] = {"status": reported.get(session_id, "processing")}
+    return outcomes
+
+def _batch_snapshot(batch: dict, outcomes: dict) -> DiagnosisBatchResponse:
+    items = []
+    for index, session_id in enumerate(batch["session_ids"]):
+        outcome = outcomes[session_id]
+        items.append(DiagnosisBatchItem(
+            index=index,
+            sessionId=session_id,
+            status=DiagnosisStatus(outcome["status"]),
+            message=outcome.get("error")
+        ))
+    
+    completed = sum(item.status == DiagnosisStatus.COMPLETED for item in items)
+    failed = sum(item.status == DiagnosisStatus.ERROR for item in items)
+    
+    return DiagnosisBatchResponse(
+        batchId=batch["id"],
+        status=DiagnosisStatus.COMPLETED if completed + failed == len(items) else DiagnosisStatus.PROCESSING,
+        total=len(items),
+        completed=completed,
+        failed=failed,
+        items=items
+    )
+
+@router.get("/diagnosis/batch/{batch_id}", response_model=DiagnosisBatchResponse)
+async def get_diagnosis_batch_status(batch_id: str):
+    """Get per-item status of a diagnosis batch"""
+    
+    batch = DatabaseHelper.get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    return _batch_snapshot(batch, await asyncio.to_thread(_batch_item_outcomes, batch))
+
+@router.get("/diagnosis/batch/{batch_id}/stream")
+async def stream_diagnosis_batch(batch_id: str, request: Request):
+    """Stream each batch item as soon as it completes"""
+    
+    batch = DatabaseHelper.get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    async def event_stream():
+        sent = set()
+        
+        def finished_items(outcomes: dict):
+            for index, session_id in enumerate(batch["session_ids"]):
+                outcome = outcomes[session_id]
+                if session_id in sent or outcome["status"] not in ("completed", "error"):
+                    continue
+                
+                sent.add(session_id)
+                yield sse_event("item", {
+                    "index": index,
+                    "sessionId": session_id,
+                    "status": outcome["status"],
+                    "result": outcome.get("result"),
+                    "error": outcome.get("error")
+                })
+        
+        # Items finished before the client connected are sent straight away
+        outcomes = await asyncio.to_thread(_batch_item_outcomes, batch)
+        for chunk in finished_items(outcomes):
+            yield chunk
+        
+        if len(sent) < len(batch["session_ids"]):
+            async with aclosing(watch_progress(batch_id, request.is_disconnected)) as events:
+                async for event in events:
+                    if event is None:
+                        yield SSE_HEARTBEAT
+                        continue
+                    
+                    # Only look up results when the event reports newly finished items
+                    newly_finished = any(
+                        status in ("completed", "error") and session_id not in sent
+                        for session_id, status in event.get("items", {}).items()
+                    )
+                    if newly_finished or is_terminal(event):
+                        outcomes = await asyncio.to_thread(_batch_item_outcomes, batch)
+                        for chunk in finished_items(outcomes):
+                            yield chunk
+                    
+                    if is_terminal(event) or len(sent) == len(batch["session_ids"]):
+                        break
+                else:
+                    # Client went away before the batch finished
+                    return
+        
+        yield sse_event("complete", _batch_snapshot(batch, outcomes).dict())
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+def _session_status(session_id: str, result: Optional[dict]) -> DiagnosisStatusResponse:
+    """Turn a stored task outcome into a status response, recording it on the session"""
+    if result:
+        if result["status"] == "completed":
+            # Update session in database
+            DatabaseHelper.update_session(session_id, {
+                "status": "completed",
+                "result": result["result"]
+            })
+            
+            decrement_active_sessions()
+            
+            return DiagnosisStatusResponse(
+                status=DiagnosisStatus.COMPLETED,
+                result=result["result"],
+                sessionId=session_id
+            )
+        
+        elif result["status"] == "error":
+            DatabaseHelper.update_session(session_id, {
+                "status": "error",
+                "error": result.get("error")
+            })
+            
+            decrement_active_sessions()
+            
+            return DiagnosisStatusResponse(
+                status=DiagnosisStatus.ERROR,
+                message=f"Diagnosis failed: {result.get('error', 'Unknown error')}",
+                sessionId=session_id
+            )
+    
+    # Still processing
+    return DiagnosisStatusResponse(
+        status=DiagnosisStatus.PROCESSING,
+        message="Diagnosis in progress",
+        sessionId=session_id
+    )
+
 @router.get("/diagnosis/{session_id}", response_model=DiagnosisStatusResponse)
 async def get_diagnosis_status(session_id: str):
     """Get diagnosis session status and results"""
@@ -56,43 +371,9 @@ async def get_diagnosis_status(session_id: str):
             raise HTTPException(status_code=404, detail="Session not found")
         
         # Check if we have results from background task
-        from app.core.tasks import task_results
+        from app.core.result_store import result_store
         
-        if session_id in task_results:
-            result = task_results[session_id]
-            
-            if result["status"] == "completed":
-                # Update session in database
-                DatabaseHelper.update_session(session_id, {
-                    "status": "completed",
-                    "result": result["result"]
-                })
-                
-                decrement_active_sessions()
-                
-                return DiagnosisStatusResponse(
-                    status=DiagnosisStatus.COMPLETED,
-                    result=result["result"]
-                )
-            
-            elif result["status"] == "error":
-                DatabaseHelper.update_session(session_id, {
-                    "status": "error",
-                    "error": result.get("error")
-                })
-                
-                decrement_active_sessions()
-                
-                return DiagnosisStatusResponse(
-                    status=DiagnosisStatus.ERROR,
-                    message=f"Diagnosis failed: {result.get('error', 'Unknown error')}"
-                )
-        
-        # Still processing
-        return DiagnosisStatusResponse(
-            status=DiagnosisStatus.PROCESSING,
-            message="Diagnosis in progress"
-        )
+        return _session_status(session_id, await asyncio.to_thread(result_store.get, session_id))
         
     except HTTPException:
         raise
@@ -100,6 +381,60 @@ async def get_diagnosis_status(session_id: str):
         logger.error(f"Failed to get diagnosis status for {session_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to get status: {str(e)}")
 
+@router.get("/diagnosis/{session_id}/stream")
+async def stream_diagnosis(session_id: str, request: Request):
+    """Stream diagnosis progress and each differential diagnosis as it is generated"""
+    
+    session = DatabaseHelper.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    async def event_stream():
+        from app.core.result_store import result_store
+        
+        sent_diagnoses = 0
+        last_progress = None
+        
+        stored = await asyncio.to_thread(result_store.get, session_id)
+        if not stored or stored["status"] not in ("completed", "error"):
+            async with aclosing(watch_progress(session_id, request.is_disconnected)) as events:
+                async for event in events:
+                    if event is None:
+                        yield SSE_HEARTBEAT
+                        continue
+                    
+                    if is_terminal(event):
+                        # The worker stores the result before announcing it
+                        stored = await asyncio.to_thread(result_store.get, session_id)
+                        stored = stored or {"status": event["status"], "error": event.get("error")}
+                        break
+                    
+                    for diagnosis in event.get("partialDiagnoses", [])[sent_diagnoses:]:
+                        yield sse_event("diagnosis", diagnosis)
+                        sent_diagnoses += 1
+                    
+                    progress = event.get("progress", 0)
+                    if progress != last_progress:
+                        yield sse_event("progress", {"progress": progress, "message": event.get("message", "")})
+                        last_progress = progress
+                else:
+                    return
+        
+        if stored["status"] == "completed":
+            result = stored.get("result")
+            if result is None and session.get("task_id"):
+                status = await asyncio.to_thread(get_task_status, session["task_id"])
+                result = (status.get("result") or {}).get("result")
+            result = result or {}
+            
+            for diagnosis in result.get("differentialDiagnosis", [])[sent_diagnoses:]:
+                yield sse_event("diagnosis", diagnosis)
+            yield sse_event("complete", result)
+        else:
+            yield sse_event("error", {"message": f"Diagnosis failed: {stored.get('error') or 'Unknown error'}"})
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @router.post("/diagnosis/{session_id}/export", response_model=ExportResponse)
 async def export_diagnosis(session_id: str, request: ExportRequest):
     """Export diagnosis results in specified format"""
@@ -118,8 +453,8 @@ async def export_diagnosis(session_id: str, request: ExportRequest):
         
         # For immediate JSON export, return data directly
         if request.format.value == "json":
-            from app.core.tasks import task_results
-            diagnosis_result = task_results.get(session_id, {}).get("result")
+            from app.core.result_store import result_store
+            diagnosis_result = (await asyncio.to_thread(result_store.get, session_id) or {}).get("result")
             
             if diagnosis_result:
                 return ExportResponse(data=diagnosis_result)
@@ -209,9 +544,8 @@ async def delete_diagnosis_session(session_id: str):
         DatabaseHelper.update_session(session_id, {"deleted": True})
         
         # Clean up task results
-        from app.core.tasks import task_results
-        if session_id in task_results:
-            del task_results[session_id]
+        from app.core.result_store import result_store
+        await asyncio.to_thread(result_store.delete, session_id)
         
         logger.info(f"Deleted diagnosis session: {session_id}")
         
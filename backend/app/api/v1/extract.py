@@ -1,7 +1,9 @@
+import asyncio
 from fastapi import APIRouter, HTTPException
 from loguru import logger
 
-from app.core.tasks import extract_file_content, get_task_status
+from app.core.tasks import extract_file_content, complete_from_extraction_cache, get_task_status
+from app.core.storage import storage_client
 from app.utils.prometheus_metrics import metrics
 
 router = APIRouter()
@@ -11,11 +13,16 @@ async def trigger_extraction(file_id: str):
     """Trigger file extraction if not already started"""
     
     try:
+        info = await storage_client.get_file_info(file_id)
+        if info is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        file_path, content_hash = info.path, info.content_hash
+        
         # Check if extraction already exists
-        from app.core.tasks import task_results
+        from app.core.result_store import result_store
         
-        if file_id in task_results:
-            result = task_results[file_id]
+        result = await asyncio.to_thread(result_store.get, file_id)
+        if result:
             if result["status"] == "completed":
                 return {
                     "message": "Extraction already completed",
@@ -24,7 +31,7 @@ async def trigger_extraction(file_id: str):
                 }
             elif result["status"] == "error":
                 # Retry extraction
-                task = extract_file_content.delay(file_id, f"retry_{file_id}")
+                task = extract_file_content.delay(file_id, file_path, content_hash)
                 return {
                     "message": "Extraction retried",
                     "fileId": file_id,
@@ -32,8 +39,15 @@ async def trigger_extraction(file_id: str):
                     "status": "processing"
                 }
         
+        if await asyncio.to_thread(complete_from_extraction_cache, file_id, file_path, content_hash) is not None:
+            return {
+                "message": "Extraction reused from identical content",
+                "fileId": file_id,
+                "status": "completed"
+            }
+        
         # Start new extraction
-        task = extract_file_content.delay(file_id, file_id)
+        task = extract_file_content.delay(file_id, file_path, content_hash)
         
         # Track metrics
         metrics.record_background_task("extraction", success=True)
@@ -47,6 +61,8 @@ async def trigger_extraction(file_id: str):
             "status": "processing"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to trigger extraction for file {file_id}: {e}")
         metrics.record_background_task("extraction", success=False)
@@ -57,10 +73,10 @@ async def get_extraction_status(file_id: str):
     """Get extraction status for a file"""
     
     try:
-        from app.core.tasks import task_results
+        from app.core.result_store import result_store
         
-        if file_id in task_results:
-            result = task_results[file_id]
+        result = await asyncio.to_thread(result_store.get, file_id)
+        if result:
             return {
                 "fileId": file_id,
                 "status": result["status"],
@@ -83,13 +99,12 @@ async def get_extraction_result(file_id: str):
     """Get extracted content for a file"""
     
     try:
-        from app.core.tasks import task_results
+        from app.core.result_store import result_store
         
-        if file_id not in task_results:
+        result = await asyncio.to_thread(result_store.get, file_id)
+        if not result:
             raise HTTPException(status_code=404, detail="Extraction not found")
         
-        result = task_results[file_id]
-        
         if result["status"] != "completed":
             raise HTTPException(
                 status_code=400, 
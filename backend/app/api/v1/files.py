@@ -0,0 +1,209 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import RedirectResponse, Response
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote
+import aiofiles
+from loguru import logger
+
+from app.core.storage import storage_client
+from app.utils.io_helpers import AuthHelper
+from app.utils.prometheus_metrics import metrics
+from app.config import settings
+
+router = APIRouter()
+security = HTTPBearer(auto_error=False)
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+class FileRangeResponse(Response):
+    """Send a byte range of a file without loading it into memory.
+    
+    Uses the ASGI zero-copy send extension (sendfile) when the server offers
+    it, and fixed-size reads off the event loop otherwise, so memory stays at
+    one chunk per download however large the file is.
+    """
+    
+    def __init__(
+        self,
+        path: str,
+        start: int,
+        length: int,
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+        media_type: Optional[str] = None,
+        chunk_size: int = settings.download_chunk_bytes
+    ):
+        self.path = path
+        self.start = start
+        self.length = length
+        self.chunk_size = chunk_size
+        super().__init__(
+            status_code=status_code,
+            headers={**(headers or {}), "Content-Length": str(length)},
+            media_type=media_type
+        )
+    
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        
+        if scope["method"].upper() == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f,
+                    "offset": self.start,
+                    "count": self.length,
+                    "more_body": False
+                })
+        else:
+            async with aiofiles.open(self.path, "rb") as f:
+                await f.seek(self.start)
+                remaining = self.length
+                while remaining:
+                    chunk = await f.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        # File shrank underneath us; the short body makes the
+                        # client see a truncated transfer
+                        logger.warning(f"{self.path} ended {remaining} bytes early")
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        
+        if self.background is not None:
+            await self.background()
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Resolve a ``Range`` header to an inclusive (start, end) byte range.
+    
+    Returns None when the whole file should be sent: no header, a malformed
+    one, or several ranges (which are rare enough not to warrant multipart
+    responses). Raises RangeNotSatisfiable when the range lies past the end.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            suffix = int(last)
+            if suffix <= 0 or size == 0:
+                raise RangeNotSatisfiable()
+            return max(0, size - suffix), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+def authorize_download(
+    file_id: str,
+    expires: Optional[int],
+    signature: Optional[str],
+    credentials: Optional[HTTPAuthorizationCredentials]
+):
+    """Accept either a signed URL or a bearer token.
+    
+    Signed URLs are checked with a single HMAC, so clients holding one never
+    go through token verification.
+    """
+    if expires is not None or signature is not None:
+        if expires is None or signature is None or not AuthHelper.verify_file_signature(file_id, expires, signature):
+            raise HTTPException(status_code=403, detail="Invalid or expired download signature")
+        return
+    
+    if credentials is None or not AuthHelper.verify_token(credentials.credentials):
+        raise HTTPException(status_code=401, detail="Authentication required")
+
+@router.api_route("/files/{file_id}", methods=["GET", "HEAD"])
+async def download_file(
+    file_id: str,
+    expires: Optional[int] = None,
+    signature: Optional[str] = None,
+    range_header: Optional[str] = Header(default=None, alias="Range"),
+    if_none_match: Optional[str] = Header(default=None),
+    if_range: Optional[str] = Header(default=None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
+):
+    """Stream a stored file, honouring Range and If-None-Match"""
+    authorize_download(file_id, expires, signature, credentials)
+    
+    info = await storage_client.get_file_info(file_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    # Stored content never changes under a file id, so its hash is a strong ETag
+    etag = f'"{info.content_hash}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": content_disposition(info.filename)
+    }
+    
+    if if_none_match and etag_matches(if_none_match, etag):
+        metrics.record_file_download("not_modified")
+        return Response(status_code=304, headers=headers)
+    
+    if info.path is None:
+        # Object stores serve ranges and conditionals themselves
+        metrics.record_file_download("redirect")
+        return RedirectResponse(await storage_client.get_presigned_url(file_id), status_code=307)
+    
+    if if_range is not None and if_range != etag:
+        range_header = None
+    
+    try:
+        byte_range = parse_range(range_header, info.size)
+    except RangeNotSatisfiable:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{info.size}"}
+        )
+    
+    if byte_range is None:
+        metrics.record_file_download("full", info.size)
+        return FileRangeResponse(info.path, 0, info.size, headers=headers, media_type=info.content_type)
+    
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+    metrics.record_file_download("partial", end - start + 1)
+    return FileRangeResponse(
+        info.path, start, end - start + 1, status_code=206, headers=headers, media_type=info.content_type
+    )
+
+@router.get("/files/{file_id}/url")
+async def get_download_url(
+    file_id: str,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
+):
+    """Issue a signed, expiring download URL for a stored file"""
+    authorize_download(file_id, None, None, credentials)
+    
+    url = await storage_client.get_presigned_url(file_id, expires_in=settings.file_url_ttl_sec)
+    if url is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    return {"fileId": file_id, "url": url, "expiresIn": settings.file_url_ttl_sec}
@@ -1,9 +1,11 @@
+import asyncio
 from fastapi import APIRouter, Response
 from datetime import datetime
+from loguru import logger
 from app.models.schemas import HealthResponse
 from app.core.faiss_client import faiss_client
 from app.core.kg_client import kg_client
-from app.utils.prometheus_metrics import get_metrics, get_metrics_content_type
+from app.utils.prometheus_metrics import metrics, get_metrics, get_metrics_content_type
 from app.config import settings
 
 router = APIRouter()
@@ -54,6 +56,14 @@ async def prometheus_metrics():
     if not settings.prometheus_enabled:
         return {"message": "Metrics disabled"}
     
+    if settings.execution_mode == "celery":
+        # Sample queue depths at scrape time so the gauges are current
+        try:
+            from app.core.tasks import get_queue_depths
+            metrics.record_queue_depths(await asyncio.to_thread(get_queue_depths))
+        except Exception as e:
+            logger.warning(f"Failed to sample task queue depths: {e}")
+    
     metrics_data = get_metrics()
     return Response(
         content=metrics_data,
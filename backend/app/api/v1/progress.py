@@ -0,0 +1,70 @@
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from loguru import logger
+
+from app.core.progress import progress_broker, is_terminal
+from app.config import settings
+from app.utils.prometheus_metrics import metrics
+
+router = APIRouter()
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+SSE_HEARTBEAT = ": heartbeat\n\n"
+
+def sse_event(event: str, data) -> str:
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def watch_progress(
+    key: str,
+    is_disconnected: Callable[[], Awaitable[bool]],
+    transport: str = "sse"
+) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """Yield progress events for a key until a terminal one arrives.
+    
+    ``None`` is yielded whenever ``progress_heartbeat_sec`` passes without an
+    event, so callers can keep idle connections alive through proxies.
+    """
+    metrics.record_progress_subscriber(transport, 1)
+    try:
+        async with progress_broker.subscribe(key) as subscription:
+            while not await is_disconnected():
+                event = await subscription.next(timeout=settings.progress_heartbeat_sec)
+                yield event
+                if event is not None and is_terminal(event):
+                    return
+    finally:
+        metrics.record_progress_subscriber(transport, -1)
+
+@router.get("/progress/{key}/stream")
+async def stream_progress(key: str, request: Request):
+    """Stream progress events for a session, batch or file over SSE"""
+    
+    async def event_stream():
+        async for event in watch_progress(key, request.is_disconnected):
+            if event is None:
+                yield SSE_HEARTBEAT
+            else:
+                yield sse_event("progress", event)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.websocket("/progress/{key}/ws")
+async def progress_websocket(websocket: WebSocket, key: str):
+    """Push progress events for a session, batch or file over a WebSocket"""
+    await websocket.accept()
+    
+    async def is_disconnected() -> bool:
+        return websocket.client_state.name != "CONNECTED"
+    
+    try:
+        async for event in watch_progress(key, is_disconnected, transport="websocket"):
+            if event is None:
+                await websocket.send_json({"type": "heartbeat"})
+            else:
+                await websocket.send_json({"type": "progress", "data": event})
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.debug(f"Progress WebSocket for {key} disconnected")
@@ -1,16 +1,45 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from typing import List
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Header, Request, Response
+from typing import AsyncIterator, List, Optional
 import uuid
+import time
+import asyncio
+from datetime import datetime
 from loguru import logger
 
-from app.models.schemas import FileUploadResponse, FileProgressResponse, FileStatus
-from app.core.storage import storage_client, validate_file_type, validate_file_size
-from app.core.tasks import extract_file_content, get_task_status
+from app.models.schemas import (
+    FileUploadResponse, FileProgressResponse, FileStatus, UploadSessionCreate, UploadSessionResponse
+)
+from app.core.storage import (
+    storage_client, validate_file_type, validate_file_size, max_file_size_bytes, FileTooLargeError,
+    StoredFile, UploadSession, UploadSessionError, UploadSessionNotFoundError
+)
+from app.core.tasks import extract_file_content, complete_from_extraction_cache, get_task_status
 from app.utils.prometheus_metrics import metrics
 from app.config import settings
 
 router = APIRouter()
 
+async def iter_upload(file: UploadFile, chunk_size: int = settings.upload_chunk_bytes) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+def queue_extraction(stored: StoredFile) -> Optional[str]:
+    """Queue extraction of a just-stored file and return the task id.
+    
+    Content uploaded before is not extracted again; its cached result is
+    stored for the new file id and None is returned. Talks to the result
+    store and broker synchronously, so handlers call it in a thread.
+    """
+    # The worker streams the stored file from disk rather than receiving
+    # its content; files in object storage have no local path and are
+    # fetched by the worker. The cache key only needs the extension.
+    if complete_from_extraction_cache(stored.file_id, stored.path or stored.filename, stored.content_hash) is not None:
+        return None
+    return extract_file_content.delay(stored.file_id, stored.path, stored.content_hash).id
+
 @router.post("/upload", response_model=FileUploadResponse)
 async def upload_files(files: List[UploadFile] = File(...)):
     """Upload files for processing"""
@@ -32,25 +61,30 @@ async def upload_files(files: List[UploadFile] = File(...)):
                     detail=f"File type not allowed: {file.filename}"
                 )
             
-            # Read file content
-            content = await file.read()
-            
-            # Validate file size
-            if not validate_file_size(len(content)):
+            # Reject early when the client declared the size
+            if file.size is not None and not validate_file_size(file.size):
                 raise HTTPException(
                     status_code=400, 
                     detail=f"File too large: {file.filename} (max {settings.max_file_size_mb}MB)"
                 )
             
-            # Upload to storage
-            file_id = await storage_client.upload_file(
-                file_content=content,
-                filename=file.filename,
-                content_type=file.content_type or "application/octet-stream"
-            )
+            # Stream to storage in fixed-size chunks; the size limit is
+            # enforced on the bytes actually received
+            try:
+                stored = await storage_client.store_stream(
+                    iter_upload(file),
+                    filename=file.filename,
+                    content_type=file.content_type or "application/octet-stream",
+                    max_size=max_file_size_bytes()
+                )
+            except FileTooLargeError:
+                raise HTTPException(
+                    status_code=400, 
+                    detail=f"File too large: {file.filename} (max {settings.max_file_size_mb}MB)"
+                )
             
-            # Queue extraction task
-            task = extract_file_content.delay(file_id, file.filename)
+            file_id = stored.file_id
+            task_id = await asyncio.to_thread(queue_extraction, stored)
             
             # Track metrics
             file_extension = file.filename.split('.')[-1].lower() if '.' in file.filename else 'unknown'
@@ -59,7 +93,7 @@ async def upload_files(files: List[UploadFile] = File(...)):
             uploaded_files.append({
                 "fileId": file_id,
                 "filename": file.filename,
-                "taskId": task.id
+                "taskId": task_id
             })
             
             logger.info(f"File uploaded successfully: {file_id} ({file.filename})")
@@ -81,18 +115,134 @@ async def upload_files(files: List[UploadFile] = File(...)):
         message=f"File uploaded successfully. Processing started."
     )
 
+_last_session_purge = 0.0
+
+async def purge_stale_sessions():
+    """Garbage-collect abandoned upload sessions, at most once a minute per process"""
+    global _last_session_purge
+    now = time.monotonic()
+    if now - _last_session_purge < 60:
+        return
+    _last_session_purge = now
+    try:
+        await storage_client.purge_stale_upload_sessions(settings.upload_session_ttl_sec)
+    except Exception as e:
+        logger.warning(f"Failed to purge stale upload sessions: {e}")
+
+def session_response(session: UploadSession, response: Optional[Response] = None) -> UploadSessionResponse:
+    if response is not None:
+        # tus-style headers so resumable clients can read the offset directly
+        response.headers["Upload-Offset"] = str(session.offset)
+        response.headers["Upload-Length"] = str(session.size)
+    
+    return UploadSessionResponse(
+        sessionId=session.session_id,
+        filename=session.filename,
+        size=session.size,
+        offset=session.offset,
+        chunkSize=session.chunk_size,
+        receivedChunks=len(session.received),
+        totalChunks=session.total_chunks,
+        expiresAt=datetime.fromtimestamp(session.updated_at + settings.upload_session_ttl_sec)
+    )
+
+@router.post("/upload/sessions", response_model=UploadSessionResponse, status_code=201)
+async def create_upload_session(request: UploadSessionCreate, response: Response):
+    """Start a resumable upload; chunks are then sent with PATCH at chunkSize offsets"""
+    
+    if not validate_file_type(request.filename):
+        raise HTTPException(status_code=400, detail=f"File type not allowed: {request.filename}")
+    if not validate_file_size(request.size):
+        raise HTTPException(
+            status_code=400, 
+            detail=f"File too large: {request.filename} (max {settings.max_file_size_mb}MB)"
+        )
+    
+    await purge_stale_sessions()
+    
+    session = await storage_client.create_upload_session(
+        request.filename, request.contentType or "application/octet-stream", request.size,
+        content_hash=request.sha256.lower() if request.sha256 else None
+    )
+    return session_response(session, response)
+
+@router.get("/upload/sessions/{session_id}", response_model=UploadSessionResponse)
+async def get_upload_session(session_id: str, response: Response):
+    """Report the offset a client should resume from"""
+    
+    session = await storage_client.get_upload_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session_response(session, response)
+
+@router.patch("/upload/sessions/{session_id}", response_model=UploadSessionResponse)
+async def upload_session_chunk(
+    session_id: str,
+    request: Request,
+    response: Response,
+    upload_offset: int = Header(..., alias="Upload-Offset")
+):
+    """Write one chunk at ``Upload-Offset``; chunks may be sent in parallel and retried"""
+    
+    try:
+        session = await storage_client.write_upload_chunk(session_id, upload_offset, request.stream())
+    except UploadSessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    except UploadSessionError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    return session_response(session, response)
+
+@router.post("/upload/sessions/{session_id}/complete", response_model=FileUploadResponse)
+async def complete_upload_session(session_id: str):
+    """Assemble a fully received session into a file and start processing it"""
+    
+    try:
+        session = await storage_client.get_upload_session(session_id)
+        stored = await storage_client.store_upload_session(session_id)
+    except UploadSessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    except UploadSessionError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    file_id = stored.file_id
+    file_extension = session.filename.split('.')[-1].lower() if '.' in session.filename else 'unknown'
+    try:
+        await asyncio.to_thread(queue_extraction, stored)
+    except Exception as e:
+        logger.error(f"Failed to queue extraction for {file_id}: {e}")
+        metrics.record_file_upload(file_extension, success=False)
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    
+    metrics.record_file_upload(file_extension, success=True)
+    logger.info(f"File uploaded successfully: {file_id} ({session.filename}, resumable)")
+    
+    return FileUploadResponse(
+        fileId=file_id,
+        status=FileStatus.UPLOADED,
+        message="File uploaded successfully. Processing started."
+    )
+
+@router.delete("/upload/sessions/{session_id}")
+async def abort_upload_session(session_id: str):
+    """Abandon a resumable upload and discard its chunks"""
+    
+    if not await storage_client.abort_upload_session(session_id):
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return {"sessionId": session_id, "status": "aborted"}
+
 @router.get("/upload/{file_id}/progress", response_model=FileProgressResponse)
 async def get_upload_progress(file_id: str):
     """Get file processing progress"""
     
     try:
-        # Get task status from Celery
-        # For simplicity, we'll check if we have a stored result
-        from app.core.tasks import task_results
+        # Clients that want live updates should subscribe to
+        # /progress/{file_id}/stream instead of polling this endpoint
+        from app.core.result_store import result_store
         
         # Check if we have a completed result
-        if file_id in task_results:
-            result = task_results[file_id]
+        result = await asyncio.to_thread(result_store.get, file_id)
+        if result:
             if result["status"] == "completed":
                 return FileProgressResponse(
                     progress=100,
@@ -106,11 +256,21 @@ async def get_upload_progress(file_id: str):
                     message=f"Processing failed: {result.get('error', 'Unknown error')}"
                 )
         
-        # If no result yet, assume still processing
+        # Otherwise report the latest progress the worker published
+        from app.core.progress import progress_broker
+        
+        event = await asyncio.to_thread(progress_broker.latest, file_id)
+        if event is None:
+            return FileProgressResponse(
+                progress=0,
+                status=FileStatus.UPLOADED,
+                message="Waiting for processing to start"
+            )
+        
         return FileProgressResponse(
-            progress=50,
+            progress=event.get("progress", 0),
             status=FileStatus.EXTRACTING,
-            message="Processing file content"
+            message=event.get("message") or "Processing file content"
         )
         
     except Exception as e:
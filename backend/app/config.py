@@ -19,15 +19,109 @@ class Settings(BaseSettings):
     
     # Redis & Celery
     redis_url: str = Field(default="redis://localhost:6379/0", env="REDIS_URL")
+    redis_socket_timeout_sec: float = Field(default=2.0, env="REDIS_SOCKET_TIMEOUT_SEC")
     celery_broker_url: str = Field(default="redis://localhost:6379/0", env="CELERY_BROKER_URL")
     celery_result_backend: str = Field(default="redis://localhost:6379/0", env="CELERY_RESULT_BACKEND")
     
+    # Celery queues (applied to workers started with a single -Q queue)
+    celery_diagnosis_concurrency: int = Field(default=4, env="CELERY_DIAGNOSIS_CONCURRENCY")
+    celery_diagnosis_prefetch_multiplier: int = Field(default=1, env="CELERY_DIAGNOSIS_PREFETCH_MULTIPLIER")
+    celery_extraction_concurrency: int = Field(default=2, env="CELERY_EXTRACTION_CONCURRENCY")
+    celery_extraction_prefetch_multiplier: int = Field(default=1, env="CELERY_EXTRACTION_PREFETCH_MULTIPLIER")
+    celery_reports_concurrency: int = Field(default=2, env="CELERY_REPORTS_CONCURRENCY")
+    celery_reports_prefetch_multiplier: int = Field(default=4, env="CELERY_REPORTS_PREFETCH_MULTIPLIER")
+    
+    # Task execution
+    execution_mode: str = Field(default="celery", env="EXECUTION_MODE")  # celery, inprocess-async, inprocess-threadpool
+    local_executor_max_workers: int = Field(default=4, env="LOCAL_EXECUTOR_MAX_WORKERS")
+    local_executor_max_pending: int = Field(default=100, env="LOCAL_EXECUTOR_MAX_PENDING")
+    diagnosis_sync_timeout_sec: float = Field(default=30.0, env="DIAGNOSIS_SYNC_TIMEOUT_SEC")
+    
     # LLM Configuration
     llm_provider: str = Field(default="mock", env="LLM_PROVIDER")
     perplexity_api_key: Optional[str] = Field(default=None, env="PERPLEXITY_API_KEY")
     openai_api_key: Optional[str] = Field(default=None, env="OPENAI_API_KEY")
     hf_api_token: Optional[str] = Field(default=None, env="HF_API_TOKEN")
     
+    llm_streaming_enabled: bool = Field(default=True, env="LLM_STREAMING_ENABLED")
+    
+    # LLM prompt budget
+    llm_prompt_token_budget: int = Field(default=1500, env="LLM_PROMPT_TOKEN_BUDGET")
+    llm_prompt_max_cases: int = Field(default=5, env="LLM_PROMPT_MAX_CASES")
+    llm_prompt_max_triplets: int = Field(default=15, env="LLM_PROMPT_MAX_TRIPLETS")
+    
+    # LLM HTTP connection pool
+    llm_http_pool_size: int = Field(default=100, env="LLM_HTTP_POOL_SIZE")
+    llm_http_pool_per_host: int = Field(default=20, env="LLM_HTTP_POOL_PER_HOST")
+    llm_http_keepalive_sec: float = Field(default=30.0, env="LLM_HTTP_KEEPALIVE_SEC")
+    llm_http_dns_ttl_sec: int = Field(default=300, env="LLM_HTTP_DNS_TTL_SEC")
+    llm_http_timeout_sec: float = Field(default=60.0, env="LLM_HTTP_TIMEOUT_SEC")
+    
+    # LLM concurrency limiting and circuit breaking
+    llm_concurrency_initial: int = Field(default=8, env="LLM_CONCURRENCY_INITIAL")
+    llm_concurrency_min: int = Field(default=1, env="LLM_CONCURRENCY_MIN")
+    llm_concurrency_max: int = Field(default=64, env="LLM_CONCURRENCY_MAX")
+    llm_latency_target_sec: float = Field(default=20.0, env="LLM_LATENCY_TARGET_SEC")
+    llm_queue_max: int = Field(default=100, env="LLM_QUEUE_MAX")
+    llm_queue_timeout_sec: float = Field(default=30.0, env="LLM_QUEUE_TIMEOUT_SEC")
+    llm_circuit_failure_threshold: int = Field(default=5, env="LLM_CIRCUIT_FAILURE_THRESHOLD")
+    llm_circuit_reset_sec: float = Field(default=30.0, env="LLM_CIRCUIT_RESET_SEC")
+    
+    # LLM request hedging
+    llm_hedge_enabled: bool = Field(default=False, env="LLM_HEDGE_ENABLED")
+    llm_hedge_provider: Optional[str] = Field(default=None, env="LLM_HEDGE_PROVIDER")
+    llm_hedge_percentile: float = Field(default=95.0, env="LLM_HEDGE_PERCENTILE")
+    llm_hedge_delay_sec: float = Field(default=10.0, env="LLM_HEDGE_DELAY_SEC")
+    llm_hedge_stream_delay_sec: float = Field(default=3.0, env="LLM_HEDGE_STREAM_DELAY_SEC")
+    
+    # LLM response cache
+    llm_cache_enabled: bool = Field(default=True, env="LLM_CACHE_ENABLED")
+    llm_cache_ttl_sec: int = Field(default=3600, env="LLM_CACHE_TTL_SEC")
+    llm_cache_max_entries: int = Field(default=1024, env="LLM_CACHE_MAX_ENTRIES")
+    llm_cache_redis_enabled: bool = Field(default=False, env="LLM_CACHE_REDIS_ENABLED")
+    llm_semantic_cache_enabled: bool = Field(default=False, env="LLM_SEMANTIC_CACHE_ENABLED")
+    llm_semantic_cache_threshold: float = Field(default=0.97, env="LLM_SEMANTIC_CACHE_THRESHOLD")
+    llm_semantic_cache_max_entries: int = Field(default=5000, env="LLM_SEMANTIC_CACHE_MAX_ENTRIES")
+    
+    # Mock LLM provider simulation
+    mock_llm_latency_profile: str = Field(default="fixed", env="MOCK_LLM_LATENCY_PROFILE")  # fixed, lognormal, histogram
+    mock_llm_latency_sec: float = Field(default=1.0, env="MOCK_LLM_LATENCY_SEC")
+    mock_llm_latency_sigma: float = Field(default=0.5, env="MOCK_LLM_LATENCY_SIGMA")
+    mock_llm_latency_histogram_path: Optional[str] = Field(default=None, env="MOCK_LLM_LATENCY_HISTOGRAM_PATH")
+    mock_llm_error_rate: float = Field(default=0.0, env="MOCK_LLM_ERROR_RATE")
+    mock_llm_timeout_rate: float = Field(default=0.0, env="MOCK_LLM_TIMEOUT_RATE")
+    mock_llm_timeout_sec: float = Field(default=60.0, env="MOCK_LLM_TIMEOUT_SEC")
+    mock_llm_seed: Optional[int] = Field(default=None, env="MOCK_LLM_SEED")
+    
+    # Diagnosis single-flight
+    diagnosis_singleflight_enabled: bool = Field(default=True, env="DIAGNOSIS_SINGLEFLIGHT_ENABLED")
+    diagnosis_singleflight_redis_enabled: bool = Field(default=False, env="DIAGNOSIS_SINGLEFLIGHT_REDIS_ENABLED")
+    diagnosis_singleflight_lock_ttl_sec: float = Field(default=120.0, env="DIAGNOSIS_SINGLEFLIGHT_LOCK_TTL_SEC")
+    diagnosis_singleflight_result_ttl_sec: int = Field(default=30, env="DIAGNOSIS_SINGLEFLIGHT_RESULT_TTL_SEC")
+    
+    # Diagnosis pipeline stage timeouts
+    diagnosis_search_timeout_sec: float = Field(default=10.0, env="DIAGNOSIS_SEARCH_TIMEOUT_SEC")
+    diagnosis_triplets_timeout_sec: float = Field(default=5.0, env="DIAGNOSIS_TRIPLETS_TIMEOUT_SEC")
+    diagnosis_llm_timeout_sec: float = Field(default=120.0, env="DIAGNOSIS_LLM_TIMEOUT_SEC")
+    
+    # Task result store
+    result_store_backend: str = Field(default="redis", env="RESULT_STORE_BACKEND")  # redis, memory
+    result_store_ttl_sec: int = Field(default=86400, env="RESULT_STORE_TTL_SEC")
+    result_store_max_entries: int = Field(default=10000, env="RESULT_STORE_MAX_ENTRIES")
+    result_store_compress_min_bytes: int = Field(default=4096, env="RESULT_STORE_COMPRESS_MIN_BYTES")
+    
+    # Progress events
+    progress_broker_backend: str = Field(default="redis", env="PROGRESS_BROKER_BACKEND")  # redis, memory
+    progress_heartbeat_sec: float = Field(default=15.0, env="PROGRESS_HEARTBEAT_SEC")
+    progress_subscriber_queue_size: int = Field(default=32, env="PROGRESS_SUBSCRIBER_QUEUE_SIZE")
+    progress_snapshot_ttl_sec: int = Field(default=3600, env="PROGRESS_SNAPSHOT_TTL_SEC")
+    
+    # Document extraction
+    extraction_chunk_bytes: int = Field(default=65536, env="EXTRACTION_CHUNK_BYTES")
+    extraction_max_text_chars: int = Field(default=100000, env="EXTRACTION_MAX_TEXT_CHARS")
+    extraction_process_workers: int = Field(default=0, env="EXTRACTION_PROCESS_WORKERS")  # 0 = one per core, 1 = in the task's process
+    extraction_pages_per_task: int = Field(default=16, env="EXTRACTION_PAGES_PER_TASK")
+    
     # Storage
     storage_provider: str = Field(default="local", env="STORAGE_PROVIDER")
     storage_path: str = Field(default="./storage", env="STORAGE_PATH")
@@ -35,6 +129,13 @@ class Settings(BaseSettings):
     aws_secret_access_key: Optional[str] = Field(default=None, env="AWS_SECRET_ACCESS_KEY")
     aws_bucket_name: Optional[str] = Field(default=None, env="AWS_BUCKET_NAME")
     aws_region: str = Field(default="us-east-1", env="AWS_REGION")
+    s3_endpoint_url: Optional[str] = Field(default=None, env="S3_ENDPOINT_URL")  # MinIO or another S3-compatible server
+    s3_pool_size: int = Field(default=64, env="S3_POOL_SIZE")
+    s3_keepalive_sec: float = Field(default=30.0, env="S3_KEEPALIVE_SEC")
+    s3_timeout_sec: float = Field(default=300.0, env="S3_TIMEOUT_SEC")
+    s3_max_retries: int = Field(default=3, env="S3_MAX_RETRIES")
+    s3_part_bytes: int = Field(default=8388608, env="S3_PART_BYTES")
+    s3_transfer_concurrency: int = Field(default=8, env="S3_TRANSFER_CONCURRENCY")
     
     # FAISS & Data Paths
     faiss_index_path: str = Field(default="../medrag_outputs/faiss_index.bin", env="FAISS_INDEX_PATH")
@@ -47,9 +148,17 @@ class Settings(BaseSettings):
     
     # API Configuration
     max_file_size_mb: int = Field(default=200, env="MAX_FILE_SIZE_MB")
+    upload_chunk_bytes: int = Field(default=1048576, env="UPLOAD_CHUNK_BYTES")
+    upload_session_chunk_bytes: int = Field(default=8388608, env="UPLOAD_SESSION_CHUNK_BYTES")
+    upload_session_ttl_sec: int = Field(default=86400, env="UPLOAD_SESSION_TTL_SEC")
+    download_chunk_bytes: int = Field(default=1048576, env="DOWNLOAD_CHUNK_BYTES")
+    file_url_ttl_sec: int = Field(default=3600, env="FILE_URL_TTL_SEC")
     allowed_file_types: str = Field(default="pdf,docx,json,dicom,txt", env="ALLOWED_FILE_TYPES")
     cors_origins: str = Field(default="http://localhost:3000,http://localhost:8080", env="CORS_ORIGINS")
     
+    diagnosis_batch_max_items: int = Field(default=500, env="DIAGNOSIS_BATCH_MAX_ITEMS")
+    diagnosis_batch_llm_concurrency: int = Field(default=8, env="DIAGNOSIS_BATCH_LLM_CONCURRENCY")
+    
     # Rate Limiting
     rate_limit_per_minute: int = Field(default=60, env="RATE_LIMIT_PER_MINUTE")
     
@@ -0,0 +1,175 @@
+import os
+import asyncio
+import threading
+import concurrent.futures
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from loguru import logger
+
+class AsyncRuntime:
+    """One long-lived event loop per process, run on a background thread.
+    
+    Celery tasks are synchronous, so each task used to create (and leak) its
+    own loop, which also threw away every loop-bound resource such as pooled
+    HTTP sessions and Redis clients. The runtime keeps a single loop alive for
+    the life of the worker process; tasks submit coroutines to it and block on
+    the result. Running the loop on its own thread keeps this safe for thread
+    pools and for eager tasks invoked from inside another running loop.
+    """
+    
+    def __init__(self, name: str = "async-runtime"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._shutdown_hooks: List[Callable[[], Awaitable[Any]]] = []
+    
+    @property
+    def running(self) -> bool:
+        return (
+            self._loop is not None
+            and self._pid == os.getpid()
+            and self._thread is not None
+            and self._thread.is_alive()
+        )
+    
+    def start(self):
+        """Start the loop thread; idempotent, and restarts after a fork"""
+        with self._lock:
+            if self.running:
+                return
+            
+            if self._pid is not None and self._pid != os.getpid():
+                # Inherited across fork: the parent's loop thread does not
+                # exist here, so abandon its loop without touching it
+                logger.debug(f"Discarding {self.name} loop inherited from pid {self._pid}")
+            
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+            
+            self._loop = loop
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=run_loop, name=self.name, daemon=True)
+            self._thread.start()
+            ready.wait()
+            logger.info(f"Started {self.name} event loop in pid {self._pid}")
+    
+    def add_shutdown_hook(self, hook: Callable[[], Awaitable[Any]]):
+        """Register a coroutine function to await on the loop before it stops"""
+        self._shutdown_hooks.append(hook)
+    
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the shared loop and wait for its result"""
+        if not self.running:
+            self.start()
+        
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise asyncio.TimeoutError(f"Coroutine did not finish within {timeout}s") from None
+        except BaseException:
+            # e.g. Celery's soft time limit interrupting the waiting thread
+            future.cancel()
+            raise
+    
+    def shutdown(self, timeout: float = 10.0):
+        """Run shutdown hooks, cancel leftover tasks, and close the loop"""
+        with self._lock:
+            if not self.running:
+                return
+            loop = self._loop
+        
+        async def drain():
+            for hook in self._shutdown_hooks:
+                try:
+                    await hook()
+                except Exception as e:
+                    logger.warning(f"{self.name} shutdown hook failed: {e}")
+            
+            pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            await loop.shutdown_asyncgens()
+        
+        try:
+            asyncio.run_coroutine_threadsafe(drain(), loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"{self.name} did not drain cleanly: {e}")
+        
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout)
+        loop.close()
+        
+        with self._lock:
+            self._loop = None
+            self._thread = None
+            self._pid = None
+        logger.info(f"Stopped {self.name} event loop")
+
+class LoopLocalSessions:
+    """One HTTP client session per event loop.
+    
+    aiohttp sessions are bound to the loop that created them, and a process
+    can run several loops at once (the API loop next to an AsyncRuntime
+    loop). Each loop gets its own pooled session rather than one replacing,
+    and leaking, another; ``close()`` closes every session on its own loop.
+    """
+    
+    def __init__(self, factory: Callable[[], Any], name: str = "http"):
+        self.factory = factory
+        self.name = name
+        self._sessions: Dict[asyncio.AbstractEventLoop, Any] = {}
+        self._lock = threading.Lock()
+    
+    def get(self) -> Any:
+        """Return the running loop's session, creating it on first use"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._sessions.get(loop)
+            if session is not None and not session.closed:
+                return session
+            
+            # Sessions of loops closed without closing them cannot be closed
+            # any more; only drop the references
+            for stale in [stale for stale in self._sessions if stale.is_closed()]:
+                logger.debug(f"Dropping {self.name} session of a closed event loop")
+                del self._sessions[stale]
+            
+            session = self._sessions[loop] = self.factory()
+            return session
+    
+    def peek(self) -> Optional[Any]:
+        """The running loop's session, if it has one"""
+        with self._lock:
+            return self._sessions.get(asyncio.get_running_loop())
+    
+    async def close(self, timeout: float = 5.0):
+        """Close every session, each on the loop it belongs to"""
+        current = asyncio.get_running_loop()
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        
+        for loop, session in sessions.items():
+            if session.closed:
+                continue
+            if loop is current:
+                await session.close()
+            elif loop.is_running():
+                future = asyncio.run_coroutine_threadsafe(session.close(), loop)
+                try:
+                    await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+                except Exception as e:
+                    logger.warning(f"Failed to close {self.name} session on another event loop: {e}")
+            else:
+                logger.warning(f"Cannot close {self.name} session of a stopped event loop")
+
+# Global runtime shared by the Celery tasks of this process
+worker_runtime = AsyncRuntime("celery-async-runtime")
@@ -0,0 +1,584 @@
+import os
+import re
+import json
+import codecs
+import zipfile
+import threading
+import multiprocessing
+import xml.etree.ElementTree as ET
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Any, Callable, IO, Iterator, List, Optional, Tuple
+from loguru import logger
+from app.config import settings
+
+SYMPTOM_TERMS = (
+    "abdominal pain", "back pain", "chest pain", "chest tightness", "chills", "confusion",
+    "constipation", "cough", "diarrhea", "dizziness", "fatigue", "fever", "headache",
+    "heartburn", "hemoptysis", "insomnia", "jaundice", "joint pain", "loss of appetite",
+    "malaise", "muscle pain", "nausea", "numbness", "palpitations", "rash", "runny nose",
+    "seizure", "shortness of breath", "sore throat", "sweating", "swelling", "syncope",
+    "vomiting", "weakness", "weight loss", "wheezing", "blurred vision", "dysuria"
+)
+
+MEDICATION_TERMS = (
+    "acetaminophen", "albuterol", "amlodipine", "amoxicillin", "aspirin", "atorvastatin",
+    "azithromycin", "ceftriaxone", "clopidogrel", "diclofenac", "furosemide", "gabapentin",
+    "heparin", "hydrochlorothiazide", "ibuprofen", "insulin", "levothyroxine", "lisinopril",
+    "losartan", "metformin", "metoprolol", "morphine", "naproxen", "nitroglycerin",
+    "omeprazole", "pantoprazole", "paracetamol", "prednisone", "salbutamol", "sertraline",
+    "simvastatin", "warfarin"
+)
+
+# Common drug-class stems, for medications missing from the term list
+MEDICATION_SUFFIXES = (
+    "pril", "olol", "sartan", "statin", "cillin", "mycin", "floxacin", "prazole",
+    "dipine", "formin", "gliptin", "azepam", "oxetine", "tidine"
+)
+
+def _term_pattern(terms) -> "re.Pattern":
+    # Longest first so "chest pain" wins over "pain"-style overlaps
+    alternatives = "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternatives})\b", re.IGNORECASE)
+
+_SYMPTOM_PATTERN = _term_pattern(SYMPTOM_TERMS)
+_MEDICATION_PATTERN = _term_pattern(MEDICATION_TERMS)
+_MEDICATION_SUFFIX_PATTERN = re.compile(rf"\b[a-z]{{3,}}(?:{'|'.join(MEDICATION_SUFFIXES)})\b", re.IGNORECASE)
+
+def find_symptoms(text: str) -> List[str]:
+    return [match.group(0).lower() for match in _SYMPTOM_PATTERN.finditer(text)]
+
+def find_medications(text: str) -> List[str]:
+    found = [match.group(0) for match in _MEDICATION_PATTERN.finditer(text)]
+    found.extend(match.group(0) for match in _MEDICATION_SUFFIX_PATTERN.finditer(text))
+    return [name.capitalize() for name in found]
+
+class ExtractionError(Exception):
+    """Raised when a document cannot be extracted"""
+    pass
+
+@dataclass
+class ExtractedPage:
+    """One unit of extracted content: a PDF page or a chunk of a stream.
+    
+    ``progress`` is the fraction of the whole document consumed once this
+    page has been read, so callers can report real progress even when the
+    page count is unknown up front.
+    """
+    number: int
+    text: str
+    progress: float
+    total_pages: Optional[int] = None
+    symptoms: List[str] = field(default_factory=list)
+    medications: List[str] = field(default_factory=list)
+
+class DocumentExtractor(ABC):
+    """Streams a document as pages without reading it into memory whole"""
+    
+    extensions: Tuple[str, ...] = ()
+    content_type: str = "medical_report"
+    
+    def __init__(self, chunk_size: int = settings.extraction_chunk_bytes):
+        self.chunk_size = chunk_size
+    
+    @abstractmethod
+    def iter_pages(self, path: str) -> Iterator[ExtractedPage]:
+        pass
+
+class PageRangeExtractor(DocumentExtractor):
+    """Extractor whose pages can be read independently, so page ranges of one
+    document can be extracted in parallel and merged in order"""
+    
+    @abstractmethod
+    def page_count(self, path: str) -> int:
+        pass
+    
+    @abstractmethod
+    def iter_page_range(self, path: str, start: int, stop: int) -> Iterator[ExtractedPage]:
+        """Yield pages ``start`` (inclusive) to ``stop`` (exclusive), zero-based"""
+        pass
+    
+    def iter_pages(self, path: str) -> Iterator[ExtractedPage]:
+        return self.iter_page_range(path, 0, self.page_count(path))
+
+_TEXT_BOUNDARY = re.compile(rb"[ \n]")
+
+class TextExtractor(PageRangeExtractor):
+    """Plain text, read in fixed-size chunks that end on a line or word boundary.
+    
+    Page ``n`` is nominally bytes ``n * chunk_size`` onwards; a range starts
+    after the first space or newline at its nominal offset, so neighbouring
+    ranges meet at the same boundary and never split a word or character.
+    """
+    
+    extensions = (".txt",)
+    
+    def page_count(self, path: str) -> int:
+        return max(1, -(-os.path.getsize(path) // self.chunk_size))
+    
+    @staticmethod
+    def _boundary(f: IO[bytes], offset: int, size: int) -> int:
+        if offset <= 0:
+            return 0
+        if offset >= size:
+            return size
+        
+        f.seek(offset - 1)
+        while True:
+            block = f.read(4096)
+            if not block:
+                return size
+            match = _TEXT_BOUNDARY.search(block)
+            if match:
+                return f.tell() - len(block) + match.end()
+    
+    def iter_page_range(self, path: str, start: int, stop: int) -> Iterator[ExtractedPage]:
+        size = os.path.getsize(path)
+        total_pages = self.page_count(path)
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        carry = ""
+        number = start
+        
+        with open(path, "rb") as f:
+            begin = self._boundary(f, start * self.chunk_size, size)
+            end = self._boundary(f, stop * self.chunk_size, size)
+            f.seek(begin)
+            
+            while True:
+                block = f.read(min(self.chunk_size, end - f.tell()))
+                final = f.tell() >= end
+                text = carry + decoder.decode(block, final=final)
+                carry = ""
+                
+                if not final:
+                    # Hold back a trailing partial line or word so terms are
+                    # not split across pages
+                    cut = max(text.rfind("\n"), text.rfind(" "))
+                    if cut >= 0:
+                        text, carry = text[:cut + 1], text[cut + 1:]
+                
+                if text:
+                    number += 1
+                    yield ExtractedPage(number, text, f.tell() / size, total_pages)
+                if final:
+                    return
+
+class _CountingReader:
+    """File wrapper that counts bytes read, to derive progress from position"""
+    
+    def __init__(self, raw: IO[bytes]):
+        self.raw = raw
+        self.bytes_read = 0
+    
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        self.bytes_read += len(data)
+        return data
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+class DocxExtractor(DocumentExtractor):
+    """Word documents, parsed incrementally from ``word/document.xml``.
+    
+    DOCX has no stored page layout, so a page ends at an explicit page break
+    or once ``chunk_size`` characters have accumulated.
+    """
+    
+    extensions = (".docx",)
+    
+    def iter_pages(self, path: str) -> Iterator[ExtractedPage]:
+        try:
+            archive = zipfile.ZipFile(path)
+        except zipfile.BadZipFile as e:
+            raise ExtractionError(f"Not a valid DOCX file: {e}")
+        
+        with archive:
+            try:
+                info = archive.getinfo("word/document.xml")
+            except KeyError:
+                raise ExtractionError("DOCX file has no word/document.xml")
+            
+            total_bytes = info.file_size or 1
+            with archive.open(info) as raw:
+                reader = _CountingReader(raw)
+                paragraphs: List[str] = []
+                length = 0
+                number = 0
+                root = None
+                page_break = False
+                
+                for event, element in ET.iterparse(reader, events=("start", "end")):
+                    if root is None:
+                        root = element
+                    if event == "start":
+                        continue
+                    
+                    if element.tag == _W + "br" and element.get(_W + "type") == "page":
+                        page_break = True
+                    elif element.tag == _W + "p":
+                        text = "".join(node.text or "" for node in element.iter(_W + "t"))
+                        if text:
+                            paragraphs.append(text)
+                            length += len(text)
+                        # Drop parsed paragraphs so memory stays flat
+                        root.clear()
+                        
+                        if paragraphs and (page_break or length >= self.chunk_size):
+                            number += 1
+                            yield ExtractedPage(number, "\n".join(paragraphs), reader.bytes_read / total_bytes)
+                            paragraphs, length = [], 0
+                        page_break = False
+                
+                if paragraphs or number == 0:
+                    yield ExtractedPage(number + 1, "\n".join(paragraphs), 1.0)
+
+class _JsonStream:
+    """Incremental reader for the members of a top-level JSON array or object"""
+    
+    def __init__(self, f: IO[str], chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+    
+    def _fill(self) -> bool:
+        # Grow reads with the pending value so a large member is re-decoded
+        # a logarithmic number of times rather than once per chunk
+        data = self.f.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+    
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+    
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise ExtractionError(f"Malformed JSON: expected one of {chars!r}, found {char!r}")
+        self.pos += 1
+        return char
+    
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise ExtractionError("Malformed JSON: unexpected end of file")
+            # A number that ends exactly at the buffer edge may continue
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+    
+    def members(self) -> Iterator[Tuple[Optional[str], Any]]:
+        opening = self.peek()
+        if opening not in ("[", "{"):
+            yield None, self.value()
+            return
+        
+        self.expect(opening)
+        closing = "]" if opening == "[" else "}"
+        if self.peek() == closing:
+            self.pos += 1
+            return
+        
+        while True:
+            key = None
+            if opening == "{":
+                key = self.value()
+                self.expect(":")
+            yield key, self.value()
+            if self.expect("," + closing) == closing:
+                return
+
+def _flatten_json(value: Any, key: Optional[str], lines: List[str], fields: Dict[str, List[str]]):
+    if isinstance(value, dict):
+        for child_key, child in value.items():
+            _flatten_json(child, child_key, lines, fields)
+    elif isinstance(value, list):
+        if key in fields and all(isinstance(item, str) for item in value):
+            fields[key].extend(value)
+        for item in value:
+            _flatten_json(item, key, lines, fields)
+    elif isinstance(value, str):
+        lines.append(f"{key}: {value}" if key else value)
+
+class JsonExtractor(DocumentExtractor):
+    """Structured records, decoded one top-level member at a time.
+    
+    Memory is bounded by the largest single member rather than the file.
+    ``symptoms`` and ``medications`` lists anywhere in a member are taken as
+    given; all string values are also scanned as text.
+    """
+    
+    extensions = (".json",)
+    content_type = "structured_data"
+    
+    def iter_pages(self, path: str) -> Iterator[ExtractedPage]:
+        size = os.path.getsize(path) or 1
+        
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            stream = _JsonStream(f, self.chunk_size)
+            for number, (key, value) in enumerate(stream.members(), 1):
+                lines: List[str] = []
+                fields: Dict[str, List[str]] = {"symptoms": [], "medications": []}
+                _flatten_json(value, key, lines, fields)
+                
+                yield ExtractedPage(
+                    number,
+                    "\n".join(lines),
+                    min(1.0, f.buffer.tell() / size),
+                    symptoms=[symptom.lower() for symptom in fields["symptoms"]],
+                    medications=fields["medications"]
+                )
+
+class PdfExtractor(PageRangeExtractor):
+    """PDF text, one page at a time; needs the optional ``pypdf`` package"""
+    
+    extensions = (".pdf",)
+    
+    @staticmethod
+    def _reader(f: IO[bytes]):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise ExtractionError("PDF extraction requires the pypdf package")
+        # pypdf resolves objects from the open file on demand
+        return PdfReader(f)
+    
+    def page_count(self, path: str) -> int:
+        with open(path, "rb") as f:
+            return len(self._reader(f).pages)
+    
+    def iter_page_range(self, path: str, start: int, stop: int) -> Iterator[ExtractedPage]:
+        with open(path, "rb") as f:
+            reader = self._reader(f)
+            total_pages = len(reader.pages)
+            for index in range(start, min(stop, total_pages)):
+                text = reader.pages[index].extract_text() or ""
+                yield ExtractedPage(index + 1, text, (index + 1) / total_pages, total_pages)
+
+_extractors: Dict[str, DocumentExtractor] = {}
+
+def register_extractor(extractor: DocumentExtractor):
+    """Register an extractor for each of its file extensions"""
+    for extension in extractor.extensions:
+        _extractors[extension.lower()] = extractor
+
+def get_extractor(path: str) -> DocumentExtractor:
+    extension = Path(path).suffix.lower()
+    extractor = _extractors.get(extension)
+    if extractor is None:
+        raise ExtractionError(f"No extractor registered for '{extension or path}' files")
+    return extractor
+
+for _extractor in (TextExtractor(), DocxExtractor(), JsonExtractor(), PdfExtractor()):
+    register_extractor(_extractor)
+
+class _ExtractionSummary:
+    """Running totals for a document or page range, mergeable in page order"""
+    
+    def __init__(self, max_text_chars: int):
+        self.max_text_chars = max_text_chars
+        self.text_parts: List[str] = []
+        self.text_chars = 0
+        self.characters = 0
+        self.pages = 0
+        # Dicts keep first-seen order while de-duplicating
+        self.symptoms: Dict[str, None] = {}
+        self.medications: Dict[str, None] = {}
+    
+    def _keep_text(self, text: str):
+        if self.text_chars < self.max_text_chars and text:
+            kept = text[:self.max_text_chars - self.text_chars]
+            self.text_parts.append(kept)
+            self.text_chars += len(kept)
+    
+    def add(self, page: ExtractedPage):
+        self.pages += 1
+        self.characters += len(page.text)
+        for symptom in page.symptoms + find_symptoms(page.text):
+            self.symptoms.setdefault(symptom, None)
+        for medication in page.medications + find_medications(page.text):
+            self.medications.setdefault(medication, None)
+        self._keep_text(page.text)
+    
+    def merge(self, other: "_ExtractionSummary"):
+        """Append the summary of the pages that follow this one"""
+        self.pages += other.pages
+        self.characters += other.characters
+        for symptom in other.symptoms:
+            self.symptoms.setdefault(symptom, None)
+        for medication in other.medications:
+            self.medications.setdefault(medication, None)
+        for part in other.text_parts:
+            self._keep_text(part)
+    
+    def result(self, content_type: str) -> Dict[str, Any]:
+        return {
+            "type": content_type,
+            "text": "\n".join(self.text_parts),
+            "symptoms": list(self.symptoms),
+            "medications": list(self.medications),
+            "pages": self.pages,
+            "characters": self.characters,
+            "truncated": self.characters > self.text_chars
+        }
+
+def _extract_page_range(path: str, start: int, stop: int, max_text_chars: int) -> _ExtractionSummary:
+    """Process pool entry point: summarize one page range of a document"""
+    summary = _ExtractionSummary(max_text_chars)
+    for page in get_extractor(path).iter_page_range(path, start, stop):
+        summary.add(page)
+    return summary
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+_sequential_warned = False
+
+SEQUENTIAL_EXTRACTION_WARNING = (
+    "Extraction runs sequentially: daemonic processes such as Celery prefork "
+    "children cannot start the extraction process pool. Run the extraction "
+    "queue with --pool threads to extract page ranges in parallel"
+)
+
+def parallel_extraction_available() -> bool:
+    """Whether this process can start the extraction process pool"""
+    return not multiprocessing.current_process().daemon
+
+def get_extraction_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    """Return the shared extraction process pool, or None where one cannot run.
+    
+    Daemonic processes, such as Celery prefork children, may not start child
+    processes; extraction falls back to the calling process there, with a
+    warning the first time, so run the extraction queue with
+    ``--pool threads`` to use the process pool.
+    """
+    global _pool, _pool_workers, _sequential_warned
+    
+    if not parallel_extraction_available():
+        if not _sequential_warned:
+            _sequential_warned = True
+            logger.warning(SEQUENTIAL_EXTRACTION_WARNING)
+        return None
+    
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # Spawn rather than fork: the parent runs threads (event loops,
+            # Redis listeners) that a forked child would inherit mid-state
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+            logger.info(f"Started extraction process pool with {workers} workers")
+        return _pool
+
+def shutdown_extraction_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+            logger.info("Stopped extraction process pool")
+
+def page_ranges(total_pages: int, pages_per_task: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + pages_per_task, total_pages)) for start in range(0, total_pages, pages_per_task)]
+
+def _extract_in_parallel(
+    pool: ProcessPoolExecutor,
+    path: str,
+    ranges: List[Tuple[int, int]],
+    total_pages: int,
+    summary: _ExtractionSummary,
+    on_progress: Optional[Callable[[int, Optional[int], float], None]]
+):
+    futures = {
+        pool.submit(_extract_page_range, path, start, stop, summary.max_text_chars): index
+        for index, (start, stop) in enumerate(ranges)
+    }
+    finished: Dict[int, _ExtractionSummary] = {}
+    next_index = 0
+    pages_done = 0
+    
+    try:
+        for future in as_completed(futures):
+            index = futures[future]
+            finished[index] = future.result()
+            start, stop = ranges[index]
+            pages_done += stop - start
+            
+            # Merge as soon as the next range in page order is available so
+            # only out-of-order results are held
+            while next_index in finished:
+                summary.merge(finished.pop(next_index))
+                next_index += 1
+            
+            if on_progress:
+                on_progress(pages_done, total_pages, pages_done / total_pages)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+def extract_document(
+    path: str,
+    on_progress: Optional[Callable[[int, Optional[int], float], None]] = None,
+    max_text_chars: int = settings.extraction_max_text_chars,
+    workers: int = settings.extraction_process_workers,
+    pages_per_task: int = settings.extraction_pages_per_task
+) -> Dict[str, Any]:
+    """Stream a document through its extractor and summarize the content.
+    
+    Documents with independently readable pages are split into ranges of
+    ``pages_per_task`` pages that run on the extraction process pool and are
+    merged back in order. ``on_progress(pages_done, total_pages, fraction)``
+    is called as pages (or, in parallel, whole ranges) complete. Symptoms and
+    medications are collected from every page, but only the first
+    ``max_text_chars`` characters of text are kept in the result.
+    """
+    if not os.path.exists(path):
+        raise ExtractionError(f"File not found: {path}")
+    
+    extractor = get_extractor(path)
+    summary = _ExtractionSummary(max_text_chars)
+    workers = workers or os.cpu_count() or 1
+    
+    pool = None
+    total_pages = 0
+    ranges: List[Tuple[int, int]] = []
+    if isinstance(extractor, PageRangeExtractor) and workers > 1:
+        total_pages = extractor.page_count(path)
+        ranges = page_ranges(total_pages, pages_per_task)
+        if len(ranges) > 1:
+            pool = get_extraction_pool(workers)
+    
+    if pool is not None:
+        _extract_in_parallel(pool, path, ranges, total_pages, summary, on_progress)
+    else:
+        for page in extractor.iter_pages(path):
+            summary.add(page)
+            if on_progress:
+                on_progress(summary.pages, page.total_pages, page.progress)
+    
+    mode = f"{len(ranges)} ranges on {workers} processes" if pool is not None else "in process"
+    logger.info(f"Extracted {summary.pages} pages ({summary.characters} characters) from {Path(path).name}, {mode}")
+    
+    return summary.result(extractor.content_type)
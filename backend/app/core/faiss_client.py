@@ -1,11 +1,13 @@
 import os
 import json
+import asyncio
 import numpy as np
 import faiss
 from typing import List, Dict, Tuple, Optional
 from loguru import logger
 from sentence_transformers import SentenceTransformer
 from app.config import settings
+from app.utils.prometheus_metrics import track_faiss_search
 
 class FAISSClient:
     def __init__(self):
@@ -77,12 +79,56 @@ class FAISSClient:
             return np.random.rand(384).astype(np.float32)
         
         try:
-            embedding = self.embedding_model.encode([query_text])
+            embedding = await asyncio.to_thread(self.embedding_model.encode, [query_text])
             return self._normalize_embedding(embedding[0].astype(np.float32))
         except Exception as e:
             logger.error(f"Failed to generate embedding: {e}")
             return None
     
+    async def generate_query_embeddings(self, query_texts: List[str]) -> Optional[np.ndarray]:
+        """Generate normalized embeddings for many queries in one model call"""
+        if not self.embedding_model:
+            logger.warning("Embedding model not available, using mock embeddings")
+            return np.random.rand(len(query_texts), 384).astype(np.float32)
+        
+        try:
+            embeddings = await asyncio.to_thread(self.embedding_model.encode, query_texts, batch_size=64)
+            embeddings = embeddings.astype(np.float32)
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            return embeddings / norms
+        except Exception as e:
+            logger.error(f"Failed to generate batch embeddings: {e}")
+            return None
+    
+    def _format_results(self, distances: np.ndarray, indices: np.ndarray, top_k: int) -> List[Dict]:
+        results = []
+        for i, (distance, idx) in enumerate(zip(distances[:top_k], indices[:top_k])):
+            if idx == -1:  # Invalid index
+                continue
+            
+            # Get case metadata
+            case_id = str(idx)
+            case_info = self.case_metadata.get(case_id, {}) if self.case_metadata else {}
+            
+            result = {
+                "case_id": case_id,
+                "similarity": float(1 - distance),  # Convert distance to similarity
+                "distance": float(distance),
+                "rank": i + 1,
+                "diagnosis": case_info.get("diagnosis", "Unknown"),
+                "symptoms": case_info.get("symptoms", []),
+                "summary": case_info.get("summary", "No summary available"),
+                "outcome": case_info.get("outcome", "Unknown")
+            }
+            results.append(result)
+        return results
+    
+    @track_faiss_search
+    async def _search_index(self, query_vectors: np.ndarray, top_k: int):
+        # Search off the event loop so other pipeline stages keep running
+        return await asyncio.to_thread(self.index.search, np.ascontiguousarray(query_vectors), top_k)
+    
     async def search(self, query_text: str, top_k: int = 5) -> List[Dict]:
         """Search for similar cases using FAISS"""
         if not self._initialized:
@@ -92,38 +138,26 @@ class FAISSClient:
             logger.error("FAISS index not available")
             return []
         
+        # Generate query embedding
+        query_embedding = await self.generate_query_embedding(query_text)
+        return await self.search_by_embedding(query_embedding, top_k)
+    
+    async def search_by_embedding(self, query_embedding: Optional[np.ndarray], top_k: int = 5) -> List[Dict]:
+        """Search for similar cases given an already computed query embedding"""
+        if not self.index:
+            logger.error("FAISS index not available")
+            return []
+        
+        if query_embedding is None:
+            return []
+        
         try:
-            # Generate query embedding
-            query_embedding = await self.generate_query_embedding(query_text)
-            if query_embedding is None:
-                return []
-            
             # Reshape for FAISS search
             query_vector = query_embedding.reshape(1, -1)
             
-            # Search
-            distances, indices = self.index.search(query_vector, top_k)
+            distances, indices = await self._search_index(query_vector, top_k)
             
-            results = []
-            for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-                if idx == -1:  # Invalid index
-                    continue
-                
-                # Get case metadata
-                case_id = str(idx)
-                case_info = self.case_metadata.get(case_id, {}) if self.case_metadata else {}
-                
-                result = {
-                    "case_id": case_id,
-                    "similarity": float(1 - distance),  # Convert distance to similarity
-                    "distance": float(distance),
-                    "rank": i + 1,
-                    "diagnosis": case_info.get("diagnosis", "Unknown"),
-                    "symptoms": case_info.get("symptoms", []),
-                    "summary": case_info.get("summary", "No summary available"),
-                    "outcome": case_info.get("outcome", "Unknown")
-                }
-                results.append(result)
+            results = self._format_results(distances[0], indices[0], top_k)
             
             logger.info(f"Found {len(results)} similar cases for query")
             return results
@@ -132,6 +166,38 @@ class FAISSClient:
             logger.error(f"FAISS search failed: {e}")
             return []
     
+    async def search_batch(self, query_texts: List[str], top_ks: List[int]) -> List[List[Dict]]:
+        """Search many queries with one embedding pass and one FAISS call"""
+        if not query_texts:
+            return []
+        
+        if not self._initialized:
+            await self.initialize()
+        
+        if not self.index:
+            logger.error("FAISS index not available")
+            return [[] for _ in query_texts]
+        
+        try:
+            query_vectors = await self.generate_query_embeddings(query_texts)
+            if query_vectors is None:
+                return [[] for _ in query_texts]
+            
+            # Search once at the largest k and trim each row to its own k
+            distances, indices = await self._search_index(query_vectors, max(top_ks))
+            
+            results = [
+                self._format_results(distances[row], indices[row], top_k)
+                for row, top_k in enumerate(top_ks)
+            ]
+            
+            logger.info(f"Batch searched {len(query_texts)} queries")
+            return results
+            
+        except Exception as e:
+            logger.error(f"FAISS batch search failed: {e}")
+            return [[] for _ in query_texts]
+    
     async def get_case_details(self, case_id: str) -> Optional[Dict]:
         """Get detailed information for a specific case"""
         if not self.case_metadata:
@@ -1,5 +1,6 @@
 import os
 import json
+import asyncio
 import pickle
 import networkx as nx
 from typing import List, Dict, Tuple, Optional, Set
@@ -95,42 +96,63 @@ class KnowledgeGraphClient:
             logger.error(f"Failed to get subgraph: {e}")
             return {"nodes": [], "edges": []}
     
+    def _match_symptom(self, symptom: str) -> Dict[int, float]:
+        """Score every triplet against one lowercased symptom"""
+        scores = {}
+        for position, triplet in enumerate(self.triplets):
+            score = 0
+            # Check if the symptom matches subject or object
+            if symptom in triplet.get("subject", "").lower() or symptom in triplet.get("object", "").lower():
+                score += 1
+            if symptom in triplet.get("predicate", "").lower():
+                score += 0.5
+            if score > 0:
+                scores[position] = score
+        return scores
+    
+    def _rank_triplets(self, symptoms: List[str], matches: Dict[str, Dict[int, float]], top_k: int) -> List[Dict]:
+        totals: Dict[int, float] = {}
+        for symptom in symptoms:
+            for position, score in matches[symptom.lower()].items():
+                totals[position] = totals.get(position, 0) + score
+        
+        # Sort by relevance (ties in file order) and return top_k
+        ranked = sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        
+        relevant_triplets = []
+        for position, relevance_score in ranked:
+            triplet_with_score = self.triplets[position].copy()
+            triplet_with_score["relevance_score"] = relevance_score
+            relevant_triplets.append(triplet_with_score)
+        return relevant_triplets
+    
     async def get_top_triplets_for_patient(self, symptoms: List[str], top_k: int = 10) -> List[Dict]:
         """Get relevant triplets for patient symptoms"""
+        results = await self.get_top_triplets_for_patients([symptoms], top_k=top_k)
+        return results[0]
+    
+    async def get_top_triplets_for_patients(self, symptom_lists: List[List[str]], top_k: int = 10) -> List[List[Dict]]:
+        """Get relevant triplets for many patients, scanning the triplets once per distinct symptom"""
         if not self.triplets:
-            return []
+            return [[] for _ in symptom_lists]
         
-        try:
-            relevant_triplets = []
-            
-            # Convert symptoms to lowercase for matching
-            symptoms_lower = [s.lower() for s in symptoms]
-            
-            for triplet in self.triplets:
-                subject = triplet.get("subject", "").lower()
-                predicate = triplet.get("predicate", "").lower()
-                object_val = triplet.get("object", "").lower()
-                
-                # Check if any symptom matches subject or object
-                relevance_score = 0
-                for symptom in symptoms_lower:
-                    if symptom in subject or symptom in object_val:
-                        relevance_score += 1
-                    if symptom in predicate:
-                        relevance_score += 0.5
-                
-                if relevance_score > 0:
-                    triplet_with_score = triplet.copy()
-                    triplet_with_score["relevance_score"] = relevance_score
-                    relevant_triplets.append(triplet_with_score)
+        def rank_all() -> List[List[Dict]]:
+            matches: Dict[str, Dict[int, float]] = {}
+            for symptoms in symptom_lists:
+                for symptom in symptoms:
+                    symptom_lower = symptom.lower()
+                    if symptom_lower not in matches:
+                        matches[symptom_lower] = self._match_symptom(symptom_lower)
             
-            # Sort by relevance and return top_k
-            relevant_triplets.sort(key=lambda x: x["relevance_score"], reverse=True)
-            return relevant_triplets[:top_k]
+            return [self._rank_triplets(symptoms, matches, top_k) for symptoms in symptom_lists]
+        
+        try:
+            # The scan is CPU-bound; keep it off the event loop
+            return await asyncio.to_thread(rank_all)
             
         except Exception as e:
             logger.error(f"Failed to get relevant triplets: {e}")
-            return []
+            return [[] for _ in symptom_lists]
     
     async def get_disease_info(self, disease_name: str) -> Optional[Dict]:
         """Get disease information from ontology"""
@@ -0,0 +1,94 @@
+import json
+import math
+import random
+import bisect
+from abc import ABC, abstractmethod
+from typing import List, Optional, Sequence, Tuple
+from app.config import settings
+
+class LatencyProfile(ABC):
+    """Distribution the mock LLM draws response latencies from"""
+    
+    def __init__(self, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+    
+    @abstractmethod
+    def sample(self) -> float:
+        pass
+
+class FixedLatency(LatencyProfile):
+    def __init__(self, seconds: float, seed: Optional[int] = None):
+        super().__init__(seed)
+        self.seconds = seconds
+    
+    def sample(self) -> float:
+        return self.seconds
+
+class LognormalLatency(LatencyProfile):
+    """Right-skewed latency with the given median; sigma controls the tail"""
+    
+    def __init__(self, median_sec: float, sigma: float, seed: Optional[int] = None):
+        super().__init__(seed)
+        self.median_sec = median_sec
+        self.sigma = sigma
+    
+    def sample(self) -> float:
+        return self.rng.lognormvariate(math.log(self.median_sec), self.sigma)
+
+class HistogramLatency(LatencyProfile):
+    """Replays a recorded latency histogram.
+    
+    Buckets are ``(upper_bound_sec, count)`` pairs with per-bucket (not
+    cumulative) counts, e.g. taken from the differences between adjacent
+    ``medrag_llm_request_duration_seconds`` buckets. A bucket is chosen in
+    proportion to its count and a value drawn uniformly inside it; the
+    unbounded ``+Inf`` bucket is ignored.
+    """
+    
+    def __init__(self, buckets: Sequence[Tuple[float, float]], seed: Optional[int] = None):
+        super().__init__(seed)
+        # Empty buckets still mark the lower edge of the next one
+        buckets = sorted((float(bound), float(count)) for bound, count in buckets if math.isfinite(float(bound)))
+        
+        self.bounds = [bound for bound, _ in buckets]
+        self.cumulative: List[float] = []
+        total = 0.0
+        for _, count in buckets:
+            total += count
+            self.cumulative.append(total)
+        
+        if total <= 0:
+            raise ValueError("Latency histogram has no samples")
+    
+    @classmethod
+    def from_file(cls, path: str, seed: Optional[int] = None) -> "HistogramLatency":
+        """Load ``{"buckets": [[upper_bound_sec, count], ...]}`` from JSON"""
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(data["buckets"], seed=seed)
+    
+    def sample(self) -> float:
+        index = bisect.bisect_right(self.cumulative, self.rng.random() * self.cumulative[-1])
+        index = min(index, len(self.bounds) - 1)
+        lower = self.bounds[index - 1] if index > 0 else 0.0
+        return self.rng.uniform(lower, self.bounds[index])
+
+def create_latency_profile(
+    kind: str = settings.mock_llm_latency_profile,
+    latency_sec: float = settings.mock_llm_latency_sec,
+    sigma: float = settings.mock_llm_latency_sigma,
+    histogram_path: Optional[str] = settings.mock_llm_latency_histogram_path,
+    seed: Optional[int] = settings.mock_llm_seed
+) -> LatencyProfile:
+    kind = kind.lower()
+    
+    if kind == "lognormal":
+        return LognormalLatency(latency_sec, sigma, seed=seed)
+    elif kind == "histogram":
+        if not histogram_path:
+            raise ValueError("MOCK_LLM_LATENCY_HISTOGRAM_PATH is required for the histogram profile")
+        return HistogramLatency.from_file(histogram_path, seed=seed)
+    elif kind == "fixed":
+        return FixedLatency(latency_sec, seed=seed)
+    else:
+        raise ValueError(f"Unknown mock LLM latency profile: {kind}")
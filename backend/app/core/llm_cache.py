@@ -0,0 +1,286 @@
+import json
+import time
+import asyncio
+import hashlib
+import numpy as np
+import faiss
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable
+from loguru import logger
+from app.config import settings
+
+PATIENT_SECTION_HEADER = "PATIENT INFORMATION:"
+
+def make_cache_key(prompt: str, model: str, schema: Optional[Dict[str, Any]] = None) -> str:
+    """Build a stable cache key from the prompt, model and response schema"""
+    key_material = json.dumps(
+        {"prompt": prompt, "model": model, "schema": schema},
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+class LRUCacheTier:
+    """In-process LRU tier with per-entry expiry"""
+    
+    def __init__(self, max_entries: int, ttl_sec: int):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        
+        self._entries.move_to_end(key)
+        return value
+    
+    def set(self, key: str, value: Dict[str, Any]):
+        self._entries[key] = (time.monotonic() + self.ttl_sec, value)
+        self._entries.move_to_end(key)
+        
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def clear(self):
+        self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class RedisCacheTier:
+    """Shared Redis tier so cached responses survive restarts and span workers"""
+    
+    def __init__(self, redis_url: str, ttl_sec: int, prefix: str = "medrag:llm_cache:"):
+        self.redis_url = redis_url
+        self.ttl_sec = ttl_sec
+        self.prefix = prefix
+        self._client = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _get_client(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            import redis.asyncio as aioredis
+            self._client = aioredis.from_url(self.redis_url)
+            self._client_loop = loop
+        return self._client
+    
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = await self._get_client().get(self.prefix + key)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning(f"LLM cache Redis read failed: {e}")
+            return None
+    
+    async def set(self, key: str, value: Dict[str, Any]):
+        try:
+            await self._get_client().set(
+                self.prefix + key,
+                json.dumps(value, separators=(",", ":")),
+                ex=self.ttl_sec
+            )
+        except Exception as e:
+            logger.warning(f"LLM cache Redis write failed: {e}")
+    
+    async def close(self):
+        if self._client is not None and self._client_loop is asyncio.get_running_loop():
+            await self._client.close()
+        self._client = None
+        self._client_loop = None
+
+class LLMResponseCache:
+    """Two-tier exact-match cache for LLM responses.
+    
+    Entries hold the response and the latency it originally took to generate,
+    so a hit can report how much time it saved.
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = settings.llm_cache_max_entries,
+        ttl_sec: int = settings.llm_cache_ttl_sec,
+        redis_url: Optional[str] = None
+    ):
+        self.memory = LRUCacheTier(max_entries, ttl_sec)
+        self.redis = RedisCacheTier(redis_url, ttl_sec) if redis_url else None
+    
+    async def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Return (entry, tier) for a key, promoting Redis hits into memory"""
+        entry = self.memory.get(key)
+        if entry is not None:
+            return entry, "memory"
+        
+        if self.redis:
+            entry = await self.redis.get(key)
+            if entry is not None:
+                self.memory.set(key, entry)
+                return entry, "redis"
+        
+        return None, None
+    
+    async def set(self, key: str, response: Dict[str, Any], latency: float):
+        entry = {"response": response, "latency": latency}
+        self.memory.set(key, entry)
+        if self.redis:
+            await self.redis.set(key, entry)
+    
+    async def close(self):
+        if self.redis:
+            await self.redis.close()
+
+def extract_patient_summary(prompt: str) -> Optional[str]:
+    """Return the patient information section of a diagnosis prompt"""
+    start = prompt.find(PATIENT_SECTION_HEADER)
+    if start == -1:
+        return None
+    
+    section = prompt[start + len(PATIENT_SECTION_HEADER):]
+    end = section.find("\n\n")
+    if end != -1:
+        section = section[:end]
+    
+    section = section.strip()
+    return section or None
+
+async def _embed_with_faiss_client(text: str) -> Optional[np.ndarray]:
+    from app.core.faiss_client import faiss_client
+    
+    # The FAISS client falls back to random vectors without a model, which
+    # would make similarity matches meaningless
+    if not faiss_client.embedding_model:
+        return None
+    
+    return await faiss_client.generate_query_embedding(text)
+
+class SemanticLLMCache:
+    """Similarity cache over embedded patient presentations.
+    
+    Patient summaries are embedded with the case-search model and stored in a
+    small dedicated inner-product index. A lookup reuses the closest prior
+    response only when its cosine similarity clears the threshold and it was
+    produced by the same model. Every decision is appended to an audit log.
+    """
+    
+    def __init__(
+        self,
+        embed_fn: Optional[Callable[[str], Awaitable[Optional[np.ndarray]]]] = None,
+        threshold: float = settings.llm_semantic_cache_threshold,
+        max_entries: int = settings.llm_semantic_cache_max_entries,
+        ttl_sec: int = settings.llm_cache_ttl_sec,
+        audit_size: int = 1000,
+        search_k: int = 5
+    ):
+        self.embed_fn = embed_fn or _embed_with_faiss_client
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.search_k = search_k
+        self.index = None
+        self.audit_log = deque(maxlen=audit_size)
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+    
+    async def embed_prompt(self, prompt: str) -> Optional[np.ndarray]:
+        """Embed the patient summary of a prompt as a normalized row vector"""
+        summary = extract_patient_summary(prompt)
+        if not summary:
+            return None
+        
+        try:
+            embedding = await self.embed_fn(summary)
+        except Exception as e:
+            logger.warning(f"Semantic cache embedding failed: {e}")
+            return None
+        
+        if embedding is None:
+            return None
+        
+        vector = np.asarray(embedding, dtype=np.float32).reshape(1, -1).copy()
+        faiss.normalize_L2(vector)
+        return vector
+    
+    def lookup(self, embedding: np.ndarray, model: str) -> Optional[Dict[str, Any]]:
+        """Return the best reusable entry for an embedding, if any"""
+        if self.index is None or self.index.ntotal == 0:
+            self._audit("miss", None, None, model)
+            return None
+        
+        k = min(self.search_k, self.index.ntotal)
+        similarities, ids = self.index.search(embedding, k)
+        
+        best_similarity = None
+        now = time.monotonic()
+        for similarity, entry_id in zip(similarities[0], ids[0]):
+            entry_id = int(entry_id)
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                continue
+            
+            if entry["expires_at"] < now:
+                self._remove(entry_id)
+                continue
+            
+            if entry["model"] != model:
+                continue
+            
+            best_similarity = float(similarity)
+            if best_similarity >= self.threshold:
+                self._entries.move_to_end(entry_id)
+                self._audit("reuse", best_similarity, entry_id, model)
+                return entry
+            break
+        
+        self._audit("miss", best_similarity, None, model)
+        return None
+    
+    def add(self, embedding: np.ndarray, model: str, response: Dict[str, Any], latency: float):
+        """Store a response, evicting the least recently used entries past the bound"""
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(embedding.shape[1]))
+        
+        entry_id = self._next_id
+        self._next_id += 1
+        
+        self.index.add_with_ids(embedding, np.array([entry_id], dtype=np.int64))
+        self._entries[entry_id] = {
+            "response": response,
+            "latency": latency,
+            "model": model,
+            "expires_at": time.monotonic() + self.ttl_sec
+        }
+        
+        while len(self._entries) > self.max_entries:
+            oldest_id = next(iter(self._entries))
+            self._remove(oldest_id)
+    
+    def _remove(self, entry_id: int):
+        self._entries.pop(entry_id, None)
+        self.index.remove_ids(np.array([entry_id], dtype=np.int64))
+    
+    def _audit(self, decision: str, similarity: Optional[float], entry_id: Optional[int], model: str):
+        record = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "decision": decision,
+            "similarity": similarity,
+            "threshold": self.threshold,
+            "entry_id": entry_id,
+            "model": model
+        }
+        self.audit_log.append(record)
+        logger.info(f"Semantic LLM cache {decision}: similarity={similarity} threshold={self.threshold} entry={entry_id}")
+    
+    def get_audit_log(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Return the most recent reuse decisions, newest last"""
+        return list(self.audit_log)[-limit:]
+    
+    def __len__(self) -> int:
+        return len(self._entries)
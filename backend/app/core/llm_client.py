@@ -1,96 +1,223 @@
 import json
+import time
 import asyncio
-from typing import Dict, List, Optional, Any
+import aiohttp
+from collections import deque
+from contextlib import aclosing
+from typing import Dict, List, Optional, Any, AsyncIterator, Tuple
 from abc import ABC, abstractmethod
 from loguru import logger
 from app.config import settings
+from app.core.async_runtime import LoopLocalSessions
+from app.core.latency_profiles import LatencyProfile, create_latency_profile
+from app.core.llm_cache import LLMResponseCache, SemanticLLMCache, make_cache_key
+from app.core.prompt_builder import build_diagnosis_prompt
+from app.core.resilience import LLMResilienceGuard, LLMProviderError
+from app.utils.prometheus_metrics import metrics
+
+DIAGNOSIS_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "differential_diagnosis": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "condition": {"type": "string"},
+                    "confidence": {"type": "number"},
+                    "description": {"type": "string"},
+                    "icd10": {"type": "string"}
+                },
+                "required": ["condition", "confidence", "description"]
+            }
+        },
+        "recommended_actions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "text": {"type": "string"},
+                    "priority": {"type": "string"},
+                    "category": {"type": "string"}
+                },
+                "required": ["text", "priority", "category"]
+            }
+        },
+        "follow_up_questions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "text": {"type": "string"}
+                },
+                "required": ["text"]
+            }
+        }
+    },
+    "required": ["differential_diagnosis", "recommended_actions", "follow_up_questions"]
+}
+
+def is_valid_diagnosis_response(response: Any) -> bool:
+    """Check a response against the required shape of DIAGNOSIS_RESPONSE_SCHEMA"""
+    if not isinstance(response, dict):
+        return False
+    
+    for field in DIAGNOSIS_RESPONSE_SCHEMA["required"]:
+        items = response.get(field)
+        if not isinstance(items, list):
+            return False
+        
+        required = DIAGNOSIS_RESPONSE_SCHEMA["properties"][field]["items"]["required"]
+        if not all(isinstance(item, dict) and all(key in item for key in required) for item in items):
+            return False
+    
+    return bool(response["differential_diagnosis"])
+
+def diagnosis_events(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Stream events for an already complete LLM response"""
+    events = [
+        {"type": "diagnosis", "data": diagnosis}
+        for diagnosis in response.get("differential_diagnosis", [])
+    ]
+    events.append({"type": "complete", "data": response})
+    return events
+
+class IncrementalDiagnosisParser:
+    """Pull complete differential diagnosis objects out of a partial JSON stream.
+    
+    Only the ``differential_diagnosis`` array is scanned; the full text is kept
+    so the caller can parse the whole document once the stream ends.
+    """
+    
+    ARRAY_KEY = '"differential_diagnosis"'
+    
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start: Optional[int] = None
+    
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Add a chunk of text and return any diagnoses it completed"""
+        self.text += chunk
+        completed = []
+        
+        if self._done:
+            return completed
+        
+        if not self._in_array:
+            key_pos = self.text.find(self.ARRAY_KEY)
+            if key_pos == -1:
+                return completed
+            bracket_pos = self.text.find("[", key_pos + len(self.ARRAY_KEY))
+            if bracket_pos == -1:
+                return completed
+            self._in_array = True
+            self._pos = bracket_pos + 1
+        
+        while self._pos < len(self.text):
+            ch = self.text[self._pos]
+            
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._object_start = self._pos
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._object_start is not None:
+                    try:
+                        completed.append(json.loads(self.text[self._object_start:self._pos + 1]))
+                    except ValueError:
+                        logger.warning("Skipping unparseable streamed diagnosis")
+                    self._object_start = None
+            elif ch == "]" and self._depth == 0:
+                self._done = True
+                self._pos += 1
+                break
+            
+            self._pos += 1
+        
+        return completed
+
+async def iter_sse_data(stream) -> AsyncIterator[str]:
+    """Yield the data payload of each server-sent event line"""
+    async for raw_line in stream:
+        line = raw_line.decode("utf-8").strip()
+        if line.startswith("data:"):
+            yield line[len("data:"):].strip()
+
+async def guarded_stream(guard: LLMResilienceGuard, events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """Drain a provider stream under the resilience guard.
+    
+    The provider is read by its own task and its events handed over through
+    a queue, so the guard's slot and latency sample cover provider I/O only,
+    not the time the consumer spends between events. Provider errors are
+    re-raised here once the events before them have been yielded.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    finished = object()
+    
+    async def produce():
+        try:
+            async with guard.call():
+                async with aclosing(events):
+                    async for event in events:
+                        queue.put_nowait(event)
+        finally:
+            queue.put_nowait(finished)
+    
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            event = await queue.get()
+            if event is finished:
+                break
+            yield event
+        await producer
+    finally:
+        # Abandoning the stream releases the slot without a verdict
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
 
 class LLMClient(ABC):
+    provider = "unknown"
+    model = "unknown"
+    response_schema: Optional[Dict[str, Any]] = None
+    
     @abstractmethod
     async def generate_diagnosis(self, prompt: str) -> Dict[str, Any]:
         pass
-
-class PerplexityClient(LLMClient):
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.base_url = "https://api.perplexity.ai/chat/completions"
     
-    async def generate_diagnosis(self, prompt: str) -> Dict[str, Any]:
-        try:
-            import aiohttp
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": "sonar-pro",
-                "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": 1000,
-                "temperature": 0.1,
-                "response_format": {
-                    "type": "json_schema",
-                    "json_schema": {
-                        "schema": {
-                            "type": "object",
-                            "properties": {
-                                "differential_diagnosis": {
-                                    "type": "array",
-                                    "items": {
-                                        "type": "object",
-                                        "properties": {
-                                            "condition": {"type": "string"},
-                                            "confidence": {"type": "number"},
-                                            "description": {"type": "string"},
-                                            "icd10": {"type": "string"}
-                                        },
-                                        "required": ["condition", "confidence", "description"]
-                                    }
-                                },
-                                "recommended_actions": {
-                                    "type": "array",
-                                    "items": {
-                                        "type": "object",
-                                        "properties": {
-                                            "text": {"type": "string"},
-                                            "priority": {"type": "string"},
-                                            "category": {"type": "string"}
-                                        },
-                                        "required": ["text", "priority", "category"]
-                                    }
-                                },
-                                "follow_up_questions": {
-                                    "type": "array",
-                                    "items": {
-                                        "type": "object",
-                                        "properties": {
-                                            "text": {"type": "string"}
-                                        },
-                                        "required": ["text"]
-                                    }
-                                }
-                            },
-                            "required": ["differential_diagnosis", "recommended_actions", "follow_up_questions"]
-                        }
-                    }
-                }
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.base_url, headers=headers, json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        content = result["choices"][0]["message"]["content"]
-                        return json.loads(content)
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Perplexity API error {response.status}: {error_text}")
-                        return self._get_fallback_response()
+    async def stream_diagnosis(self, prompt: str) -> AsyncIterator[Dict[str, Any]]:
+        """Yield each differential diagnosis as soon as it is available, then
+        a final ``complete`` event with the full response.
         
-        except Exception as e:
-            logger.error(f"Perplexity client error: {e}")
-            return self._get_fallback_response()
+        Clients without native streaming replay their complete response.
+        """
+        response = await self.generate_diagnosis(prompt)
+        for event in diagnosis_events(response):
+            yield event
+    
+    async def close(self):
+        """Release any resources held by the client"""
+        pass
+    
+    def is_fallback_response(self, response: Dict[str, Any]) -> bool:
+        """Whether a response is a degraded fallback rather than a real answer"""
+        return bool(response.get("degraded")) or response == self._get_fallback_response()
     
     def _get_fallback_response(self) -> Dict[str, Any]:
         return {
@@ -116,11 +243,284 @@ class PerplexityClient(LLMClient):
             ]
         }
 
+class PerplexityClient(LLMClient):
+    provider = "perplexity"
+    model = "sonar-pro"
+    response_schema = DIAGNOSIS_RESPONSE_SCHEMA
+    
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://api.perplexity.ai/chat/completions",
+        guard: Optional[LLMResilienceGuard] = None
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.guard = guard or LLMResilienceGuard(self.provider)
+        self._sessions = LoopLocalSessions(self._create_session, f"{self.provider} HTTP")
+    
+    def _build_trace_config(self) -> aiohttp.TraceConfig:
+        """Trace pool acquisitions to export connection reuse and pool wait time"""
+        trace_config = aiohttp.TraceConfig()
+        
+        async def on_request_start(session, ctx, params):
+            ctx.pool_wait = 0.0
+        
+        async def on_connection_queued_start(session, ctx, params):
+            ctx.queued_at = time.perf_counter()
+        
+        async def on_connection_queued_end(session, ctx, params):
+            ctx.pool_wait += time.perf_counter() - ctx.queued_at
+        
+        async def on_connection_create_end(session, ctx, params):
+            metrics.record_llm_connection(self.provider, reused=False)
+            metrics.record_llm_pool_wait(self.provider, getattr(ctx, "pool_wait", 0.0))
+        
+        async def on_connection_reuseconn(session, ctx, params):
+            metrics.record_llm_connection(self.provider, reused=True)
+            metrics.record_llm_pool_wait(self.provider, getattr(ctx, "pool_wait", 0.0))
+        
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_queued_start.append(on_connection_queued_start)
+        trace_config.on_connection_queued_end.append(on_connection_queued_end)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+    
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=settings.llm_http_pool_size,
+            limit_per_host=settings.llm_http_pool_per_host,
+            ttl_dns_cache=settings.llm_http_dns_ttl_sec,
+            keepalive_timeout=settings.llm_http_keepalive_sec
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=settings.llm_http_timeout_sec),
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            },
+            trace_configs=[self._build_trace_config()]
+        )
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the running loop's pooled session, creating it on first use"""
+        return self._sessions.get()
+    
+    async def close(self):
+        """Close the pooled HTTP sessions of every event loop"""
+        await self._sessions.close()
+    
+    def _build_payload(self, prompt: str, stream: bool = False) -> Dict[str, Any]:
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": 1000,
+            "temperature": 0.1,
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {"schema": self.response_schema}
+            }
+        }
+        
+        if stream:
+            payload["stream"] = True
+        
+        return payload
+    
+    async def generate_diagnosis(self, prompt: str) -> Dict[str, Any]:
+        try:
+            async with self.guard.call():
+                session = self._get_session()
+                async with session.post(self.base_url, json=self._build_payload(prompt)) as response:
+                    if response.status != 200:
+                        error_text = await response.text()
+                        raise LLMProviderError(f"{self.provider} API error {response.status}: {error_text}")
+                    
+                    result = await response.json()
+                    content = result["choices"][0]["message"]["content"]
+                    return json.loads(content)
+        
+        except Exception as e:
+            logger.error(f"{self.provider} client error: {e}")
+            metrics.record_llm_fallback(self.provider)
+            return self._get_fallback_response()
+    
+    async def _provider_events(self, prompt: str) -> AsyncIterator[Dict[str, Any]]:
+        """Raw streamed completion as diagnosis events plus a final ``complete``"""
+        parser = IncrementalDiagnosisParser()
+        session = self._get_session()
+        async with session.post(self.base_url, json=self._build_payload(prompt, stream=True)) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise LLMProviderError(f"{self.provider} API error {response.status}: {error_text}")
+            
+            async for data in iter_sse_data(response.content):
+                if data == "[DONE]":
+                    break
+                
+                chunk = json.loads(data)
+                delta = chunk["choices"][0].get("delta", {}).get("content") or ""
+                for diagnosis in parser.feed(delta):
+                    yield {"type": "diagnosis", "data": diagnosis}
+        
+        yield {"type": "complete", "data": json.loads(parser.text)}
+    
+    async def stream_diagnosis(self, prompt: str) -> AsyncIterator[Dict[str, Any]]:
+        streamed: List[Dict[str, Any]] = []
+        
+        try:
+            async with aclosing(guarded_stream(self.guard, self._provider_events(prompt))) as events:
+                async for event in events:
+                    if event["type"] == "diagnosis":
+                        streamed.append(event["data"])
+                    yield event
+            return
+        
+        except Exception as e:
+            logger.error(f"{self.provider} streaming error: {e}")
+            metrics.record_llm_fallback(self.provider)
+            if not streamed:
+                for event in diagnosis_events(self._get_fallback_response()):
+                    yield event
+                return
+            # Diagnoses already sent are real; complete with those rather
+            # than an unrelated fallback, marked so it is never cached
+            final_response = {
+                "differential_diagnosis": streamed,
+                "recommended_actions": [],
+                "follow_up_questions": [],
+                "degraded": True
+            }
+        
+        yield {"type": "complete", "data": final_response}
+
+class OpenAIClient(PerplexityClient):
+    """OpenAI chat completions client; the wire format matches Perplexity's"""
+    provider = "openai"
+    model = "gpt-4o-mini"
+    
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://api.openai.com/v1/chat/completions",
+        guard: Optional[LLMResilienceGuard] = None
+    ):
+        super().__init__(api_key, base_url=base_url, guard=guard)
+    
+    def _build_payload(self, prompt: str, stream: bool = False) -> Dict[str, Any]:
+        payload = super()._build_payload(prompt, stream=stream)
+        payload["response_format"]["json_schema"]["name"] = "diagnosis"
+        return payload
+
 class MockLLMClient(LLMClient):
+    """Offline stand-in for a provider.
+    
+    Latency is drawn from a configurable profile and errors or timeouts are
+    injected at set rates, going through the same resilience guard and
+    fallback path as a real client, so the diagnosis pipeline can be
+    load-tested without an API key.
+    """
+    provider = "mock"
+    model = "mock"
+    
+    def __init__(
+        self,
+        latency: Optional[LatencyProfile] = None,
+        error_rate: float = settings.mock_llm_error_rate,
+        timeout_rate: float = settings.mock_llm_timeout_rate,
+        timeout_sec: float = settings.mock_llm_timeout_sec,
+        guard: Optional[LLMResilienceGuard] = None
+    ):
+        self.latency = latency or create_latency_profile()
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_sec = timeout_sec
+        self.guard = guard or LLMResilienceGuard(self.provider)
+    
+    def _draw_outcome(self) -> Tuple[str, float]:
+        """Pick ok/error/timeout and how long the call takes before it resolves"""
+        roll = self.latency.rng.random()
+        if roll < self.timeout_rate:
+            return "timeout", self.timeout_sec
+        if roll < self.timeout_rate + self.error_rate:
+            return "error", self.latency.sample()
+        return "ok", self.latency.sample()
+    
+    def _raise_fault(self, outcome: str):
+        if outcome == "timeout":
+            raise asyncio.TimeoutError(f"Simulated timeout after {self.timeout_sec}s")
+        raise LLMProviderError("mock API error 503: simulated provider failure")
+    
     async def generate_diagnosis(self, prompt: str) -> Dict[str, Any]:
-        # Simulate processing delay
-        await asyncio.sleep(1)
+        outcome, latency = self._draw_outcome()
+        
+        try:
+            async with self.guard.call():
+                await asyncio.sleep(latency)
+                if outcome != "ok":
+                    self._raise_fault(outcome)
+                return self._canned_response(prompt)
+        
+        except Exception as e:
+            logger.error(f"{self.provider} client error: {e}")
+            metrics.record_llm_fallback(self.provider)
+            return self._get_fallback_response()
+    
+    async def _provider_events(self, prompt: str, outcome: str, latency: float) -> AsyncIterator[Dict[str, Any]]:
+        response = self._canned_response(prompt)
+        diagnoses = response["differential_diagnosis"]
+        step = latency * 0.8 / len(diagnoses)
+        # A fault strikes after a sampled number of diagnoses, possibly none
+        fault_at = self.latency.rng.randint(0, len(diagnoses)) if outcome != "ok" else len(diagnoses)
+        
+        # Spend a fifth of the latency before the first token, then
+        # spread the rest evenly over the diagnoses
+        await asyncio.sleep(latency * 0.2)
+        for diagnosis in diagnoses[:fault_at]:
+            await asyncio.sleep(step)
+            yield {"type": "diagnosis", "data": diagnosis}
+        
+        if outcome != "ok":
+            if outcome == "timeout":
+                # The stream stalls until the timeout runs out
+                await asyncio.sleep(step * (len(diagnoses) - fault_at))
+            self._raise_fault(outcome)
+        
+        yield {"type": "complete", "data": response}
+    
+    async def stream_diagnosis(self, prompt: str) -> AsyncIterator[Dict[str, Any]]:
+        outcome, latency = self._draw_outcome()
+        streamed: List[Dict[str, Any]] = []
+        
+        try:
+            async with aclosing(guarded_stream(self.guard, self._provider_events(prompt, outcome, latency))) as events:
+                async for event in events:
+                    if event["type"] == "diagnosis":
+                        streamed.append(event["data"])
+                    yield event
+            return
         
+        except Exception as e:
+            logger.error(f"{self.provider} streaming error: {e}")
+            metrics.record_llm_fallback(self.provider)
+            if not streamed:
+                for event in diagnosis_events(self._get_fallback_response()):
+                    yield event
+                return
+            # Complete with what was already sent, as a real provider cut
+            # short would, marked so it is never cached
+            final_response = {
+                "differential_diagnosis": streamed,
+                "recommended_actions": [],
+                "follow_up_questions": [],
+                "degraded": True
+            }
+        
+        yield {"type": "complete", "data": final_response}
+    
+    def _canned_response(self, prompt: str) -> Dict[str, Any]:
         # Parse symptoms from prompt for more realistic mock responses
         symptoms_in_prompt = []
         if "chest pain" in prompt.lower():
@@ -221,18 +621,314 @@ class MockLLMClient(LLMClient):
             ]
         }
 
+class CachedLLMClient(LLMClient):
+    """Exact-match response cache in front of another LLM client.
+    
+    Keys are a hash of the prompt, model and response schema, so any change to
+    the prompt builder or provider configuration naturally misses the cache.
+    An optional semantic layer catches near-identical patient presentations.
+    """
+    
+    def __init__(
+        self,
+        client: LLMClient,
+        cache: Optional[LLMResponseCache] = None,
+        semantic_cache: Optional[SemanticLLMCache] = None
+    ):
+        self.client = client
+        self.provider = client.provider
+        self.model = client.model
+        self.response_schema = client.response_schema
+        self.cache = cache or LLMResponseCache(
+            redis_url=settings.redis_url if settings.llm_cache_redis_enabled else None
+        )
+        self.semantic_cache = semantic_cache
+        self._lookups = 0
+        self._hits = 0
+    
+    def _record_lookup(self, hit: bool):
+        self._lookups += 1
+        if hit:
+            self._hits += 1
+        metrics.update_llm_cache_hit_ratio(self._hits / self._lookups)
+    
+    async def _lookup(self, prompt: str):
+        """Return (cached response or None, exact key, prompt embedding)"""
+        key = make_cache_key(prompt, self.model, self.response_schema)
+        entry, tier = await self.cache.get(key)
+        
+        if entry is not None:
+            metrics.record_llm_cache_lookup("hit", tier=tier, latency_saved=entry.get("latency", 0.0))
+            self._record_lookup(hit=True)
+            return entry["response"], key, None
+        
+        embedding = None
+        if self.semantic_cache:
+            embedding = await self.semantic_cache.embed_prompt(prompt)
+            if embedding is not None:
+                entry = self.semantic_cache.lookup(embedding, self.model)
+                if entry is not None:
+                    metrics.record_llm_cache_lookup("hit", tier="semantic", latency_saved=entry["latency"])
+                    self._record_lookup(hit=True)
+                    return entry["response"], key, embedding
+        
+        metrics.record_llm_cache_lookup("miss")
+        self._record_lookup(hit=False)
+        return None, key, embedding
+    
+    async def _store(self, key: str, embedding, response: Dict[str, Any], latency: float):
+        # Never cache degraded answers produced while the provider was failing
+        if self.client.is_fallback_response(response):
+            return
+        
+        await self.cache.set(key, response, latency)
+        if embedding is not None:
+            self.semantic_cache.add(embedding, self.model, response, latency)
+    
+    async def generate_diagnosis(self, prompt: str, bypass_cache: bool = False) -> Dict[str, Any]:
+        if bypass_cache:
+            metrics.record_llm_cache_lookup("bypass")
+            return await self.client.generate_diagnosis(prompt)
+        
+        cached, key, embedding = await self._lookup(prompt)
+        if cached is not None:
+            return cached
+        
+        start_time = time.perf_counter()
+        response = await self.client.generate_diagnosis(prompt)
+        await self._store(key, embedding, response, time.perf_counter() - start_time)
+        
+        return response
+    
+    async def stream_diagnosis(self, prompt: str, bypass_cache: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        if bypass_cache:
+            metrics.record_llm_cache_lookup("bypass")
+            async for event in self.client.stream_diagnosis(prompt):
+                yield event
+            return
+        
+        cached, key, embedding = await self._lookup(prompt)
+        if cached is not None:
+            for event in diagnosis_events(cached):
+                yield event
+            return
+        
+        start_time = time.perf_counter()
+        async for event in self.client.stream_diagnosis(prompt):
+            if event["type"] == "complete":
+                await self._store(key, embedding, event["data"], time.perf_counter() - start_time)
+            yield event
+    
+    def is_fallback_response(self, response: Dict[str, Any]) -> bool:
+        return self.client.is_fallback_response(response)
+    
+    async def close(self):
+        await self.cache.close()
+        await self.client.close()
+
+class HedgedLLMClient(LLMClient):
+    """Race a hedge request against a slow primary.
+    
+    The hedge (same or another provider) is only sent once the primary has
+    been outstanding longer than a high percentile of its recent latencies,
+    or as soon as it comes back unusable, so it costs extra calls only on the
+    tail. The first schema-valid response wins and the other request is
+    cancelled. Streams are hedged on the time to their first event, tracked
+    separately, and then stay with whichever stream produced it.
+    """
+    
+    def __init__(
+        self,
+        primary: LLMClient,
+        hedge: Optional[LLMClient] = None,
+        percentile: float = settings.llm_hedge_percentile,
+        default_delay_sec: float = settings.llm_hedge_delay_sec,
+        default_stream_delay_sec: float = settings.llm_hedge_stream_delay_sec,
+        min_samples: int = 20,
+        window: int = 500
+    ):
+        self.primary = primary
+        self.hedge = hedge or primary
+        self.provider = primary.provider
+        self.model = primary.model
+        self.response_schema = primary.response_schema
+        self.percentile = percentile
+        self.default_delay_sec = default_delay_sec
+        self.default_stream_delay_sec = default_stream_delay_sec
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._first_event_latencies = deque(maxlen=window)
+        self._calls = 0
+        self._hedged = 0
+    
+    def _latency_percentile(self, percentile: float, samples: Optional[deque] = None) -> Optional[float]:
+        samples = self._latencies if samples is None else samples
+        if len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+    
+    def hedge_delay(self) -> float:
+        """How long to wait on the primary before hedging"""
+        threshold = self._latency_percentile(self.percentile)
+        return threshold if threshold is not None else self.default_delay_sec
+    
+    def stream_hedge_delay(self) -> float:
+        """How long to wait for the primary stream's first event before hedging"""
+        threshold = self._latency_percentile(self.percentile, self._first_event_latencies)
+        return threshold if threshold is not None else self.default_stream_delay_sec
+    
+    def _is_usable(self, client: LLMClient, task: asyncio.Task) -> bool:
+        if task.cancelled() or task.exception() is not None:
+            return False
+        response = task.result()
+        return is_valid_diagnosis_response(response) and not client.is_fallback_response(response)
+    
+    def _is_usable_event(self, client: LLMClient, task: asyncio.Task) -> bool:
+        if task.cancelled() or task.exception() is not None:
+            return False
+        event = task.result()
+        if event["type"] == "complete":
+            return is_valid_diagnosis_response(event["data"]) and not client.is_fallback_response(event["data"])
+        # Failed streams open with the fallback's diagnoses
+        return event["data"] not in client._get_fallback_response()["differential_diagnosis"]
+    
+    async def generate_diagnosis(self, prompt: str) -> Dict[str, Any]:
+        self._calls += 1
+        start_time = time.perf_counter()
+        primary_task = asyncio.create_task(self.primary.generate_diagnosis(prompt))
+        owners = {primary_task: self.primary}
+        pending = {primary_task}
+        hedge_task = None
+        
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_delay())
+            if primary_task in done and self._is_usable(self.primary, primary_task):
+                self._latencies.append(time.perf_counter() - start_time)
+                metrics.record_llm_hedge(self.provider, "not_hedged", self._hedged / self._calls)
+                return primary_task.result()
+            
+            # Either slow or back early with nothing usable (a fallback from
+            # an open circuit, say); in both cases ask the hedge now
+            self._hedged += 1
+            hedge_task = asyncio.create_task(self.hedge.generate_diagnosis(prompt))
+            owners[hedge_task] = self.hedge
+            pending.add(hedge_task)
+            
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                
+                for task in done:
+                    if not self._is_usable(owners[task], task):
+                        continue
+                    
+                    winner = "primary" if task is primary_task else "hedge"
+                    saved = 0.0
+                    if winner == "primary":
+                        self._latencies.append(time.perf_counter() - start_time)
+                    else:
+                        # The primary was cancelled, so estimate what it would
+                        # have cost from its tail latency
+                        tail = self._latency_percentile(99) or self.default_delay_sec
+                        saved = max(0.0, tail - (time.perf_counter() - start_time))
+                    
+                    metrics.record_llm_hedge(self.provider, f"{winner}_won", self._hedged / self._calls, saved)
+                    return task.result()
+        finally:
+            if hedge_task is not None and primary_task in pending:
+                # Censored sample: the primary would have taken at least this
+                # long, and dropping it would shrink the hedge delay over time
+                self._latencies.append(time.perf_counter() - start_time)
+            for task in pending:
+                task.cancel()
+        
+        metrics.record_llm_hedge(self.provider, "both_failed", self._hedged / self._calls)
+        
+        # Neither produced a usable answer; surface the primary's outcome
+        if not primary_task.cancelled() and primary_task.exception() is None:
+            return primary_task.result()
+        return hedge_task.result()
+    
+    async def stream_diagnosis(self, prompt: str) -> AsyncIterator[Dict[str, Any]]:
+        self._calls += 1
+        start_time = time.perf_counter()
+        streams: Dict[asyncio.Task, Tuple[LLMClient, AsyncIterator[Dict[str, Any]]]] = {}
+        
+        def start(client: LLMClient) -> asyncio.Task:
+            stream = client.stream_diagnosis(prompt)
+            task = asyncio.create_task(stream.__anext__())
+            streams[task] = (client, stream)
+            return task
+        
+        primary_task = start(self.primary)
+        pending = {primary_task}
+        hedge_task = None
+        winner = None
+        
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.stream_hedge_delay())
+            if primary_task in done and self._is_usable_event(self.primary, primary_task):
+                winner = primary_task
+                self._first_event_latencies.append(time.perf_counter() - start_time)
+                metrics.record_llm_hedge(self.provider, "not_hedged", self._hedged / self._calls)
+            else:
+                self._hedged += 1
+                hedge_task = start(self.hedge)
+                pending.add(hedge_task)
+            
+            while winner is None and pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if self._is_usable_event(streams[task][0], task)), None)
+                if winner is primary_task:
+                    self._first_event_latencies.append(time.perf_counter() - start_time)
+                if winner is not None:
+                    label = "primary" if winner is primary_task else "hedge"
+                    metrics.record_llm_hedge(self.provider, f"{label}_won", self._hedged / self._calls)
+            
+            if winner is None:
+                metrics.record_llm_hedge(self.provider, "both_failed", self._hedged / self._calls)
+                # Neither opened usably; replay the primary's own (fallback) stream
+                winner = primary_task if primary_task.exception() is None else hedge_task
+        finally:
+            if hedge_task is not None and primary_task in pending:
+                self._first_event_latencies.append(time.perf_counter() - start_time)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task, (_, stream) in streams.items():
+                if task is not winner:
+                    await stream.aclose()
+        
+        _, stream = streams[winner]
+        async with aclosing(stream):
+            try:
+                first = winner.result()
+            except StopAsyncIteration:
+                return
+            yield first
+            async for event in stream:
+                yield event
+    
+    def is_fallback_response(self, response: Dict[str, Any]) -> bool:
+        return self.primary.is_fallback_response(response) or self.hedge.is_fallback_response(response)
+    
+    async def close(self):
+        await self.primary.close()
+        if self.hedge is not self.primary:
+            await self.hedge.close()
+
 class LLMClientFactory:
     @staticmethod
-    def create_client() -> LLMClient:
-        provider = settings.llm_provider.lower()
+    def create_provider_client(provider: str) -> LLMClient:
+        provider = provider.lower()
         
         if provider == "perplexity" and settings.perplexity_api_key:
             logger.info("Using Perplexity LLM client")
             return PerplexityClient(settings.perplexity_api_key)
         elif provider == "openai" and settings.openai_api_key:
-            # TODO: Implement OpenAI client
-            logger.warning("OpenAI client not implemented, falling back to mock")
-            return MockLLMClient()
+            logger.info("Using OpenAI LLM client")
+            return OpenAIClient(settings.openai_api_key)
         elif provider == "hf" and settings.hf_api_token:
             # TODO: Implement Hugging Face client
             logger.warning("Hugging Face client not implemented, falling back to mock")
@@ -240,58 +936,36 @@ class LLMClientFactory:
         else:
             logger.info("Using mock LLM client")
             return MockLLMClient()
-
-def build_diagnosis_prompt(
-    patient_data: Dict[str, Any],
-    similar_cases: List[Dict],
-    kg_triplets: List[Dict]
-) -> str:
-    """Build structured prompt for LLM diagnosis"""
-    
-    # Extract patient information
-    complaints = patient_data.get("complaints", [])
-    symptoms = patient_data.get("symptoms", [])
-    vitals = patient_data.get("vitals", {})
-    history = patient_data.get("history", {})
-    
-    prompt = f"""You are an expert medical AI assistant. Analyze the following patient case and provide a differential diagnosis.
-
-PATIENT INFORMATION:
-Complaints: {', '.join(complaints)}
-Symptoms: {', '.join(symptoms)}
-"""
-    
-    if vitals:
-        prompt += f"Vitals: {json.dumps(vitals, indent=2)}\n"
-    
-    if history:
-        prompt += f"Medical History: {json.dumps(history, indent=2)}\n"
-    
-    if similar_cases:
-        prompt += "\nSIMILAR CASES FROM DATABASE:\n"
-        for i, case in enumerate(similar_cases[:3], 1):
-            prompt += f"{i}. Case {case.get('case_id', 'Unknown')}: {case.get('diagnosis', 'Unknown')} (Similarity: {case.get('similarity', 0):.1f}%)\n"
-            prompt += f"   Symptoms: {', '.join(case.get('symptoms', []))}\n"
-            prompt += f"   Outcome: {case.get('outcome', 'Unknown')}\n"
-    
-    if kg_triplets:
-        prompt += "\nRELEVANT MEDICAL KNOWLEDGE:\n"
-        for triplet in kg_triplets[:5]:
-            subject = triplet.get("subject", "")
-            predicate = triplet.get("predicate", "")
-            obj = triplet.get("object", "")
-            prompt += f"- {subject} {predicate} {obj}\n"
-    
-    prompt += """
-INSTRUCTIONS:
-1. Provide a differential diagnosis with the top 5 most likely conditions
-2. For each condition, include: name, confidence score (0-100), description, and ICD-10 code if known
-3. Recommend specific diagnostic actions (labs, imaging, etc.) with priority levels
-4. Suggest 3 follow-up questions to gather more information
-5. Return response in the specified JSON format only.
-"""
-    
-    return prompt
+    
+    @staticmethod
+    def create_client() -> LLMClient:
+        client = LLMClientFactory.create_provider_client(settings.llm_provider)
+        
+        if settings.llm_hedge_enabled:
+            hedge_provider = settings.llm_hedge_provider or settings.llm_provider
+            hedge = client
+            if hedge_provider.lower() != settings.llm_provider.lower():
+                hedge = LLMClientFactory.create_provider_client(hedge_provider)
+            
+            logger.info(f"Hedging {client.provider} LLM requests with {hedge.provider}")
+            return HedgedLLMClient(client, hedge)
+        
+        return client
+    
+    @staticmethod
+    def create_cached_client() -> LLMClient:
+        client = LLMClientFactory.create_client()
+        
+        if settings.llm_cache_enabled:
+            semantic_cache = None
+            if settings.llm_semantic_cache_enabled:
+                logger.info(f"Semantic LLM cache enabled (threshold {settings.llm_semantic_cache_threshold})")
+                semantic_cache = SemanticLLMCache()
+            
+            logger.info("LLM response cache enabled")
+            return CachedLLMClient(client, semantic_cache=semantic_cache)
+        
+        return client
 
 # Global LLM client instance
-llm_client = LLMClientFactory.create_client()
\ No newline at end of file
+llm_client = LLMClientFactory.create_cached_client()
\ No newline at end of file
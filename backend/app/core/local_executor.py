@@ -0,0 +1,128 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, List, Optional
+from loguru import logger
+from app.config import settings
+from app.core.async_runtime import AsyncRuntime
+
+EXECUTION_MODES = ("celery", "inprocess-async", "inprocess-threadpool")
+
+class ExecutorSaturatedError(Exception):
+    """Raised when the local executor already holds its maximum backlog"""
+    pass
+
+class LocalExecutor:
+    """Bounded in-process executor for work that would otherwise go to Celery.
+    
+    ``inprocess-async`` runs jobs as tasks on the caller's event loop, at most
+    ``max_workers`` at a time. ``inprocess-threadpool`` hands each job to a
+    pool of ``max_workers`` threads, each driving its jobs on its own
+    long-lived event loop, so CPU-heavy steps of different jobs run side by
+    side and off the API loop. Either way no more than ``max_pending`` jobs
+    (running plus queued) are accepted.
+    """
+    
+    def __init__(
+        self,
+        mode: str = settings.execution_mode,
+        max_workers: int = settings.local_executor_max_workers,
+        max_pending: int = settings.local_executor_max_pending
+    ):
+        if mode not in EXECUTION_MODES[1:]:
+            raise ValueError(f"Unsupported local execution mode: {mode}")
+        
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._runtimes: List[AsyncRuntime] = []
+        self._thread_state = threading.local()
+    
+    @property
+    def pending(self) -> int:
+        return self._pending
+    
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+            self._semaphore_loop = loop
+        return self._semaphore
+    
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="local-executor")
+        return self._pool
+    
+    def _thread_runtime(self) -> AsyncRuntime:
+        """The calling pool thread's own runtime, created on its first job"""
+        runtime = getattr(self._thread_state, "runtime", None)
+        if runtime is None:
+            runtime = AsyncRuntime(f"{threading.current_thread().name}-loop")
+            with self._lock:
+                self._runtimes.append(runtime)
+            self._thread_state.runtime = runtime
+        return runtime
+    
+    def _run_in_thread(self, job: Callable[[], Awaitable[Any]]) -> Any:
+        return self._thread_runtime().run(job())
+    
+    def _release(self, _future: Any = None):
+        with self._lock:
+            self._pending -= 1
+    
+    async def _run_async(self, job: Callable[[], Awaitable[Any]]) -> Any:
+        async with self._get_semaphore():
+            return await job()
+    
+    def submit(self, job: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """Schedule ``job()`` and return a future for its result.
+        
+        Must be called from a running event loop. The job keeps running if
+        the caller stops waiting on the future.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise ExecutorSaturatedError(f"Local executor backlog is full ({self.max_pending} jobs)")
+            self._pending += 1
+        
+        try:
+            if self.mode == "inprocess-async":
+                future = asyncio.ensure_future(self._run_async(job))
+            else:
+                pool = self._get_pool()
+                future = asyncio.get_running_loop().run_in_executor(pool, self._run_in_thread, job)
+        except BaseException:
+            self._release()
+            raise
+        
+        future.add_done_callback(self._release)
+        # Failures are reported through the result store; avoid "exception
+        # was never retrieved" noise for jobs nobody awaited
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return future
+    
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            with self._lock:
+                runtimes, self._runtimes = self._runtimes, []
+            for runtime in runtimes:
+                runtime.shutdown()
+            self._pool = None
+            self._thread_state = threading.local()
+            logger.info("Stopped local executor thread pool")
+
+_local_executor: Optional[LocalExecutor] = None
+
+def get_local_executor() -> LocalExecutor:
+    """Return the process-wide executor for the configured in-process mode"""
+    global _local_executor
+    if _local_executor is None:
+        _local_executor = LocalExecutor()
+    return _local_executor
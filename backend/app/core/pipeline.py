@@ -0,0 +1,128 @@
+import time
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+from loguru import logger
+from app.utils.prometheus_metrics import metrics
+
+_NO_FALLBACK = object()
+
+# Monotonic deadline of the innermost stage with a timeout, so calls inside
+# a stage (such as queueing for an LLM slot) can size their own waits to it
+_stage_deadline: ContextVar[Optional[float]] = ContextVar("stage_deadline", default=None)
+
+def remaining_deadline() -> Optional[float]:
+    """Seconds left before the enclosing stage times out, or None without a deadline"""
+    deadline = _stage_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+@contextmanager
+def deadline_scope(timeout_sec: float):
+    """Set a deadline for the code inside, never extending an enclosing one"""
+    deadline = time.monotonic() + timeout_sec
+    enclosing = _stage_deadline.get()
+    token = _stage_deadline.set(deadline if enclosing is None else min(deadline, enclosing))
+    try:
+        yield
+    finally:
+        _stage_deadline.reset(token)
+
+@dataclass
+class Stage:
+    """One step of a pipeline.
+    
+    ``run`` receives the results of the stages listed in ``depends_on`` as a
+    dict. If the stage fails or exceeds ``timeout_sec`` and a ``fallback`` is
+    given, the fallback value is used in its place and the pipeline carries
+    on with a partial result; without one the failure propagates.
+    """
+    name: str
+    run: Callable[[Dict[str, Any]], Awaitable[Any]]
+    depends_on: Sequence[str] = ()
+    timeout_sec: Optional[float] = None
+    fallback: Any = _NO_FALLBACK
+
+@dataclass
+class PipelineResult:
+    results: Dict[str, Any] = field(default_factory=dict)
+    degraded: List[str] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+class StagePipeline:
+    """Runs stages as a DAG, each one as soon as its dependencies finish.
+    
+    Independent stages therefore overlap, so end-to-end latency follows the
+    critical path rather than the sum of all stages.
+    """
+    
+    def __init__(self, stages: Sequence[Stage], name: str = "pipeline"):
+        self.name = name
+        self.stages = {stage.name: stage for stage in stages}
+        self._validate()
+    
+    def _validate(self):
+        visiting, done = set(), set()
+        
+        def visit(name: str):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle in {self.name} at stage '{name}'")
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}' in {self.name}")
+            visiting.add(name)
+            for dependency in self.stages[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+        
+        for name in self.stages:
+            visit(name)
+    
+    async def _run_stage(self, stage: Stage, tasks: Dict[str, asyncio.Task], outcome: PipelineResult) -> Any:
+        inputs = {}
+        for dependency in stage.depends_on:
+            inputs[dependency] = await tasks[dependency]
+        
+        # Spans cover the stage itself, not the time spent waiting on inputs
+        start_time = time.perf_counter()
+        try:
+            if stage.timeout_sec is None:
+                return await stage.run(inputs)
+            with deadline_scope(stage.timeout_sec):
+                return await asyncio.wait_for(stage.run(inputs), stage.timeout_sec)
+        except Exception as e:
+            if stage.fallback is _NO_FALLBACK:
+                raise
+            
+            reason = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            logger.warning(f"{self.name} stage '{stage.name}' failed ({reason}: {e}), continuing with fallback")
+            metrics.record_pipeline_stage_fallback(self.name, stage.name, reason)
+            outcome.degraded.append(stage.name)
+            return stage.fallback() if callable(stage.fallback) else stage.fallback
+        finally:
+            duration = time.perf_counter() - start_time
+            outcome.timings[stage.name] = duration
+            metrics.record_pipeline_stage(self.name, stage.name, duration)
+    
+    async def run(self) -> PipelineResult:
+        outcome = PipelineResult()
+        tasks: Dict[str, asyncio.Task] = {}
+        
+        # Stages await their dependencies' tasks, so creating them all up
+        # front is enough to get DAG ordering
+        for stage in self.stages.values():
+            tasks[stage.name] = asyncio.ensure_future(self._run_stage(stage, tasks, outcome))
+        
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        
+        outcome.results = {name: task.result() for name, task in tasks.items()}
+        return outcome
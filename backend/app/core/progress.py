@@ -0,0 +1,267 @@
+import json
+import time
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, Optional, Set, Tuple
+from loguru import logger
+from app.config import settings
+from app.utils.prometheus_metrics import metrics
+
+TERMINAL_STATUSES = ("completed", "error")
+
+def is_terminal(event: Dict[str, Any]) -> bool:
+    return event.get("status") in TERMINAL_STATUSES
+
+class ProgressSubscription:
+    """A subscriber's bounded view of one progress channel.
+    
+    Events are cumulative snapshots (progress, message and any partial
+    results so far), so a newer event supersedes every older one. When a slow
+    client lets the queue fill up the oldest event is dropped instead of
+    blocking the publisher or growing without bound.
+    """
+    
+    def __init__(self, key: str, max_queue: int = settings.progress_subscriber_queue_size):
+        self.key = key
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+    
+    def _offer(self, event: Dict[str, Any]):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            metrics.record_progress_event_dropped()
+        self.queue.put_nowait(event)
+    
+    def deliver(self, event: Dict[str, Any]):
+        """Queue an event from any thread"""
+        try:
+            self.loop.call_soon_threadsafe(self._offer, event)
+        except RuntimeError:
+            # The subscriber's loop has already closed
+            pass
+    
+    async def next(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Wait for the next event, or return None after ``timeout`` seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+class ProgressBroker(ABC):
+    """Publishes task progress and fans it out to local subscribers.
+    
+    Publishing is synchronous so Celery tasks can call it next to
+    ``update_state``. The latest event per key is kept as a snapshot, so a
+    client that subscribes mid-task starts from the current state.
+    """
+    
+    def __init__(self, max_queue: int = settings.progress_subscriber_queue_size):
+        self.max_queue = max_queue
+        self._subscribers: Dict[str, Set[ProgressSubscription]] = {}
+        self._lock = threading.Lock()
+    
+    @abstractmethod
+    def publish(self, key: str, event: Dict[str, Any]):
+        pass
+    
+    @abstractmethod
+    def latest(self, key: str) -> Optional[Dict[str, Any]]:
+        """The last event published for a key; may block, so async code runs it in a thread"""
+        pass
+    
+    async def _ensure_listening(self):
+        """Hook for brokers that receive events from other processes"""
+        pass
+    
+    def _dispatch(self, key: str, event: Dict[str, Any]):
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+    
+    @asynccontextmanager
+    async def subscribe(self, key: str) -> AsyncIterator[ProgressSubscription]:
+        await self._ensure_listening()
+        
+        subscription = ProgressSubscription(key, self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(subscription)
+        
+        try:
+            # Registering before reading the snapshot means nothing published
+            # in between is missed; at worst one snapshot arrives twice
+            snapshot = await asyncio.to_thread(self.latest, key)
+            if snapshot is not None:
+                subscription._offer(snapshot)
+            yield subscription
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(key)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[key]
+    
+    def subscriber_count(self, key: str) -> int:
+        with self._lock:
+            return len(self._subscribers.get(key, ()))
+    
+    async def close(self):
+        pass
+
+class InMemoryProgressBroker(ProgressBroker):
+    """Process-local broker for tests and single-process development"""
+    
+    def __init__(
+        self,
+        max_queue: int = settings.progress_subscriber_queue_size,
+        snapshot_ttl_sec: int = settings.progress_snapshot_ttl_sec
+    ):
+        super().__init__(max_queue)
+        self.snapshot_ttl_sec = snapshot_ttl_sec
+        self._snapshots: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+    
+    def publish(self, key: str, event: Dict[str, Any]):
+        with self._lock:
+            now = time.monotonic()
+            self._snapshots[key] = (now + self.snapshot_ttl_sec, event)
+            # Expire old snapshots as new ones arrive so the map stays bounded
+            for stale in [k for k, (expires_at, _) in self._snapshots.items() if expires_at < now]:
+                del self._snapshots[stale]
+        self._dispatch(key, event)
+    
+    def latest(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._snapshots.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+class RedisProgressBroker(ProgressBroker):
+    """Redis pub/sub broker connecting Celery workers to API processes.
+    
+    Each API process holds a single pattern subscription and fans events out
+    to its own subscribers, so the Redis connection count does not grow with
+    the number of connected clients. Publishing from an event loop (local
+    execution modes, or a worker's runtime) hands the Redis round trip to a
+    single background thread, which keeps events in publish order.
+    """
+    
+    def __init__(
+        self,
+        redis_url: str,
+        max_queue: int = settings.progress_subscriber_queue_size,
+        snapshot_ttl_sec: int = settings.progress_snapshot_ttl_sec,
+        prefix: str = "medrag:progress:",
+        socket_timeout_sec: float = settings.redis_socket_timeout_sec
+    ):
+        super().__init__(max_queue)
+        self.redis_url = redis_url
+        self.snapshot_ttl_sec = snapshot_ttl_sec
+        self.prefix = prefix
+        self.socket_timeout_sec = socket_timeout_sec
+        self._client = None
+        self._publisher: Optional[ThreadPoolExecutor] = None
+        self._listener: Optional[asyncio.Task] = None
+    
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import redis
+                    # Publishing can happen on an event loop in local
+                    # execution modes, so no call may wait indefinitely
+                    self._client = redis.Redis.from_url(
+                        self.redis_url,
+                        socket_timeout=self.socket_timeout_sec,
+                        socket_connect_timeout=self.socket_timeout_sec
+                    )
+        return self._client
+    
+    def _get_publisher(self) -> ThreadPoolExecutor:
+        if self._publisher is None:
+            with self._lock:
+                if self._publisher is None:
+                    self._publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="progress-publish")
+        return self._publisher
+    
+    def publish(self, key: str, event: Dict[str, Any]):
+        data = json.dumps(event, separators=(",", ":"), default=str)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._send(key, data)
+        else:
+            self._get_publisher().submit(self._send, key, data)
+    
+    def _send(self, key: str, data: str):
+        try:
+            pipe = self._get_client().pipeline(transaction=False)
+            pipe.set(f"{self.prefix}snapshot:{key}", data, ex=self.snapshot_ttl_sec)
+            pipe.publish(f"{self.prefix}channel:{key}", data)
+            pipe.execute()
+        except Exception as e:
+            # Progress is advisory; the task result is still stored
+            logger.warning(f"Failed to publish progress for {key}: {e}")
+    
+    def latest(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self._get_client().get(f"{self.prefix}snapshot:{key}")
+        return json.loads(raw) if raw else None
+    
+    async def _ensure_listening(self):
+        loop = asyncio.get_running_loop()
+        if self._listener is not None and not self._listener.done() and self._listener.get_loop() is loop:
+            return
+        self._listener = loop.create_task(self._listen())
+    
+    async def _listen(self):
+        import redis.asyncio as aioredis
+        channel_prefix = f"{self.prefix}channel:"
+        
+        while True:
+            client = aioredis.from_url(self.redis_url)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.psubscribe(channel_prefix + "*")
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None:
+                        continue
+                    key = message["channel"].decode("utf-8")[len(channel_prefix):]
+                    self._dispatch(key, json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Progress listener lost its Redis subscription, retrying: {e}")
+                await asyncio.sleep(1.0)
+            finally:
+                await pubsub.close()
+                await client.close()
+    
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._publisher is not None:
+            # Flush events still queued for Redis
+            await asyncio.to_thread(self._publisher.shutdown)
+            self._publisher = None
+
+def create_progress_broker(backend: str = settings.progress_broker_backend) -> ProgressBroker:
+    backend = backend.lower()
+    
+    if backend == "redis":
+        return RedisProgressBroker(settings.redis_url)
+    elif backend == "memory":
+        return InMemoryProgressBroker()
+    else:
+        raise ValueError(f"Unknown progress broker backend: {backend}")
+
+# Global progress broker instance
+progress_broker = create_progress_broker()
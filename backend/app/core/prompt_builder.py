@@ -0,0 +1,230 @@
+import json
+import math
+from typing import Dict, Any, List, Optional, Tuple
+from app.config import settings
+from app.utils.prometheus_metrics import metrics
+
+PROMPT_HEADER = "You are an expert medical AI assistant. Analyze the following patient case and provide a differential diagnosis."
+
+PROMPT_INSTRUCTIONS = """INSTRUCTIONS:
+1. Provide a differential diagnosis with the top 5 most likely conditions
+2. For each condition, include: name, confidence score (0-100), description, and ICD-10 code if known
+3. Recommend specific diagnostic actions (labs, imaging, etc.) with priority levels
+4. Suggest 3 follow-up questions to gather more information
+5. Return response in the specified JSON format only.
+"""
+
+CASES_TITLE = "\nSIMILAR CASES FROM DATABASE:\n"
+
+TRIPLETS_TITLE = "\nRELEVANT MEDICAL KNOWLEDGE:\n"
+
+def estimate_tokens(text: str) -> int:
+    """Rough BPE token estimate (about four characters per token for English)"""
+    if not text:
+        return 0
+    return max(1, math.ceil(len(text) / 4))
+
+def _compact_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, (list, tuple)):
+        return "; ".join(_compact_value(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, separators=(",", ":"), default=str)
+    return str(value)
+
+def compact_fields(data: Optional[Dict[str, Any]]) -> str:
+    """Serialize a flat mapping as 'key=value, ...', dropping empty fields"""
+    if not data:
+        return ""
+    return ", ".join(
+        f"{key}={_compact_value(value)}"
+        for key, value in data.items()
+        if value is not None and value != "" and value != []
+    )
+
+def dedupe_triplets(triplets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop repeated facts, keeping the highest-scored copy of each"""
+    best: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+    for triplet in triplets:
+        key = tuple(
+            str(triplet.get(field, "")).strip().lower()
+            for field in ("subject", "predicate", "object")
+        )
+        current = best.get(key)
+        if current is None or triplet.get("relevance_score", 0) > current.get("relevance_score", 0):
+            best[key] = triplet
+    return list(best.values())
+
+def format_case(index: int, case: Dict[str, Any]) -> str:
+    return (
+        f"{index}. Case {case.get('case_id', 'Unknown')}: {case.get('diagnosis', 'Unknown')} "
+        f"(Similarity: {case.get('similarity', 0):.1f}%) | "
+        f"Symptoms: {', '.join(case.get('symptoms', []))} | "
+        f"Outcome: {case.get('outcome', 'Unknown')}\n"
+    )
+
+def format_triplet(triplet: Dict[str, Any]) -> str:
+    return f"- {triplet.get('subject', '')} {triplet.get('predicate', '')} {triplet.get('object', '')}\n"
+
+class PromptBuilder:
+    """Builds diagnosis prompts that fit a token budget.
+    
+    The patient section and instructions are always included. Similar cases
+    and knowledge-graph triplets compete for the remaining budget: each round
+    picks the candidate with the best marginal relevance per token, where
+    relevance is discounted for every item already selected about the same
+    diagnosis or subject, so the context stays varied.
+    """
+    
+    def __init__(
+        self,
+        token_budget: int = settings.llm_prompt_token_budget,
+        max_cases: int = settings.llm_prompt_max_cases,
+        max_triplets: int = settings.llm_prompt_max_triplets,
+        redundancy_penalty: float = 0.5
+    ):
+        self.token_budget = token_budget
+        self.max_cases = max_cases
+        self.max_triplets = max_triplets
+        self.redundancy_penalty = redundancy_penalty
+    
+    def _patient_section(self, patient_data: Dict[str, Any]) -> str:
+        section = (
+            "PATIENT INFORMATION:\n"
+            f"Complaints: {', '.join(patient_data.get('complaints', []))}\n"
+            f"Symptoms: {', '.join(patient_data.get('symptoms', []))}\n"
+        )
+        
+        vitals = compact_fields(patient_data.get("vitals"))
+        if vitals:
+            section += f"Vitals: {vitals}\n"
+        
+        history = compact_fields(patient_data.get("history"))
+        if history:
+            section += f"Medical History: {history}\n"
+        
+        return section
+    
+    def _candidates(self, similar_cases: List[Dict], kg_triplets: List[Dict]) -> List[Dict[str, Any]]:
+        candidates = []
+        
+        # Normalize each source to [0, 1] so case similarity and triplet
+        # relevance can be compared
+        max_similarity = max((case.get("similarity") or 0 for case in similar_cases), default=0) or 1
+        for case in similar_cases:
+            candidates.append({
+                "section": "cases",
+                "item": case,
+                "relevance": (case.get("similarity") or 0) / max_similarity,
+                "topic": str(case.get("diagnosis", "")).lower(),
+                "tokens": estimate_tokens(format_case(len(similar_cases), case))
+            })
+        
+        triplets = dedupe_triplets(kg_triplets)
+        max_relevance = max((t.get("relevance_score") or 0 for t in triplets), default=0) or 1
+        for position, triplet in enumerate(triplets):
+            # Unscored triplets keep their retrieval order
+            relevance = triplet.get("relevance_score")
+            if relevance is None:
+                relevance = max_relevance / (position + 1)
+            candidates.append({
+                "section": "triplets",
+                "item": triplet,
+                "relevance": relevance / max_relevance,
+                "topic": str(triplet.get("subject", "")).lower(),
+                "tokens": estimate_tokens(format_triplet(triplet))
+            })
+        
+        return candidates
+    
+    def _pack(self, candidates: List[Dict[str, Any]], budget: int) -> Dict[str, List[Dict]]:
+        limits = {"cases": self.max_cases, "triplets": self.max_triplets}
+        # A section's title is paid for by the first item placed in it
+        titles = {"cases": estimate_tokens(CASES_TITLE), "triplets": estimate_tokens(TRIPLETS_TITLE)}
+        selected = {"cases": [], "triplets": []}
+        topic_counts: Dict[str, int] = {}
+        remaining = list(candidates)
+        
+        while remaining and budget > 0:
+            best, best_score, best_cost = None, 0.0, 0
+            for candidate in remaining:
+                section = candidate["section"]
+                cost = candidate["tokens"] + (0 if selected[section] else titles[section])
+                if len(selected[section]) >= limits[section] or cost > budget:
+                    continue
+                
+                discount = self.redundancy_penalty ** topic_counts.get(candidate["topic"], 0)
+                score = candidate["relevance"] * discount / cost
+                if best is None or score > best_score:
+                    best, best_score, best_cost = candidate, score, cost
+            
+            if best is None:
+                break
+            
+            remaining.remove(best)
+            selected[best["section"]].append(best)
+            topic_counts[best["topic"]] = topic_counts.get(best["topic"], 0) + 1
+            budget -= best_cost
+        
+        # Present each section most relevant first
+        return {
+            section: [c["item"] for c in sorted(chosen, key=lambda c: c["relevance"], reverse=True)]
+            for section, chosen in selected.items()
+        }
+    
+    def build(
+        self,
+        patient_data: Dict[str, Any],
+        similar_cases: List[Dict],
+        kg_triplets: List[Dict]
+    ) -> Tuple[str, Dict[str, int]]:
+        """Return the prompt and its estimated token usage per section"""
+        header = PROMPT_HEADER + "\n\n"
+        patient = self._patient_section(patient_data)
+        instructions = "\n" + PROMPT_INSTRUCTIONS
+        
+        fixed_tokens = estimate_tokens(header) + estimate_tokens(patient) + estimate_tokens(instructions)
+        context_budget = self.token_budget - fixed_tokens
+        
+        packed = self._pack(self._candidates(similar_cases, kg_triplets), context_budget)
+        
+        cases_section = ""
+        if packed["cases"]:
+            cases_section = CASES_TITLE + "".join(
+                format_case(i, case) for i, case in enumerate(packed["cases"], 1)
+            )
+        
+        triplets_section = ""
+        if packed["triplets"]:
+            triplets_section = TRIPLETS_TITLE + "".join(
+                format_triplet(triplet) for triplet in packed["triplets"]
+            )
+        
+        usage = {
+            "header": estimate_tokens(header),
+            "patient": estimate_tokens(patient),
+            "cases": estimate_tokens(cases_section),
+            "triplets": estimate_tokens(triplets_section),
+            "instructions": estimate_tokens(instructions)
+        }
+        
+        metrics.record_prompt_tokens(usage, {
+            "cases": len(similar_cases) - len(packed["cases"]),
+            "triplets": len(kg_triplets) - len(packed["triplets"])
+        })
+        
+        prompt = "".join([header, patient, cases_section, triplets_section, instructions])
+        return prompt, usage
+
+# Global prompt builder instance
+prompt_builder = PromptBuilder()
+
+def build_diagnosis_prompt(
+    patient_data: Dict[str, Any],
+    similar_cases: List[Dict],
+    kg_triplets: List[Dict]
+) -> str:
+    """Build structured prompt for LLM diagnosis"""
+    prompt, _ = prompt_builder.build(patient_data, similar_cases, kg_triplets)
+    return prompt
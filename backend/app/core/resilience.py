@@ -0,0 +1,291 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Optional
+from loguru import logger
+from app.config import settings
+from app.core.pipeline import remaining_deadline
+from app.utils.prometheus_metrics import metrics
+
+class LLMUnavailableError(Exception):
+    """Raised when an LLM call is rejected before reaching the provider"""
+    reason = "unavailable"
+
+class CircuitOpenError(LLMUnavailableError):
+    reason = "circuit_open"
+
+class LLMOverloadedError(LLMUnavailableError):
+    reason = "overloaded"
+
+class LLMProviderError(Exception):
+    """Raised when the provider answers with an error status"""
+    pass
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with half-open probing.
+    
+    Shared by every loop and thread of the process, so state changes and the
+    half-open probe count are guarded by a lock.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = settings.llm_circuit_failure_threshold,
+        reset_timeout_sec: float = settings.llm_circuit_reset_sec,
+        half_open_max_calls: int = 1
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_sec = reset_timeout_sec
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+        metrics.update_llm_circuit_state(self.name, self.state)
+    
+    def _transition(self, state: str):
+        # Callers hold self._lock
+        if state != self.state:
+            logger.warning(f"LLM circuit for {self.name} {self.state} -> {state}")
+            self.state = state
+            metrics.update_llm_circuit_state(self.name, state)
+    
+    def _check_reset(self) -> bool:
+        # Callers hold self._lock
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout_sec:
+            self._transition(self.HALF_OPEN)
+            self._probes_in_flight = 0
+        return self.state == self.OPEN
+    
+    def is_open(self) -> bool:
+        """Whether calls are currently short-circuited, moving to half-open once the reset timeout passes"""
+        with self._lock:
+            return self._check_reset()
+    
+    def allow_request(self) -> bool:
+        """Reserve permission for one call"""
+        with self._lock:
+            if self._check_reset():
+                return False
+            
+            if self.state == self.HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_max_calls:
+                    return False
+                self._probes_in_flight += 1
+            
+            return True
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state == self.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                self._transition(self.CLOSED)
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._probes_in_flight = 0
+                self._opened_at = time.monotonic()
+                self._transition(self.OPEN)
+    
+    def record_abandoned(self):
+        """Release a reserved call that ended without a verdict"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+class _Waiter:
+    """A queued acquire, woken on the event loop it is waiting in"""
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+
+def _grant(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency limit driven by observed latency and errors.
+    
+    Every call that completes under the latency target grows the limit by
+    roughly one per window of calls; a slow or failed call shrinks it
+    multiplicatively. Calls beyond the limit wait in a bounded FIFO queue and
+    are rejected up front when their expected wait exceeds their deadline.
+    
+    The limiter is shared by every event loop in the process (the API loop
+    and any AsyncRuntime loops), so its counters sit behind a thread lock and
+    each waiter is woken on its own loop.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int = settings.llm_concurrency_initial,
+        min_limit: int = settings.llm_concurrency_min,
+        max_limit: int = settings.llm_concurrency_max,
+        latency_target_sec: float = settings.llm_latency_target_sec,
+        max_queue: int = settings.llm_queue_max,
+        backoff_ratio: float = 0.7
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target_sec = latency_target_sec
+        self.max_queue = max_queue
+        self.backoff_ratio = backoff_ratio
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self._waiters: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+        metrics.update_llm_concurrency(self.name, self.limit, self.in_flight, 0)
+    
+    def _publish(self):
+        metrics.update_llm_concurrency(self.name, self.limit, self.in_flight, len(self._waiters))
+    
+    def expected_wait(self, position: int) -> float:
+        """Estimate queueing delay for a caller at the given queue position"""
+        if self.latency_ewma is None:
+            return 0.0
+        return self.latency_ewma * (position + 1) / max(int(self.limit), 1)
+    
+    async def acquire(self, timeout: float):
+        with self._lock:
+            if self.in_flight < int(self.limit) and not self._waiters:
+                self.in_flight += 1
+                self._publish()
+                return
+            
+            if len(self._waiters) >= self.max_queue:
+                raise LLMOverloadedError(f"LLM queue full ({self.max_queue} waiting)")
+            
+            if self.expected_wait(len(self._waiters)) > timeout:
+                raise LLMOverloadedError("Expected LLM queue wait exceeds deadline")
+            
+            waiter = _Waiter(asyncio.get_running_loop())
+            self._waiters.append(waiter)
+            self._publish()
+        
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except BaseException as e:
+            with self._lock:
+                if waiter.granted:
+                    # The slot was handed over just as we gave up
+                    self._release_slot()
+                else:
+                    try:
+                        self._waiters.remove(waiter)
+                    except ValueError:
+                        pass
+                    self._publish()
+            
+            if isinstance(e, asyncio.TimeoutError):
+                raise LLMOverloadedError(f"Timed out after {timeout}s waiting for an LLM slot") from None
+            raise
+    
+    def _release_slot(self):
+        self.in_flight = max(0, self.in_flight - 1)
+        self._wake()
+    
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            try:
+                waiter.loop.call_soon_threadsafe(_grant, waiter.future)
+            except RuntimeError:
+                # Its loop has closed; nobody is waiting any more
+                continue
+            waiter.granted = True
+            self.in_flight += 1
+        self._publish()
+    
+    def release(self, latency: Optional[float] = None, success: Optional[bool] = None):
+        """Free a slot and adapt the limit; a None verdict leaves the limit unchanged"""
+        with self._lock:
+            if success is not None:
+                if success:
+                    self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+                
+                if not success or latency > self.latency_target_sec:
+                    self.limit = max(float(self.min_limit), self.limit * self.backoff_ratio)
+                else:
+                    self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            
+            self._release_slot()
+
+class LLMResilienceGuard:
+    """Circuit breaker plus adaptive concurrency limit around provider calls"""
+    
+    def __init__(
+        self,
+        provider: str,
+        limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        queue_timeout_sec: float = settings.llm_queue_timeout_sec
+    ):
+        self.provider = provider
+        self.limiter = limiter or AdaptiveConcurrencyLimiter(provider)
+        self.breaker = breaker or CircuitBreaker(provider)
+        self.queue_timeout_sec = queue_timeout_sec
+    
+    @asynccontextmanager
+    async def call(self, timeout: Optional[float] = None):
+        """Guard one provider call.
+        
+        ``timeout`` is the caller's remaining deadline; without one, the
+        deadline of the enclosing pipeline stage applies. Queueing never
+        waits past it, or past ``queue_timeout_sec``.
+        """
+        if self.breaker.is_open():
+            metrics.record_llm_rejection(self.provider, CircuitOpenError.reason)
+            raise CircuitOpenError(f"LLM circuit open for {self.provider}")
+        
+        if timeout is None:
+            timeout = remaining_deadline()
+        queue_timeout = self.queue_timeout_sec if timeout is None else min(self.queue_timeout_sec, timeout)
+        
+        try:
+            if queue_timeout <= 0:
+                raise LLMOverloadedError("Deadline passed before the LLM call started")
+            await self.limiter.acquire(queue_timeout)
+        except LLMOverloadedError:
+            metrics.record_llm_rejection(self.provider, LLMOverloadedError.reason)
+            raise
+        
+        if not self.breaker.allow_request():
+            self.limiter.release()
+            metrics.record_llm_rejection(self.provider, CircuitOpenError.reason)
+            raise CircuitOpenError(f"LLM circuit half-open probe in progress for {self.provider}")
+        
+        start_time = time.perf_counter()
+        try:
+            yield
+        except (asyncio.CancelledError, GeneratorExit):
+            self.breaker.record_abandoned()
+            self.limiter.release()
+            raise
+        except Exception:
+            latency = time.perf_counter() - start_time
+            self.breaker.record_failure()
+            self.limiter.release(latency, success=False)
+            metrics.record_llm_request(self.provider, latency, success=False)
+            raise
+        else:
+            latency = time.perf_counter() - start_time
+            self.breaker.record_success()
+            self.limiter.release(latency, success=True)
+            metrics.record_llm_request(self.provider, latency, success=True)
@@ -0,0 +1,176 @@
+import json
+import time
+import zlib
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from loguru import logger
+from app.config import settings
+
+# One-byte tags so readers know whether a payload was compressed
+_RAW_TAG = b"j"
+_ZLIB_TAG = b"z"
+
+def encode_result(value: Dict[str, Any], compress_min_bytes: int = settings.result_store_compress_min_bytes) -> bytes:
+    """Serialize a result as compact JSON, zlib-compressed when it is large"""
+    data = json.dumps(value, separators=(",", ":"), default=str).encode("utf-8")
+    if compress_min_bytes and len(data) >= compress_min_bytes:
+        return _ZLIB_TAG + zlib.compress(data)
+    return _RAW_TAG + data
+
+def decode_result(raw: bytes) -> Dict[str, Any]:
+    tag, data = raw[:1], raw[1:]
+    if tag == _ZLIB_TAG:
+        data = zlib.decompress(data)
+    elif tag != _RAW_TAG:
+        raise ValueError(f"Unknown result encoding tag: {tag!r}")
+    return json.loads(data)
+
+class ResultStore(ABC):
+    """Keyed store for task results shared between the API and workers.
+    
+    Every entry expires after ``ttl_sec`` so finished sessions do not
+    accumulate forever.
+    """
+    
+    def __init__(self, ttl_sec: int = settings.result_store_ttl_sec):
+        self.ttl_sec = ttl_sec
+    
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        pass
+    
+    @abstractmethod
+    def get_many(self, keys: Sequence[str]) -> List[Optional[Dict[str, Any]]]:
+        """Return the values for ``keys`` in order, None where missing"""
+        pass
+    
+    @abstractmethod
+    def set(self, key: str, value: Dict[str, Any], ttl_sec: Optional[int] = None):
+        pass
+    
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        """Remove a key, returning whether it existed"""
+        pass
+    
+    def close(self):
+        pass
+
+class InMemoryResultStore(ResultStore):
+    """Process-local store with expiry and a size bound, for tests and dev"""
+    
+    def __init__(self, ttl_sec: int = settings.result_store_ttl_sec, max_entries: int = settings.result_store_max_entries):
+        super().__init__(ttl_sec)
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _get_locked(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        
+        expires_at, raw = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        # Decode a fresh copy so callers cannot mutate the stored value
+        return decode_result(raw)
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._get_locked(key)
+    
+    def get_many(self, keys: Sequence[str]) -> List[Optional[Dict[str, Any]]]:
+        with self._lock:
+            return [self._get_locked(key) for key in keys]
+    
+    def set(self, key: str, value: Dict[str, Any], ttl_sec: Optional[int] = None):
+        raw = encode_result(value)
+        expires_at = time.monotonic() + (ttl_sec or self.ttl_sec)
+        with self._lock:
+            self._entries[key] = (expires_at, raw)
+            self._entries.move_to_end(key)
+            
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class RedisResultStore(ResultStore):
+    """Redis-backed store visible to every API and worker process.
+    
+    Calls are synchronous and bounded by ``socket_timeout_sec``; async code
+    runs them in a thread so a slow Redis never stalls an event loop.
+    """
+    
+    def __init__(
+        self,
+        redis_url: str,
+        ttl_sec: int = settings.result_store_ttl_sec,
+        prefix: str = "medrag:result:",
+        socket_timeout_sec: float = settings.redis_socket_timeout_sec
+    ):
+        super().__init__(ttl_sec)
+        self.redis_url = redis_url
+        self.prefix = prefix
+        self.socket_timeout_sec = socket_timeout_sec
+        self._client = None
+        self._lock = threading.Lock()
+    
+    def _get_client(self):
+        # The synchronous client pools connections and is thread-safe, so one
+        # instance serves Celery tasks and API handlers alike
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import redis
+                    self._client = redis.Redis.from_url(
+                        self.redis_url,
+                        socket_timeout=self.socket_timeout_sec,
+                        socket_connect_timeout=self.socket_timeout_sec
+                    )
+        return self._client
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self._get_client().get(self.prefix + key)
+        return decode_result(raw) if raw else None
+    
+    def get_many(self, keys: Sequence[str]) -> List[Optional[Dict[str, Any]]]:
+        if not keys:
+            return []
+        # MGET is a single round trip however many sessions are asked for
+        raws = self._get_client().mget([self.prefix + key for key in keys])
+        return [decode_result(raw) if raw else None for raw in raws]
+    
+    def set(self, key: str, value: Dict[str, Any], ttl_sec: Optional[int] = None):
+        self._get_client().set(self.prefix + key, encode_result(value), ex=ttl_sec or self.ttl_sec)
+    
+    def delete(self, key: str) -> bool:
+        return bool(self._get_client().delete(self.prefix + key))
+    
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+def create_result_store(backend: str = settings.result_store_backend) -> ResultStore:
+    backend = backend.lower()
+    
+    if backend == "redis":
+        return RedisResultStore(settings.redis_url)
+    elif backend == "memory":
+        logger.warning("Using in-memory result store; results are not shared between processes")
+        return InMemoryResultStore()
+    else:
+        raise ValueError(f"Unknown result store backend: {backend}")
+
+# Global result store instance
+result_store = create_result_store()
@@ -0,0 +1,334 @@
+import hmac
+import time
+import asyncio
+import hashlib
+import aiohttp
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+from yarl import URL
+from loguru import logger
+from app.config import settings
+from app.utils.prometheus_metrics import metrics
+from app.core.async_runtime import LoopLocalSessions
+
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+
+class S3Error(Exception):
+    """Error response from S3 (or a compatible server)"""
+    
+    def __init__(self, status: int, code: str, message: str = ""):
+        super().__init__(f"S3 {status} {code}: {message}".rstrip(": "))
+        self.status = status
+        self.code = code
+
+def _uri_encode(value: str, safe: str = "-_.~") -> str:
+    return quote(value, safe=safe)
+
+def canonical_query(params: Dict[str, str]) -> str:
+    return "&".join(f"{_uri_encode(name)}={_uri_encode(value)}" for name, value in sorted(params.items()))
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+
+class SigV4Signer:
+    """AWS Signature Version 4 for S3 requests and presigned URLs"""
+    
+    def __init__(self, access_key: str, secret_key: str, region: str, service: str = "s3"):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.service = service
+    
+    def _scope(self, date: str) -> str:
+        return f"{date}/{self.region}/{self.service}/aws4_request"
+    
+    def _signature(
+        self,
+        method: str,
+        path: str,
+        query: Dict[str, str],
+        headers: Dict[str, str],
+        payload_hash: str,
+        amz_date: str
+    ) -> str:
+        signed = sorted(headers)
+        canonical_request = "\n".join([
+            method,
+            path,
+            canonical_query(query),
+            "".join(f"{name}:{' '.join(headers[name].split())}\n" for name in signed),
+            ";".join(signed),
+            payload_hash
+        ])
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            self._scope(amz_date[:8]),
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()
+        ])
+        
+        key = _hmac(f"AWS4{self.secret_key}".encode("utf-8"), amz_date[:8])
+        for part in (self.region, self.service, "aws4_request"):
+            key = _hmac(key, part)
+        return hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+    
+    def sign_headers(
+        self,
+        method: str,
+        path: str,
+        query: Dict[str, str],
+        headers: Dict[str, str],
+        payload_hash: str = UNSIGNED_PAYLOAD,
+        now: Optional[datetime] = None
+    ) -> Dict[str, str]:
+        """Return ``headers`` (which must include ``host``) plus the auth headers.
+        
+        ``path`` is the URI-encoded path exactly as it will be sent.
+        """
+        amz_date = (now or datetime.now(timezone.utc)).strftime("%Y%m%dT%H%M%SZ")
+        headers = {name.lower(): str(value) for name, value in headers.items()}
+        headers["x-amz-date"] = amz_date
+        headers["x-amz-content-sha256"] = payload_hash
+        
+        signature = self._signature(method, path, query, headers, payload_hash, amz_date)
+        headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{self._scope(amz_date[:8])}, "
+            f"SignedHeaders={';'.join(sorted(headers))}, Signature={signature}"
+        )
+        return headers
+    
+    def presign(
+        self,
+        method: str,
+        host: str,
+        path: str,
+        expires_in: int,
+        query: Optional[Dict[str, str]] = None,
+        now: Optional[datetime] = None
+    ) -> Dict[str, str]:
+        """Return the query parameters that authorize ``method path`` until it expires"""
+        amz_date = (now or datetime.now(timezone.utc)).strftime("%Y%m%dT%H%M%SZ")
+        params = dict(query or {})
+        params.update({
+            "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+            "X-Amz-Credential": f"{self.access_key}/{self._scope(amz_date[:8])}",
+            "X-Amz-Date": amz_date,
+            "X-Amz-Expires": str(expires_in),
+            "X-Amz-SignedHeaders": "host"
+        })
+        params["X-Amz-Signature"] = self._signature(method, path, params, {"host": host}, UNSIGNED_PAYLOAD, amz_date)
+        return params
+
+def _xml_text(element: ET.Element, tag: str, default: str = "") -> str:
+    found = element.find(f"{{*}}{tag}")
+    return (found.text or default) if found is not None else default
+
+class S3Client:
+    """Minimal async S3 API client over one pooled HTTP session.
+    
+    Requests are signed with SigV4 and sent through a keep-alive connection
+    pool shared by every operation on an event loop, so parallel part
+    transfers reuse connections instead of paying a TLS handshake each. ``endpoint_url``
+    selects an S3-compatible server such as MinIO with path-style
+    addressing; without it, AWS virtual-hosted URLs are used.
+    """
+    
+    def __init__(
+        self,
+        bucket: str,
+        access_key: str,
+        secret_key: str,
+        region: str,
+        endpoint_url: Optional[str] = None
+    ):
+        self.bucket = bucket
+        if endpoint_url:
+            parts = urlsplit(endpoint_url)
+            self.origin = f"{parts.scheme}://{parts.netloc}"
+            self.host = parts.netloc
+            self._path_prefix = f"/{bucket}"
+        else:
+            self.host = f"{bucket}.s3.{region}.amazonaws.com"
+            self.origin = f"https://{self.host}"
+            self._path_prefix = ""
+        
+        self.signer = SigV4Signer(access_key, secret_key, region)
+        self._sessions = LoopLocalSessions(self._create_session, "S3 HTTP")
+    
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=settings.s3_pool_size,
+            limit_per_host=settings.s3_pool_size,
+            keepalive_timeout=settings.s3_keepalive_sec
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=settings.s3_timeout_sec),
+            auto_decompress=False
+        )
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the running loop's pooled session, creating it on first use"""
+        return self._sessions.get()
+    
+    async def close(self):
+        """Close the pooled HTTP session of every event loop"""
+        await self._sessions.close()
+    
+    def _path(self, key: str) -> str:
+        if not key:
+            return self._path_prefix or "/"
+        return _uri_encode(f"{self._path_prefix}/{key}", safe="/-_.~")
+    
+    def presigned_url(self, method: str, key: str, expires_in: int, query: Optional[Dict[str, str]] = None) -> str:
+        path = self._path(key)
+        params = self.signer.presign(method, self.host, path, expires_in, query)
+        return f"{self.origin}{path}?{canonical_query(params)}"
+    
+    async def request(
+        self,
+        operation: str,
+        method: str,
+        key: str = "",
+        query: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        data: Optional[bytes] = None,
+        missing_ok: bool = False
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Send a signed request and return (status, headers, body).
+        
+        Throttling, server errors and dropped connections are retried with
+        exponential backoff; the body is bytes so it can be sent again.
+        With ``missing_ok`` a 404 is returned rather than raised.
+        """
+        query = query or {}
+        path = self._path(key)
+        url = URL(f"{self.origin}{path}" + (f"?{canonical_query(query)}" if query else ""), encoded=True)
+        
+        for attempt in range(settings.s3_max_retries + 1):
+            signed = self.signer.sign_headers(method, path, query, {**(headers or {}), "host": self.host})
+            start = time.perf_counter()
+            try:
+                async with self._get_session().request(method, url, headers=signed, data=data) as response:
+                    body = await response.read()
+                    status = response.status
+                    response_headers = {name.lower(): value for name, value in response.headers.items()}
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.record_s3_request(operation, "connection_error", time.perf_counter() - start)
+                if attempt == settings.s3_max_retries:
+                    raise
+                logger.warning(f"S3 {operation} {key} failed ({e}), retrying")
+            else:
+                metrics.record_s3_request(operation, str(status), time.perf_counter() - start)
+                if status < 300 or (missing_ok and status == 404) or status == 304:
+                    return status, response_headers, body
+                if status not in (429, 500, 502, 503, 504) or attempt == settings.s3_max_retries:
+                    code, message = str(status), ""
+                    if body:
+                        try:
+                            error = ET.fromstring(body)
+                            code, message = _xml_text(error, "Code", code), _xml_text(error, "Message")
+                        except ET.ParseError:
+                            pass
+                    raise S3Error(status, code, message)
+                logger.warning(f"S3 {operation} {key} returned {status}, retrying")
+            
+            await asyncio.sleep(min(0.1 * 2 ** attempt, 5.0))
+        raise AssertionError("unreachable")
+    
+    async def put_object(self, key: str, data: bytes, headers: Optional[Dict[str, str]] = None) -> str:
+        _, response_headers, _ = await self.request("put_object", "PUT", key, headers=headers, data=data)
+        metrics.record_s3_transfer("upload", len(data))
+        return response_headers.get("etag", "")
+    
+    async def head_object(self, key: str) -> Optional[Dict[str, str]]:
+        status, headers, _ = await self.request("head_object", "HEAD", key, missing_ok=True)
+        return None if status == 404 else headers
+    
+    async def get_object(self, key: str, start: Optional[int] = None, end: Optional[int] = None) -> bytes:
+        """Read an object, or the inclusive byte range ``start``-``end`` of it"""
+        headers = {"range": f"bytes={start}-{'' if end is None else end}"} if start is not None else None
+        _, _, body = await self.request("get_object", "GET", key, headers=headers)
+        metrics.record_s3_transfer("download", len(body))
+        return body
+    
+    async def copy_object(self, key: str, headers: Dict[str, str]) -> str:
+        """Copy an object onto itself with its metadata replaced by ``headers``.
+        
+        The copy happens inside S3, so no data is transferred; a single copy
+        covers objects up to 5 GiB.
+        """
+        _, _, body = await self.request(
+            "copy_object", "PUT", key, headers={
+                **headers,
+                "x-amz-copy-source": _uri_encode(f"/{self.bucket}/{key}", safe="/-_.~"),
+                "x-amz-metadata-directive": "REPLACE"
+            }
+        )
+        # Like completion, a copy can fail in the body of a 200 response
+        root = ET.fromstring(body)
+        if root.tag.endswith("Error"):
+            raise S3Error(200, _xml_text(root, "Code"), _xml_text(root, "Message"))
+        return _xml_text(root, "ETag")
+    
+    async def delete_object(self, key: str):
+        await self.request("delete_object", "DELETE", key, missing_ok=True)
+    
+    async def create_multipart_upload(self, key: str, headers: Optional[Dict[str, str]] = None) -> str:
+        _, _, body = await self.request("create_multipart_upload", "POST", key, {"uploads": ""}, headers)
+        return _xml_text(ET.fromstring(body), "UploadId")
+    
+    async def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        _, headers, _ = await self.request(
+            "upload_part", "PUT", key, {"partNumber": str(part_number), "uploadId": upload_id}, data=data
+        )
+        metrics.record_s3_transfer("upload", len(data))
+        return headers["etag"]
+    
+    async def list_parts(self, key: str, upload_id: str) -> List[Tuple[int, str, float]]:
+        """(part number, ETag, last modified timestamp) of every uploaded part"""
+        parts = []
+        query = {"uploadId": upload_id}
+        while True:
+            _, _, body = await self.request("list_parts", "GET", key, query)
+            root = ET.fromstring(body)
+            for part in root.findall("{*}Part"):
+                modified = _xml_text(part, "LastModified")
+                parts.append((
+                    int(_xml_text(part, "PartNumber")),
+                    _xml_text(part, "ETag"),
+                    datetime.fromisoformat(modified.replace("Z", "+00:00")).timestamp() if modified else 0.0
+                ))
+            if _xml_text(root, "IsTruncated") != "true":
+                return parts
+            query = {"uploadId": upload_id, "part-number-marker": _xml_text(root, "NextPartNumberMarker")}
+    
+    async def complete_multipart_upload(self, key: str, upload_id: str, parts: List[Tuple[int, str]]) -> str:
+        document = "".join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>" for number, etag in sorted(parts)
+        )
+        _, _, body = await self.request(
+            "complete_multipart_upload", "POST", key, {"uploadId": upload_id},
+            data=f"<CompleteMultipartUpload>{document}</CompleteMultipartUpload>".encode("utf-8")
+        )
+        # S3 can report a failed completion in the body of a 200 response
+        root = ET.fromstring(body)
+        if root.tag.endswith("Error"):
+            raise S3Error(200, _xml_text(root, "Code"), _xml_text(root, "Message"))
+        return _xml_text(root, "ETag")
+    
+    async def abort_multipart_upload(self, key: str, upload_id: str):
+        await self.request("abort_multipart_upload", "DELETE", key, {"uploadId": upload_id}, missing_ok=True)
+    
+    async def list_objects(self, prefix: str) -> List[str]:
+        keys = []
+        query = {"list-type": "2", "prefix": prefix}
+        while True:
+            _, _, body = await self.request("list_objects", "GET", "", query)
+            root = ET.fromstring(body)
+            keys.extend(_xml_text(item, "Key") for item in root.findall("{*}Contents"))
+            if _xml_text(root, "IsTruncated") != "true":
+                return keys
+            query = {"list-type": "2", "prefix": prefix, "continuation-token": _xml_text(root, "NextContinuationToken")}
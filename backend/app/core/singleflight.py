@@ -0,0 +1,191 @@
+import json
+import uuid
+import time
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Dict, Any, Optional, Callable, Awaitable
+from loguru import logger
+from app.config import settings
+from app.utils.prometheus_metrics import metrics
+
+def _normalize_terms(terms) -> list:
+    return sorted({str(term).strip().lower() for term in (terms or []) if str(term).strip()})
+
+def canonical_request_key(diagnosis_data: Dict[str, Any]) -> str:
+    """Hash the clinically relevant content of a diagnosis request.
+    
+    Complaints and symptoms are compared case- and order-insensitively, and
+    patientId is ignored because the pipeline output does not depend on it.
+    """
+    vitals = diagnosis_data.get("vitals") or {}
+    canonical = {
+        "complaints": _normalize_terms(diagnosis_data.get("complaints")),
+        "symptoms": _normalize_terms(diagnosis_data.get("symptoms")),
+        "vitals": {k: v for k, v in vitals.items() if v is not None},
+        "history": diagnosis_data.get("history") or {},
+        "top_k": diagnosis_data.get("top_k", 5)
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+class _LeaderCancelled(Exception):
+    """Tells followers the leader stopped without an outcome of its own"""
+    pass
+
+class LocalSingleFlight:
+    """In-process single-flight.
+    
+    Uses concurrent futures so duplicates attach to the leader even when they
+    run on a different thread or event loop. Followers share the leader's
+    result or error, but not its cancellation: if the leader is cancelled,
+    the first follower to wake up takes over and the rest attach to it.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+    
+    def _finish(self, key: str, future: Future, result: Any = None, error: Optional[BaseException] = None):
+        # Unregister before waking followers, so a follower that retries
+        # never attaches to this finished flight again
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            with self._lock:
+                future = self._in_flight.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    self._in_flight[key] = future
+            
+            if leader:
+                break
+            
+            metrics.record_duplicate_suppressed("local")
+            logger.info(f"Attached to in-flight diagnosis {key[:12]}")
+            try:
+                # Shielded so a cancelled follower leaves the shared future alone
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except _LeaderCancelled:
+                logger.info(f"Leader of diagnosis {key[:12]} was cancelled, retrying")
+        
+        try:
+            result = await fn()
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        except BaseException:
+            self._finish(key, future, error=_LeaderCancelled())
+            raise
+        self._finish(key, future, result=result)
+        return result
+    
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+class RedisSingleFlight:
+    """Cross-worker single-flight built on a Redis lock.
+    
+    The worker that wins ``SET NX`` computes the result and publishes it under
+    a short-lived key; the others poll for it. If the leader dies, its lock
+    expires and followers compute the result themselves.
+    """
+    
+    _RELEASE_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+    
+    def __init__(
+        self,
+        redis_url: str,
+        lock_ttl_sec: float = settings.diagnosis_singleflight_lock_ttl_sec,
+        result_ttl_sec: int = settings.diagnosis_singleflight_result_ttl_sec,
+        poll_interval_sec: float = 0.2,
+        prefix: str = "medrag:singleflight:"
+    ):
+        self.redis_url = redis_url
+        self.lock_ttl_sec = lock_ttl_sec
+        self.result_ttl_sec = result_ttl_sec
+        self.poll_interval_sec = poll_interval_sec
+        self.prefix = prefix
+        self._client = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _get_client(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            import redis.asyncio as aioredis
+            self._client = aioredis.from_url(self.redis_url)
+            self._client_loop = loop
+        return self._client
+    
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        lock_key = f"{self.prefix}{key}:lock"
+        result_key = f"{self.prefix}{key}:result"
+        owner = str(uuid.uuid4())
+        
+        try:
+            client = self._get_client()
+            acquired = await client.set(lock_key, owner, nx=True, px=int(self.lock_ttl_sec * 1000))
+        except Exception as e:
+            logger.warning(f"Single-flight lock unavailable, running directly: {e}")
+            return await fn()
+        
+        if acquired:
+            try:
+                result = await fn()
+                await client.set(result_key, json.dumps(result), ex=self.result_ttl_sec)
+                return result
+            finally:
+                try:
+                    await client.eval(self._RELEASE_SCRIPT, 1, lock_key, owner)
+                except Exception as e:
+                    logger.warning(f"Failed to release single-flight lock: {e}")
+        
+        metrics.record_duplicate_suppressed("redis")
+        logger.info(f"Waiting on diagnosis {key[:12]} running in another worker")
+        
+        deadline = time.monotonic() + self.lock_ttl_sec
+        while time.monotonic() < deadline:
+            raw = await client.get(result_key)
+            if raw:
+                return json.loads(raw)
+            if not await client.exists(lock_key):
+                # Leader finished without publishing (failed); check once more
+                raw = await client.get(result_key)
+                if raw:
+                    return json.loads(raw)
+                break
+            await asyncio.sleep(self.poll_interval_sec)
+        
+        logger.warning(f"Single-flight leader for {key[:12]} did not publish a result, computing locally")
+        return await fn()
+
+class DiagnosisSingleFlight:
+    """Collapse concurrent identical diagnoses in-process, then across workers"""
+    
+    def __init__(self, redis_flight: Optional[RedisSingleFlight] = None):
+        self.local = LocalSingleFlight()
+        self.redis = redis_flight
+    
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if self.redis:
+            return await self.local.do(key, lambda: self.redis.do(key, fn))
+        return await self.local.do(key, fn)
+
+# Global single-flight instance
+diagnosis_flight = DiagnosisSingleFlight(
+    RedisSingleFlight(settings.redis_url) if settings.diagnosis_singleflight_redis_enabled else None
+)
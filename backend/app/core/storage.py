@@ -1,17 +1,128 @@
 import os
+import json
+import time
 import uuid
+import shutil
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import mimetypes
 import aiofiles
-from typing import Optional, BinaryIO
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, BinaryIO, Set, Tuple
 from pathlib import Path
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote, unquote
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from loguru import logger
 from app.config import settings
+from app.utils.prometheus_metrics import metrics
+from app.utils.io_helpers import AuthHelper
+from app.core.s3_client import S3Client, S3Error
+
+# S3 rejects multipart parts below this size, except the last
+S3_MIN_PART_BYTES = 5 * 1024 * 1024
+
+class FileTooLargeError(Exception):
+    """Raised when a streamed upload exceeds its size limit"""
+    pass
+
+class UploadSessionError(Exception):
+    """Raised when a resumable upload chunk or completion is invalid"""
+    pass
+
+class UploadSessionNotFoundError(UploadSessionError):
+    pass
+
+@dataclass
+class UploadSession:
+    """A resumable upload split into fixed-size chunks.
+    
+    Chunk ``i`` covers bytes ``i * chunk_size`` onwards and only the last one
+    may be short, so chunks can arrive in any order (or in parallel) and map
+    directly onto multipart upload parts. ``content_hash`` is the SHA-256 the
+    client declared up front, if any; completion rejects content that does
+    not match it.
+    """
+    session_id: str
+    filename: str
+    content_type: str
+    size: int
+    chunk_size: int
+    created_at: float
+    updated_at: float
+    received: Set[int] = field(default_factory=set)
+    content_hash: Optional[str] = None
+    
+    @property
+    def total_chunks(self) -> int:
+        return max(1, -(-self.size // self.chunk_size))
+    
+    @property
+    def offset(self) -> int:
+        """Bytes received contiguously from the start; where a client resumes"""
+        index = 0
+        while index in self.received:
+            index += 1
+        return min(index * self.chunk_size, self.size)
+    
+    @property
+    def complete(self) -> bool:
+        return len(self.received) == self.total_chunks
+    
+    def chunk_length(self, offset: int) -> int:
+        """Validate a chunk offset and return the exact length expected there"""
+        if offset % self.chunk_size or not 0 <= offset < max(self.size, 1):
+            raise UploadSessionError(
+                f"Offset {offset} is not a chunk boundary (chunk size {self.chunk_size}, size {self.size})"
+            )
+        return min(self.chunk_size, self.size - offset)
+
+@dataclass
+class StoredFile:
+    """Index entry for a stored file"""
+    file_id: str
+    filename: str
+    extension: str
+    size: int
+    content_type: str
+    content_hash: str
+    created_at: float
+    path: Optional[str] = None
 
 class StorageClient(ABC):
     @abstractmethod
     async def upload_file(self, file_content: bytes, filename: str, content_type: str) -> str:
         pass
     
+    @abstractmethod
+    async def store_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        filename: str,
+        content_type: str,
+        max_size: Optional[int] = None
+    ) -> StoredFile:
+        """Store an upload from an async iterator of chunks without buffering it.
+        
+        Returns the new file's index entry, including the SHA-256 taken while
+        it streamed. Raises FileTooLargeError as soon as more than
+        ``max_size`` bytes have arrived; nothing is kept for a rejected upload.
+        """
+        pass
+    
+    async def upload_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        filename: str,
+        content_type: str,
+        max_size: Optional[int] = None
+    ) -> str:
+        """Like ``store_stream``, returning only the new file id"""
+        return (await self.store_stream(chunks, filename, content_type, max_size)).file_id
+    
     @abstractmethod
     async def download_file(self, file_id: str) -> Optional[bytes]:
         pass
@@ -23,87 +134,1094 @@ class StorageClient(ABC):
     @abstractmethod
     async def delete_file(self, file_id: str) -> bool:
         pass
+    
+    @abstractmethod
+    async def create_upload_session(
+        self,
+        filename: str,
+        content_type: str,
+        size: int,
+        content_hash: Optional[str] = None
+    ) -> UploadSession:
+        pass
+    
+    @abstractmethod
+    async def get_upload_session(self, session_id: str) -> Optional[UploadSession]:
+        pass
+    
+    @abstractmethod
+    async def write_upload_chunk(self, session_id: str, offset: int, chunks: AsyncIterator[bytes]) -> UploadSession:
+        """Store one chunk of a session; safe to call concurrently for different chunks"""
+        pass
+    
+    @abstractmethod
+    async def store_upload_session(self, session_id: str) -> StoredFile:
+        """Assemble a fully received session into a stored file and return its index entry"""
+        pass
+    
+    async def complete_upload_session(self, session_id: str) -> str:
+        """Like ``store_upload_session``, returning only the new file id"""
+        return (await self.store_upload_session(session_id)).file_id
+    
+    @abstractmethod
+    async def abort_upload_session(self, session_id: str) -> bool:
+        pass
+    
+    @abstractmethod
+    async def purge_stale_upload_sessions(self, max_age_sec: int) -> int:
+        """Discard sessions idle for longer than ``max_age_sec``; returns how many"""
+        pass
+    
+    @abstractmethod
+    async def get_file_info(self, file_id: str) -> Optional[StoredFile]:
+        pass
+    
+    def get_local_path(self, file_id: str) -> Optional[str]:
+        """Path of the stored file on this host, for workers that stream it from disk"""
+        return None
+    
+    def get_content_hash(self, file_id: str) -> Optional[str]:
+        """SHA-256 of the stored content, if the backend can look it up locally.
+        
+        May block; async code reads ``content_hash`` from ``get_file_info``,
+        and uploads get it from the entry ``store_stream`` returns.
+        """
+        return None
+    
+    async def download_to_path(self, file_id: str, path: str) -> bool:
+        """Write a stored file to ``path``; False if it does not exist"""
+        content = await self.download_file(file_id)
+        if content is None:
+            return False
+        async with aiofiles.open(path, "wb") as f:
+            await f.write(content)
+        return True
+    
+    async def close(self):
+        """Release any resources held by the client"""
+        pass
+
+_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    extension TEXT NOT NULL,
+    filename TEXT,
+    size INTEGER,
+    content_type TEXT,
+    path TEXT,
+    created_at REAL
+);
+CREATE INDEX IF NOT EXISTS files_content_hash ON files (content_hash);
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    session_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS upload_sessions_updated_at ON upload_sessions (updated_at);
+CREATE TABLE IF NOT EXISTS upload_session_chunks (
+    session_id TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    PRIMARY KEY (session_id, chunk_index)
+);
+"""
+
+# Columns added to ``files`` after it was first created
+_FILE_COLUMNS_ADDED = (
+    ("filename", "TEXT"), ("size", "INTEGER"), ("content_type", "TEXT"), ("path", "TEXT"), ("created_at", "REAL")
+)
+
+# Columns added to ``upload_sessions`` after it was first created
+_SESSION_COLUMNS_ADDED = (("content_hash", "TEXT"),)
+
+def _is_file_id(name: str) -> bool:
+    try:
+        return str(uuid.UUID(name)) == name
+    except ValueError:
+        return False
+
+def shard_path(root: Path, name: str) -> Path:
+    """``root/ab/cd/<name>``, keeping each directory small however many files are stored"""
+    return root / name[:2] / name[2:4] / name
+
+class _SessionHasher:
+    """Running SHA-256 of a session's chunks received in order"""
+    
+    def __init__(self):
+        self.digest = hashlib.sha256()
+        self.next_index = 0
+        self.busy = False
+
+class _SessionHashers:
+    """The running hashes of this process's upload sessions.
+    
+    Only the next chunk in order can extend a session's hash; chunks that
+    arrive early, or at another process, leave it behind, and completion
+    hashes the rest from storage instead.
+    """
+    
+    def __init__(self):
+        self._hashers: Dict[str, _SessionHasher] = {}
+        self._lock = threading.Lock()
+    
+    def start(self, session_id: str):
+        with self._lock:
+            self._hashers[session_id] = _SessionHasher()
+    
+    def get(self, session_id: str) -> Optional[_SessionHasher]:
+        with self._lock:
+            return self._hashers.get(session_id)
+    
+    def claim(self, session_id: str, index: int) -> Optional[_SessionHasher]:
+        """The session's hasher if chunk ``index`` extends it, reserved for that chunk"""
+        with self._lock:
+            hasher = self._hashers.get(session_id)
+            if hasher is None or hasher.busy or hasher.next_index != index:
+                return None
+            hasher.busy = True
+            return hasher
+    
+    def release(self, session_id: str, hasher: Optional[_SessionHasher], written: bool):
+        if hasher is None:
+            return
+        with self._lock:
+            if written:
+                hasher.next_index += 1
+                hasher.busy = False
+            else:
+                # A partly hashed chunk leaves the digest unusable
+                self._hashers.pop(session_id, None)
+    
+    def pop(self, session_id: str) -> Optional[_SessionHasher]:
+        """Remove the session's hasher; None if it has none or one is mid-chunk"""
+        with self._lock:
+            hasher = self._hashers.pop(session_id, None)
+        return None if hasher is None or hasher.busy else hasher
 
 class LocalStorageClient(StorageClient):
+    """Content-addressed local storage.
+    
+    Each distinct upload is written once to ``objects/ab/cd/<sha256>``, hashed
+    while it streams to disk. Every file id is a hard link to its blob at
+    ``files/ab/cd/<file_id><ext>``. ``index.sqlite3`` maps each file id to its
+    path, size, content type and content hash, so lookups never scan a
+    directory; the number of ids sharing a hash is the blob's reference
+    count, so the blob is removed with its last file id. Resumable upload
+    sessions write their chunks in place into ``sessions/<id>.upload``, which
+    becomes the blob on completion.
+    """
+    
     def __init__(self, storage_path: str):
         self.storage_path = Path(storage_path)
-        self.storage_path.mkdir(parents=True, exist_ok=True)
+        self.objects_path = self.storage_path / "objects"
+        self.files_path = self.storage_path / "files"
+        self.tmp_path = self.storage_path / "tmp"
+        self.sessions_path = self.storage_path / "sessions"
+        for path in (self.storage_path, self.objects_path, self.files_path, self.tmp_path, self.sessions_path):
+            path.mkdir(parents=True, exist_ok=True)
+        
+        self.index_path = self.storage_path / "index.sqlite3"
+        self._local = threading.local()
+        self._hashers = _SessionHashers()
+        self._migrate()
     
-    async def upload_file(self, file_content: bytes, filename: str, content_type: str) -> str:
+    def _connect(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+    
+    @contextmanager
+    def _transaction(self):
+        """Serialize index and blob changes across threads and processes"""
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
         try:
-            # Generate unique file ID
-            file_id = str(uuid.uuid4())
-            file_extension = Path(filename).suffix
-            stored_filename = f"{file_id}{file_extension}"
-            file_path = self.storage_path / stored_filename
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+    
+    def _migrate(self):
+        """Bring the index and directory layout of older storage up to date.
+        
+        Blobs stored flat in ``objects/`` and files stored flat in the storage
+        root (with or without an index entry) are moved into shards. This is
+        a one-off cost; afterwards only shard directories are found here.
+        """
+        db = self._connect()
+        db.executescript(_INDEX_SCHEMA)
+        columns = {row[1] for row in db.execute("PRAGMA table_info(files)")}
+        for name, column_type in _FILE_COLUMNS_ADDED:
+            if name not in columns:
+                db.execute(f"ALTER TABLE files ADD COLUMN {name} {column_type}")
+        columns = {row[1] for row in db.execute("PRAGMA table_info(upload_sessions)")}
+        for name, column_type in _SESSION_COLUMNS_ADDED:
+            if name not in columns:
+                db.execute(f"ALTER TABLE upload_sessions ADD COLUMN {name} {column_type}")
+        
+        moved = 0
+        for entry in os.scandir(self.objects_path):
+            if entry.is_file():
+                blob_path = shard_path(self.objects_path, entry.name)
+                blob_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(entry.path, blob_path)
+                moved += 1
+        
+        for entry in os.scandir(self.storage_path):
+            file_id, extension = os.path.splitext(entry.name)
+            if not entry.is_file() or not _is_file_id(file_id):
+                continue
             
-            # Write file asynchronously
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(file_content)
+            row = db.execute("SELECT 1 FROM files WHERE file_id = ?", (file_id,)).fetchone()
+            if row is None:
+                # Stored before content addressing: hash it into a blob
+                digest = hashlib.sha256()
+                with open(entry.path, "rb") as f:
+                    for block in iter(lambda: f.read(settings.upload_chunk_bytes), b""):
+                        digest.update(block)
+                self._commit_upload(
+                    Path(entry.path), digest.hexdigest(), entry.name,
+                    mimetypes.guess_type(entry.name)[0] or "application/octet-stream",
+                    entry.stat().st_size, file_id=file_id
+                )
+            else:
+                link_path = shard_path(self.files_path, entry.name)
+                link_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(entry.path, link_path)
+                with self._transaction() as tx:
+                    tx.execute(
+                        "UPDATE files SET path = ?, size = ?, filename = COALESCE(filename, ?), "
+                        "content_type = COALESCE(content_type, ?), created_at = COALESCE(created_at, ?) "
+                        "WHERE file_id = ?",
+                        (str(link_path.relative_to(self.storage_path)), os.path.getsize(link_path), entry.name,
+                         mimetypes.guess_type(entry.name)[0] or "application/octet-stream",
+                         os.path.getmtime(link_path), file_id)
+                    )
+            moved += 1
+        
+        if moved:
+            logger.info(f"Moved {moved} stored files into the sharded layout")
+    
+    async def _write_temp(self, chunks: AsyncIterator[bytes], max_size: Optional[int] = None) -> Tuple[Path, str, int]:
+        """Write chunks to a temporary file, hashing and counting as they pass"""
+        digest = hashlib.sha256()
+        size = 0
+        temp_path = self.tmp_path / f"{uuid.uuid4()}.part"
+        
+        try:
+            async with aiofiles.open(temp_path, 'wb') as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise FileTooLargeError(f"Upload exceeds {max_size} bytes")
+                    digest.update(chunk)
+                    await f.write(chunk)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        
+        return temp_path, digest.hexdigest(), size
+    
+    def _commit_upload(
+        self,
+        temp_path: Path,
+        content_hash: str,
+        filename: str,
+        content_type: str,
+        size: int,
+        file_id: Optional[str] = None
+    ) -> Tuple[StoredFile, bool]:
+        """Move a hashed upload into place and index it; returns (entry, duplicate)"""
+        file_id = file_id or str(uuid.uuid4())
+        created_at = time.time()
+        extension = Path(filename).suffix
+        blob_path = shard_path(self.objects_path, content_hash)
+        link_path = shard_path(self.files_path, f"{file_id}{extension}")
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        link_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        with self._transaction() as db:
+            duplicate = blob_path.exists()
+            if duplicate:
+                temp_path.unlink()
+            else:
+                os.replace(temp_path, blob_path)
+            
+            linked = False
+            try:
+                try:
+                    os.link(blob_path, link_path)
+                except OSError:
+                    # File systems without hard links get a private copy
+                    shutil.copyfile(blob_path, link_path)
+                linked = True
+                
+                db.execute(
+                    "INSERT INTO files (file_id, content_hash, extension, filename, size, content_type, path, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (file_id, content_hash, extension, filename, size, content_type,
+                     str(link_path.relative_to(self.storage_path)), created_at)
+                )
+            except BaseException:
+                # Nothing indexes the link, or a new blob, once this rolls back
+                if linked:
+                    link_path.unlink(missing_ok=True)
+                if not duplicate:
+                    blob_path.unlink(missing_ok=True)
+                raise
+        
+        stored = StoredFile(
+            file_id, filename, extension, size, content_type, content_hash, created_at, path=str(link_path.resolve())
+        )
+        return stored, duplicate
+    
+    async def store_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        filename: str,
+        content_type: str,
+        max_size: Optional[int] = None
+    ) -> StoredFile:
+        try:
+            temp_path, content_hash, size = await self._write_temp(chunks, max_size)
+            # The index transaction can wait on SQLite's busy timeout, so it
+            # runs off the event loop along with the rename and link
+            stored, duplicate = await asyncio.to_thread(
+                self._commit_upload, temp_path, content_hash, filename, content_type, size
+            )
+            
+            if duplicate:
+                metrics.record_storage_deduplicated(size)
+                logger.info(f"File {stored.file_id} shares stored content {content_hash[:12]} ({size} bytes)")
             
-            logger.info(f"File uploaded successfully: {file_id}")
-            return file_id
+            logger.info(f"File uploaded successfully: {stored.file_id}")
+            return stored
             
+        except FileTooLargeError as e:
+            logger.warning(f"Rejected upload {filename}: {e}")
+            raise
         except Exception as e:
             logger.error(f"Failed to upload file: {e}")
             raise
     
-    async def download_file(self, file_id: str) -> Optional[bytes]:
+    async def upload_file(self, file_content: bytes, filename: str, content_type: str) -> str:
+        return await self.upload_stream(iter_bytes(file_content), filename, content_type)
+    
+    def _session_path(self, session_id: str) -> Path:
+        return self.sessions_path / f"{session_id}.upload"
+    
+    async def create_upload_session(
+        self,
+        filename: str,
+        content_type: str,
+        size: int,
+        content_hash: Optional[str] = None
+    ) -> UploadSession:
+        now = time.time()
+        session = UploadSession(
+            session_id=str(uuid.uuid4()),
+            filename=filename,
+            content_type=content_type,
+            size=size,
+            chunk_size=settings.upload_session_chunk_bytes,
+            created_at=now,
+            updated_at=now,
+            content_hash=content_hash
+        )
+        
+        await asyncio.to_thread(self._record_session, session)
+        self._hashers.start(session.session_id)
+        
+        logger.info(f"Upload session {session.session_id} created for {filename} ({size} bytes)")
+        return session
+    
+    def _record_session(self, session: UploadSession):
+        self._session_path(session.session_id).touch()
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO upload_sessions (session_id, filename, content_type, size, chunk_size, "
+                "created_at, updated_at, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (session.session_id, session.filename, session.content_type, session.size,
+                 session.chunk_size, session.created_at, session.updated_at, session.content_hash)
+            )
+    
+    async def get_upload_session(self, session_id: str) -> Optional[UploadSession]:
+        # Session reads and writes wait on SQLite locks, so they stay off the loop
+        return await asyncio.to_thread(self._read_session, session_id)
+    
+    def _read_session(self, session_id: str) -> Optional[UploadSession]:
+        db = self._connect()
+        row = db.execute(
+            "SELECT filename, content_type, size, chunk_size, created_at, updated_at, content_hash "
+            "FROM upload_sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        
+        received = {
+            index for (index,) in db.execute(
+                "SELECT chunk_index FROM upload_session_chunks WHERE session_id = ?", (session_id,)
+            )
+        }
+        return UploadSession(session_id, *row[:-1], received=received, content_hash=row[-1])
+    
+    async def write_upload_chunk(self, session_id: str, offset: int, chunks: AsyncIterator[bytes]) -> UploadSession:
+        session = await self.get_upload_session(session_id)
+        if session is None:
+            raise UploadSessionNotFoundError(f"Upload session not found: {session_id}")
+        
+        index = offset // session.chunk_size
+        expected = session.chunk_length(offset)
+        hasher = self._hashers.claim(session_id, index)
+        written = 0
+        
         try:
-            # Find file with this ID (check all extensions)
-            for file_path in self.storage_path.glob(f"{file_id}.*"):
-                async with aiofiles.open(file_path, 'rb') as f:
-                    content = await f.read()
-                return content
+            async with aiofiles.open(self._session_path(session_id), 'r+b') as f:
+                await f.seek(offset)
+                async for chunk in chunks:
+                    written += len(chunk)
+                    if written > expected:
+                        raise UploadSessionError(f"Chunk at offset {offset} exceeds {expected} bytes")
+                    if hasher is not None:
+                        hasher.digest.update(chunk)
+                    await f.write(chunk)
             
-            logger.warning(f"File not found: {file_id}")
+            if written != expected:
+                raise UploadSessionError(f"Chunk at offset {offset} must be {expected} bytes, received {written}")
+        except BaseException:
+            self._hashers.release(session_id, hasher, written=False)
+            raise
+        self._hashers.release(session_id, hasher, written=True)
+        
+        await asyncio.to_thread(self._record_chunk, session_id, index)
+        session.received.add(index)
+        return session
+    
+    def _record_chunk(self, session_id: str, index: int):
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR IGNORE INTO upload_session_chunks (session_id, chunk_index) VALUES (?, ?)",
+                (session_id, index)
+            )
+            db.execute("UPDATE upload_sessions SET updated_at = ? WHERE session_id = ?", (time.time(), session_id))
+    
+    def _finish_hash(self, session: UploadSession) -> str:
+        hasher = self._hashers.pop(session.session_id) or _SessionHasher()
+        
+        # Read back only what arrived out of order (or before a restart)
+        with open(self._session_path(session.session_id), "rb") as f:
+            f.seek(hasher.next_index * session.chunk_size)
+            while True:
+                block = f.read(settings.upload_chunk_bytes)
+                if not block:
+                    break
+                hasher.digest.update(block)
+        return hasher.digest.hexdigest()
+    
+    def _forget_session(self, db: sqlite3.Connection, session_id: str) -> bool:
+        deleted = db.execute("DELETE FROM upload_sessions WHERE session_id = ?", (session_id,)).rowcount
+        db.execute("DELETE FROM upload_session_chunks WHERE session_id = ?", (session_id,))
+        self._hashers.pop(session_id)
+        return deleted > 0
+    
+    async def store_upload_session(self, session_id: str) -> StoredFile:
+        session = await self.get_upload_session(session_id)
+        if session is None:
+            raise UploadSessionNotFoundError(f"Upload session not found: {session_id}")
+        if not session.complete:
+            raise UploadSessionError(
+                f"Upload incomplete: {len(session.received)} of {session.total_chunks} chunks received"
+            )
+        
+        content_hash = await asyncio.to_thread(self._finish_hash, session)
+        if session.content_hash and content_hash != session.content_hash:
+            await self.abort_upload_session(session_id)
+            raise UploadSessionError(f"Upload session {session_id} does not match its declared SHA-256")
+        
+        stored, duplicate = await asyncio.to_thread(self._assemble_session, session, content_hash)
+        if duplicate:
+            metrics.record_storage_deduplicated(session.size)
+        
+        logger.info(f"Upload session {session_id} completed as file {stored.file_id}")
+        return stored
+    
+    def _assemble_session(self, session: UploadSession, content_hash: str) -> Tuple[StoredFile, bool]:
+        # Claim the session so a concurrent completion cannot assemble it twice
+        with self._transaction() as db:
+            if not self._forget_session(db, session.session_id):
+                raise UploadSessionNotFoundError(f"Upload session not found: {session.session_id}")
+        
+        # The chunks were written in place, so assembly is a rename
+        return self._commit_upload(
+            self._session_path(session.session_id), content_hash, session.filename, session.content_type, session.size
+        )
+    
+    async def abort_upload_session(self, session_id: str) -> bool:
+        return await asyncio.to_thread(self._abort_session, session_id)
+    
+    def _abort_session(self, session_id: str) -> bool:
+        with self._transaction() as db:
+            deleted = self._forget_session(db, session_id)
+        self._session_path(session_id).unlink(missing_ok=True)
+        return deleted
+    
+    async def purge_stale_upload_sessions(self, max_age_sec: int) -> int:
+        return await asyncio.to_thread(self._purge_stale_sessions, time.time() - max_age_sec)
+    
+    def _purge_stale_sessions(self, cutoff: float) -> int:
+        with self._transaction() as db:
+            stale = [
+                session_id for (session_id,) in db.execute(
+                    "SELECT session_id FROM upload_sessions WHERE updated_at < ?", (cutoff,)
+                )
+            ]
+            for session_id in stale:
+                self._forget_session(db, session_id)
+        for session_id in stale:
+            self._session_path(session_id).unlink(missing_ok=True)
+        
+        # Streamed uploads interrupted by a crash leave temp files behind too
+        for temp_path in self.tmp_path.glob("*.part"):
+            try:
+                if temp_path.stat().st_mtime < cutoff:
+                    temp_path.unlink()
+            except FileNotFoundError:
+                pass
+        
+        if stale:
+            logger.info(f"Purged {len(stale)} stale upload sessions")
+        return len(stale)
+    
+    async def get_file_info(self, file_id: str) -> Optional[StoredFile]:
+        # Index reads can wait on a writer's lock, so they stay off the loop
+        return await asyncio.to_thread(self._lookup, file_id)
+    
+    def _lookup(self, file_id: str) -> Optional[StoredFile]:
+        row = self._connect().execute(
+            "SELECT file_id, filename, extension, size, content_type, content_hash, created_at, path "
+            "FROM files WHERE file_id = ?", (file_id,)
+        ).fetchone()
+        if row is None:
             return None
+        return StoredFile(*row[:-1], path=str((self.storage_path / row[-1]).resolve()))
+    
+    def get_content_hash(self, file_id: str) -> Optional[str]:
+        info = self._lookup(file_id)
+        return info.content_hash if info else None
+    
+    async def download_file(self, file_id: str) -> Optional[bytes]:
+        try:
+            info = await self.get_file_info(file_id)
+            if info is None:
+                logger.warning(f"File not found: {file_id}")
+                return None
+            
+            async with aiofiles.open(info.path, 'rb') as f:
+                return await f.read()
             
         except Exception as e:
             logger.error(f"Failed to download file {file_id}: {e}")
             return None
     
     async def get_presigned_url(self, file_id: str, expires_in: int = 3600) -> Optional[str]:
-        # For local storage, return a direct file path or API endpoint
-        # In production, this would be a signed URL
-        for file_path in self.storage_path.glob(f"{file_id}.*"):
-            return f"/api/v1/files/{file_id}"
-        return None
+        # Signed download URL served by the files endpoint without a bearer token
+        if await self.get_file_info(file_id) is None:
+            return None
+        return AuthHelper.sign_file_url(file_id, expires_in)
+    
+    def get_local_path(self, file_id: str) -> Optional[str]:
+        info = self._lookup(file_id)
+        return info.path if info else None
     
     async def delete_file(self, file_id: str) -> bool:
         try:
-            for file_path in self.storage_path.glob(f"{file_id}.*"):
-                file_path.unlink()
-                logger.info(f"File deleted: {file_id}")
-                return True
-            return False
+            references = await asyncio.to_thread(self._delete, file_id)
+            if references is None:
+                return False
+            
+            logger.info(f"File deleted: {file_id} ({references} references to its content remain)")
+            return True
         except Exception as e:
             logger.error(f"Failed to delete file {file_id}: {e}")
             return False
+    
+    def _delete(self, file_id: str) -> Optional[int]:
+        """Remove a file id and, with its last reference, the blob; returns the references left"""
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT content_hash, path FROM files WHERE file_id = ?", (file_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            
+            content_hash, path = row
+            db.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+            (self.storage_path / path).unlink(missing_ok=True)
+            
+            references = db.execute(
+                "SELECT COUNT(*) FROM files WHERE content_hash = ?", (content_hash,)
+            ).fetchone()[0]
+            if references == 0:
+                shard_path(self.objects_path, content_hash).unlink(missing_ok=True)
+        return references
+
+async def iter_bytes(content: bytes, chunk_size: int = settings.upload_chunk_bytes) -> AsyncIterator[bytes]:
+    """Present in-memory content as an upload stream"""
+    for offset in range(0, len(content), chunk_size):
+        yield content[offset:offset + chunk_size]
 
 class S3StorageClient(StorageClient):
-    def __init__(self, bucket_name: str, access_key: str, secret_key: str, region: str):
+    """Object storage on S3 or an S3-compatible server such as MinIO.
+    
+    Each file is one object at ``files/<file_id>`` carrying its filename,
+    content type and SHA-256 as metadata, so a ``HEAD`` request is the index
+    lookup. Multipart ETags are not content hashes, so the SHA-256 is taken
+    during the upload; when it is only known after the object exists, a
+    server-side copy writes it into the metadata. Uploads larger than one
+    part go up as a multipart upload with up to ``transfer_concurrency``
+    parts in flight, and large downloads fetch part-sized byte ranges in
+    parallel, all over the client's pooled connections. Resumable upload
+    sessions map directly onto multipart uploads: every chunk is a part, and
+    a small manifest object at ``sessions/<id>.json`` records the upload id.
+    A SHA-256 declared when the session is created goes straight into the
+    CreateMultipartUpload metadata and is verified on completion against the
+    running hash of chunks received in order; only sessions whose chunks
+    arrived out of order, or at other processes, read the object back to hash
+    it. Buckets should also have an ``AbortIncompleteMultipartUpload`` lifecycle
+    rule for uploads abandoned by a crashed process.
+    """
+    
+    def __init__(
+        self,
+        bucket_name: str,
+        access_key: str,
+        secret_key: str,
+        region: str,
+        endpoint_url: Optional[str] = None,
+        part_size: int = settings.s3_part_bytes,
+        transfer_concurrency: int = settings.s3_transfer_concurrency
+    ):
         self.bucket_name = bucket_name
-        self.access_key = access_key
-        self.secret_key = secret_key
         self.region = region
-        # TODO: Initialize boto3 client
+        self.part_size = max(part_size, 1)
+        self.transfer_concurrency = max(transfer_concurrency, 1)
+        self.client = S3Client(bucket_name, access_key, secret_key, region, endpoint_url)
+        self._hashers = _SessionHashers()
+    
+    @staticmethod
+    def _key(file_id: str) -> str:
+        return f"files/{file_id}"
+    
+    @staticmethod
+    def _session_key(session_id: str) -> str:
+        return f"sessions/{session_id}.json"
+    
+    @staticmethod
+    def _object_headers(filename: str, content_type: str, content_hash: Optional[str] = None) -> Dict[str, str]:
+        # Metadata headers must be ASCII
+        headers = {"content-type": content_type, "x-amz-meta-filename": quote(filename)}
+        if content_hash:
+            headers["x-amz-meta-sha256"] = content_hash
+        return headers
+    
+    async def _hash_object(self, key: str, size: int) -> str:
+        """SHA-256 of a stored object, read back in order one part at a time"""
+        digest = hashlib.sha256()
+        starts = list(range(0, size, self.part_size))
+        
+        def fetch(start: int) -> asyncio.Task:
+            return asyncio.ensure_future(self.client.get_object(key, start, min(start + self.part_size, size) - 1))
+        
+        # The next range downloads while the current one is hashed
+        pending = fetch(starts[0]) if starts else None
+        try:
+            for index in range(len(starts)):
+                data = await pending
+                pending = fetch(starts[index + 1]) if index + 1 < len(starts) else None
+                await asyncio.to_thread(digest.update, data)
+        finally:
+            if pending is not None:
+                pending.cancel()
+        return digest.hexdigest()
+    
+    async def close(self):
+        await self.client.close()
+    
+    async def _for_each_range(self, size: int, transfer: Callable[[int, int], Awaitable[None]]):
+        """Run ``transfer(start, end)`` over part-sized ranges, ``transfer_concurrency`` at a time"""
+        slots = asyncio.Semaphore(self.transfer_concurrency)
+        
+        async def bounded(start: int):
+            async with slots:
+                await transfer(start, min(start + self.part_size, size) - 1)
+        
+        tasks = [asyncio.ensure_future(bounded(start)) for start in range(0, size, self.part_size)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+    
+    async def store_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        filename: str,
+        content_type: str,
+        max_size: Optional[int] = None
+    ) -> StoredFile:
+        file_id = str(uuid.uuid4())
+        key = self._key(file_id)
+        headers = self._object_headers(filename, content_type)
+        digest = hashlib.sha256()
+        buffer = bytearray()
+        size = 0
+        upload_id: Optional[str] = None
+        part_number = 0
+        parts: Dict[int, str] = {}
+        pending: Set[asyncio.Task] = set()
+        slots = asyncio.Semaphore(self.transfer_concurrency)
+        
+        async def send_part(number: int, data: bytes):
+            try:
+                parts[number] = await self.client.upload_part(key, upload_id, number, data)
+            finally:
+                slots.release()
+        
+        async def start_part(data: bytes):
+            nonlocal upload_id, part_number
+            if upload_id is None:
+                upload_id = await self.client.create_multipart_upload(key, headers)
+            # Waiting for a free slot holds the reader back, so at most
+            # transfer_concurrency parts are buffered at once
+            await slots.acquire()
+            for task in [task for task in pending if task.done()]:
+                pending.discard(task)
+                task.result()
+            part_number += 1
+            pending.add(asyncio.create_task(send_part(part_number, data)))
+        
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise FileTooLargeError(f"Upload exceeds {max_size} bytes")
+                digest.update(chunk)
+                buffer += chunk
+                while len(buffer) >= self.part_size:
+                    await start_part(bytes(buffer[:self.part_size]))
+                    del buffer[:self.part_size]
+            
+            content_hash = digest.hexdigest()
+            final_headers = self._object_headers(filename, content_type, content_hash)
+            if upload_id is None:
+                # Smaller than one part: a single PUT
+                await self.client.put_object(key, bytes(buffer), final_headers)
+            else:
+                if buffer:
+                    await start_part(bytes(buffer))
+                await asyncio.gather(*pending)
+                await self.client.complete_multipart_upload(key, upload_id, list(parts.items()))
+                upload_id = None
+                # The hash is only known once every part is sent
+                await self.client.copy_object(key, final_headers)
+            
+            logger.info(f"File uploaded successfully: {file_id} ({size} bytes, {max(part_number, 1)} parts)")
+            return StoredFile(file_id, filename, Path(filename).suffix, size, content_type, content_hash, time.time())
+            
+        except BaseException as e:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            try:
+                if upload_id is not None:
+                    await self.client.abort_multipart_upload(key, upload_id)
+                elif part_number:
+                    # Assembled, but its hash could not be recorded
+                    await self.client.delete_object(key)
+            except Exception as cleanup_error:
+                logger.warning(f"Failed to clean up upload of {file_id}: {cleanup_error}")
+            
+            if isinstance(e, FileTooLargeError):
+                logger.warning(f"Rejected upload {filename}: {e}")
+            elif isinstance(e, Exception):
+                logger.error(f"Failed to upload file: {e}")
+            raise
     
     async def upload_file(self, file_content: bytes, filename: str, content_type: str) -> str:
-        # TODO: Implement S3 upload
-        raise NotImplementedError("S3 storage not implemented yet")
+        return await self.upload_stream(iter_bytes(file_content, self.part_size), filename, content_type)
+    
+    async def _load_session(self, session_id: str) -> Optional[Tuple[UploadSession, Dict, List[Tuple[int, str, float]]]]:
+        """The session, its manifest and its uploaded parts, or None once it is gone"""
+        try:
+            manifest = json.loads(await self.client.get_object(self._session_key(session_id)))
+            parts = await self.client.list_parts(self._key(manifest["file_id"]), manifest["upload_id"])
+        except S3Error as e:
+            if e.status == 404:
+                return None
+            raise
+        
+        session = UploadSession(
+            session_id=session_id,
+            filename=manifest["filename"],
+            content_type=manifest["content_type"],
+            size=manifest["size"],
+            chunk_size=manifest["chunk_size"],
+            created_at=manifest["created_at"],
+            updated_at=max([manifest["created_at"]] + [modified for _, _, modified in parts]),
+            received={number - 1 for number, _, _ in parts},
+            content_hash=manifest.get("sha256")
+        )
+        return session, manifest, parts
+    
+    async def create_upload_session(
+        self,
+        filename: str,
+        content_type: str,
+        size: int,
+        content_hash: Optional[str] = None
+    ) -> UploadSession:
+        now = time.time()
+        file_id = str(uuid.uuid4())
+        session = UploadSession(
+            session_id=str(uuid.uuid4()),
+            filename=filename,
+            content_type=content_type,
+            size=size,
+            # Every part but the last must meet the S3 minimum
+            chunk_size=max(settings.upload_session_chunk_bytes, S3_MIN_PART_BYTES),
+            created_at=now,
+            updated_at=now,
+            content_hash=content_hash
+        )
+        
+        upload_id = await self.client.create_multipart_upload(
+            self._key(file_id), self._object_headers(filename, content_type, content_hash)
+        )
+        manifest = {
+            "file_id": file_id,
+            "upload_id": upload_id,
+            "filename": filename,
+            "content_type": content_type,
+            "size": size,
+            "chunk_size": session.chunk_size,
+            "created_at": now,
+            "sha256": content_hash
+        }
+        await self.client.put_object(
+            self._session_key(session.session_id), json.dumps(manifest).encode("utf-8"),
+            {"content-type": "application/json"}
+        )
+        self._hashers.start(session.session_id)
+        
+        logger.info(f"Upload session {session.session_id} created for {filename} ({size} bytes)")
+        return session
+    
+    async def get_upload_session(self, session_id: str) -> Optional[UploadSession]:
+        loaded = await self._load_session(session_id)
+        return loaded[0] if loaded else None
+    
+    async def write_upload_chunk(self, session_id: str, offset: int, chunks: AsyncIterator[bytes]) -> UploadSession:
+        loaded = await self._load_session(session_id)
+        if loaded is None:
+            raise UploadSessionNotFoundError(f"Upload session not found: {session_id}")
+        session, manifest, _ = loaded
+        
+        index = offset // session.chunk_size
+        expected = session.chunk_length(offset)
+        # A part is sent (and retried) from memory, so one chunk is buffered
+        data = bytearray()
+        async for chunk in chunks:
+            data += chunk
+            if len(data) > expected:
+                raise UploadSessionError(f"Chunk at offset {offset} exceeds {expected} bytes")
+        if len(data) != expected:
+            raise UploadSessionError(f"Chunk at offset {offset} must be {expected} bytes, received {len(data)}")
+        
+        data = bytes(data)
+        hasher = self._hashers.claim(session_id, index)
+        upload = asyncio.ensure_future(
+            self.client.upload_part(self._key(manifest["file_id"]), manifest["upload_id"], index + 1, data)
+        )
+        try:
+            # Hash while the part is in flight
+            if hasher is not None:
+                await asyncio.to_thread(hasher.digest.update, data)
+            await upload
+        except BaseException as e:
+            upload.cancel()
+            self._hashers.release(session_id, hasher, written=False)
+            if isinstance(e, S3Error) and e.status == 404:
+                raise UploadSessionNotFoundError(f"Upload session not found: {session_id}")
+            raise
+        self._hashers.release(session_id, hasher, written=True)
+        
+        session.received.add(index)
+        session.updated_at = time.time()
+        return session
+    
+    async def store_upload_session(self, session_id: str) -> StoredFile:
+        loaded = await self._load_session(session_id)
+        if loaded is None:
+            raise UploadSessionNotFoundError(f"Upload session not found: {session_id}")
+        session, manifest, parts = loaded
+        if not session.complete:
+            raise UploadSessionError(
+                f"Upload incomplete: {len(session.received)} of {session.total_chunks} chunks received"
+            )
+        
+        hasher = self._hashers.pop(session_id)
+        content_hash = None
+        if hasher is not None and hasher.next_index == session.total_chunks:
+            content_hash = hasher.digest.hexdigest()
+            if session.content_hash and content_hash != session.content_hash:
+                await self.abort_upload_session(session_id)
+                raise UploadSessionError(f"Upload session {session_id} does not match its declared SHA-256")
+        
+        key = self._key(manifest["file_id"])
+        try:
+            await self.client.complete_multipart_upload(
+                key, manifest["upload_id"], [(number, etag) for number, etag, _ in parts]
+            )
+        except S3Error as e:
+            # A concurrent completion already assembled it
+            if e.status == 404:
+                raise UploadSessionNotFoundError(f"Upload session not found: {session_id}")
+            raise
+        
+        if content_hash is None:
+            # Some chunks arrived out of order or at another process, so the
+            # content is hashed once it is whole
+            content_hash = await self._hash_object(key, session.size)
+            if session.content_hash and content_hash != session.content_hash:
+                await self.client.delete_object(key)
+                await self.client.delete_object(self._session_key(session_id))
+                raise UploadSessionError(f"Upload session {session_id} does not match its declared SHA-256")
+        
+        if not session.content_hash:
+            # The hash was unknown when the multipart upload was created
+            await self.client.copy_object(
+                key, self._object_headers(session.filename, session.content_type, content_hash)
+            )
+        await self.client.delete_object(self._session_key(session_id))
+        
+        logger.info(f"Upload session {session_id} completed as file {manifest['file_id']}")
+        return StoredFile(
+            manifest["file_id"], session.filename, Path(session.filename).suffix, session.size,
+            session.content_type, content_hash, time.time()
+        )
+    
+    async def abort_upload_session(self, session_id: str) -> bool:
+        try:
+            manifest = json.loads(await self.client.get_object(self._session_key(session_id)))
+        except S3Error as e:
+            if e.status == 404:
+                return False
+            raise
+        
+        self._hashers.pop(session_id)
+        await self.client.abort_multipart_upload(self._key(manifest["file_id"]), manifest["upload_id"])
+        await self.client.delete_object(self._session_key(session_id))
+        return True
+    
+    async def purge_stale_upload_sessions(self, max_age_sec: int) -> int:
+        cutoff = time.time() - max_age_sec
+        purged = 0
+        for key in await self.client.list_objects("sessions/"):
+            session_id = key[len("sessions/"):-len(".json")]
+            loaded = await self._load_session(session_id)
+            if loaded is None or loaded[0].updated_at < cutoff:
+                await self.abort_upload_session(session_id)
+                purged += 1
+        
+        if purged:
+            logger.info(f"Purged {purged} stale upload sessions")
+        return purged
+    
+    async def get_file_info(self, file_id: str) -> Optional[StoredFile]:
+        headers = await self.client.head_object(self._key(file_id))
+        if headers is None:
+            return None
+        
+        filename = unquote(headers.get("x-amz-meta-filename", file_id))
+        modified = headers.get("last-modified")
+        return StoredFile(
+            file_id=file_id,
+            filename=filename,
+            extension=Path(filename).suffix,
+            size=int(headers.get("content-length", 0)),
+            content_type=headers.get("content-type", "application/octet-stream"),
+            # Objects stored before the digest was recorded fall back to their ETag
+            content_hash=headers.get("x-amz-meta-sha256") or headers.get("etag", "").strip('"'),
+            created_at=parsedate_to_datetime(modified).timestamp() if modified else time.time()
+        )
     
     async def download_file(self, file_id: str) -> Optional[bytes]:
-        # TODO: Implement S3 download
-        raise NotImplementedError("S3 storage not implemented yet")
+        try:
+            info = await self.get_file_info(file_id)
+            if info is None:
+                logger.warning(f"File not found: {file_id}")
+                return None
+            
+            content = bytearray(info.size)
+            
+            async def fetch(start: int, end: int):
+                content[start:end + 1] = await self.client.get_object(self._key(file_id), start, end)
+            
+            await self._for_each_range(info.size, fetch)
+            return bytes(content)
+            
+        except Exception as e:
+            logger.error(f"Failed to download file {file_id}: {e}")
+            return None
+    
+    async def download_to_path(self, file_id: str, path: str) -> bool:
+        info = await self.get_file_info(file_id)
+        if info is None:
+            return False
+        
+        # Ranges land at their offsets as they arrive, so memory stays at
+        # transfer_concurrency parts whatever the file size
+        with open(path, "wb") as f:
+            f.truncate(info.size)
+            
+            async def fetch(start: int, end: int):
+                data = await self.client.get_object(self._key(file_id), start, end)
+                await asyncio.to_thread(os.pwrite, f.fileno(), data, start)
+            
+            await self._for_each_range(info.size, fetch)
+        return True
     
     async def get_presigned_url(self, file_id: str, expires_in: int = 3600) -> Optional[str]:
-        # TODO: Implement S3 presigned URL
-        raise NotImplementedError("S3 storage not implemented yet")
+        info = await self.get_file_info(file_id)
+        if info is None:
+            return None
+        return self.client.presigned_url(
+            "GET", self._key(file_id), expires_in,
+            {"response-content-disposition": f"attachment; filename*=utf-8''{quote(info.filename)}"}
+        )
     
     async def delete_file(self, file_id: str) -> bool:
-        # TODO: Implement S3 delete
-        raise NotImplementedError("S3 storage not implemented yet")
+        try:
+            if await self.client.head_object(self._key(file_id)) is None:
+                return False
+            await self.client.delete_object(self._key(file_id))
+            logger.info(f"File deleted: {file_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to delete file {file_id}: {e}")
+            return False
 
 class StorageClientFactory:
     @staticmethod
@@ -117,7 +1235,8 @@ class StorageClientFactory:
                     bucket_name=settings.aws_bucket_name,
                     access_key=settings.aws_access_key_id,
                     secret_key=settings.aws_secret_access_key,
-                    region=settings.aws_region
+                    region=settings.aws_region,
+                    endpoint_url=settings.s3_endpoint_url
                 )
             else:
                 logger.warning("S3 credentials not configured, falling back to local storage")
@@ -131,10 +1250,12 @@ def validate_file_type(filename: str) -> bool:
     file_extension = Path(filename).suffix.lower().lstrip('.')
     return file_extension in settings.allowed_file_types_list
 
+def max_file_size_bytes() -> int:
+    return settings.max_file_size_mb * 1024 * 1024
+
 def validate_file_size(file_size: int) -> bool:
     """Validate if file size is within limits"""
-    max_size_bytes = settings.max_file_size_mb * 1024 * 1024
-    return file_size <= max_size_bytes
+    return file_size <= max_file_size_bytes()
 
 # Global storage client instance
 storage_client = StorageClientFactory.create_client()
\ No newline at end of file
@@ -1,9 +1,57 @@
+import os
 import json
+import time
+import uuid
 import asyncio
-from typing import Dict, Any, Optional
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Awaitable, Iterator, List, Optional, Callable
 from celery import Celery
+from celery.signals import (
+    worker_process_init, worker_process_shutdown, worker_shutdown,
+    celeryd_init, before_task_publish, task_prerun
+)
+from kombu import Exchange, Queue
+from kombu.exceptions import ChannelError
 from loguru import logger
 from app.config import settings
+from app.utils.prometheus_metrics import metrics
+from app.core.async_runtime import worker_runtime
+from app.core.pipeline import Stage, StagePipeline
+from app.core.result_store import result_store
+from app.core.progress import progress_broker
+from app.core.extraction import extract_document, shutdown_extraction_pool, SEQUENTIAL_EXTRACTION_WARNING
+
+# Interactive diagnoses get their own queue so bulk extraction and report
+# rendering cannot delay them
+DIAGNOSIS_QUEUE = "diagnosis"
+EXTRACTION_QUEUE = "extraction"
+REPORTS_QUEUE = "reports"
+
+QUEUE_WORKER_SETTINGS = {
+    DIAGNOSIS_QUEUE: {
+        "concurrency": settings.celery_diagnosis_concurrency,
+        "prefetch_multiplier": settings.celery_diagnosis_prefetch_multiplier
+    },
+    EXTRACTION_QUEUE: {
+        "concurrency": settings.celery_extraction_concurrency,
+        "prefetch_multiplier": settings.celery_extraction_prefetch_multiplier
+    },
+    REPORTS_QUEUE: {
+        "concurrency": settings.celery_reports_concurrency,
+        "prefetch_multiplier": settings.celery_reports_prefetch_multiplier
+    }
+}
+
+# Redis serves priority 0 first while AMQP serves the highest number first
+REDIS_PRIORITIES = {"urgent": 0, "normal": 3, "low": 6}
+AMQP_PRIORITIES = {"urgent": 9, "normal": 5, "low": 1}
+
+def broker_priority(level: str, broker_url: str = settings.celery_broker_url) -> int:
+    """Map a request priority level to the broker's message priority"""
+    priorities = REDIS_PRIORITIES if broker_url.startswith(("redis", "rediss")) else AMQP_PRIORITIES
+    return priorities.get(level, priorities["normal"])
 
 # Initialize Celery
 celery_app = Celery(
@@ -25,59 +73,278 @@ celery_app.conf.update(
     task_soft_time_limit=25 * 60,  # 25 minutes
     worker_prefetch_multiplier=1,
     worker_max_tasks_per_child=1000,
+    task_queues=[
+        Queue(name, Exchange(name), routing_key=name, queue_arguments={"x-max-priority": 10})
+        for name in QUEUE_WORKER_SETTINGS
+    ],
+    task_default_queue=DIAGNOSIS_QUEUE,
+    task_routes={
+        "app.core.tasks.process_diagnosis": {"queue": DIAGNOSIS_QUEUE},
+        "app.core.tasks.process_diagnosis_batch": {"queue": DIAGNOSIS_QUEUE},
+        "app.core.tasks.extract_file_content": {"queue": EXTRACTION_QUEUE},
+        "app.core.tasks.generate_report": {"queue": REPORTS_QUEUE},
+    },
+    task_queue_max_priority=10,
+    task_default_priority=broker_priority("normal"),
+    # Let the Redis transport keep a list per priority step and drain the
+    # most urgent one first
+    broker_transport_options={
+        "queue_order_strategy": "priority",
+        "priority_steps": [0, 3, 6, 9],
+        "sep": ":"
+    },
 )
 
-# In-memory storage for task results (use Redis in production)
-task_results = {}
+@celeryd_init.connect
+def apply_queue_worker_settings(conf=None, options=None, **kwargs):
+    """Size a worker from its queue's settings when it consumes a single queue.
+    
+    Lets each queue run as its own pool (``celery worker -Q extraction``)
+    without repeating concurrency and prefetch flags; explicit command-line
+    values still win.
+    """
+    queues = _worker_queues(options)
+    if len(queues) != 1 or queues[0] not in QUEUE_WORKER_SETTINGS:
+        return
+    
+    queue_settings = QUEUE_WORKER_SETTINGS[queues[0]]
+    conf.worker_concurrency = queue_settings["concurrency"]
+    conf.worker_prefetch_multiplier = queue_settings["prefetch_multiplier"]
+    logger.info(f"Worker for queue '{queues[0]}': concurrency {queue_settings['concurrency']}, prefetch {queue_settings['prefetch_multiplier']}")
+
+@celeryd_init.connect
+def warn_sequential_extraction(conf=None, options=None, **kwargs):
+    """Warn at startup when a prefork worker takes extraction tasks.
+    
+    Prefork children are daemonic and cannot start the extraction process
+    pool, so such a worker silently extracts every page range in sequence.
+    """
+    queues = _worker_queues(options)
+    if queues and "extraction" not in queues:
+        return
+    if settings.extraction_process_workers == 1:
+        return
+    
+    pool = options.get("pool_cls") or getattr(conf, "worker_pool", None) or "prefork"
+    pool_name = pool if isinstance(pool, str) else getattr(pool, "__module__", "")
+    if "prefork" in pool_name or pool_name == "processes":
+        logger.warning(SEQUENTIAL_EXTRACTION_WARNING)
+
+def _worker_queues(options: Dict[str, Any]) -> List[str]:
+    """Queues a worker was started with (-Q); empty when it consumes all of them"""
+    queues = options.get("queues") or []
+    if isinstance(queues, str):
+        queues = [queue.strip() for queue in queues.split(",") if queue.strip()]
+    return list(queues)
+
+@before_task_publish.connect
+def stamp_enqueue_time(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault("enqueued_at", time.time())
+
+@task_prerun.connect
+def record_queue_wait(task=None, **kwargs):
+    """Export how long each task sat in its queue before a worker picked it up"""
+    enqueued_at = getattr(task.request, "enqueued_at", None)
+    if enqueued_at is None:
+        return
+    queue = (task.request.delivery_info or {}).get("routing_key") or "unknown"
+    metrics.record_task_queue_wait(queue, max(0.0, time.time() - enqueued_at))
+
+def get_queue_depths() -> Dict[str, int]:
+    """Count messages waiting in each task queue, across priority levels"""
+    depths = {}
+    with celery_app.connection_for_read() as connection:
+        # Fail fast rather than stall a metrics scrape while the broker is down
+        connection.ensure_connection(max_retries=1)
+        channel = connection.default_channel
+        for queue in QUEUE_WORKER_SETTINGS:
+            try:
+                depths[queue] = channel.queue_declare(queue=queue, passive=True).message_count
+            except ChannelError:
+                # Redis only creates a queue's list when a message arrives
+                depths[queue] = 0
+    return depths
+
+async def _close_async_clients():
+    """Release loop-bound client resources before the worker loop stops"""
+    from app.core.llm_client import llm_client
+    from app.core.storage import storage_client
+    await llm_client.close()
+    await storage_client.close()
+
+worker_runtime.add_shutdown_hook(_close_async_clients)
+
+@worker_process_init.connect
+def init_worker_runtime(**kwargs):
+    """Give each prefork child its own long-lived event loop.
+    
+    Solo and thread pools never receive this signal; their runtime starts on
+    the first task instead.
+    """
+    worker_runtime.start()
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def shutdown_worker_runtime(**kwargs):
+    worker_runtime.shutdown()
+    shutdown_extraction_pool()
+
+def report_progress(task, task_id: Optional[str], key: str, progress: int, message: str, **extra):
+    """Record progress on the Celery task (if any) and push it to progress subscribers"""
+    meta = {"progress": progress, "message": message, **extra}
+    if task is not None:
+        task.update_state(task_id=task_id, state="PROGRESS", meta=meta)
+    progress_broker.publish(key, {"status": "processing", **meta})
+
+def report_outcome(key: str, status: str, **extra):
+    """Push the final status for a key; subscribers read the result store"""
+    progress_broker.publish(key, {"status": status, "progress": 100 if status == "completed" else 0, **extra})
+
+def format_diagnosis_result(llm_response: Dict[str, Any], similar_cases: List[Dict]) -> Dict[str, Any]:
+    """Convert an LLM response and retrieved cases into the API result shape"""
+    return {
+        "differentialDiagnosis": [
+            {
+                "condition": diag["condition"],
+                "confidence": diag["confidence"],
+                "description": diag["description"],
+                "icd10": diag.get("icd10")
+            }
+            for diag in llm_response.get("differential_diagnosis", [])
+        ],
+        "recommendedActions": [
+            {
+                "id": str(uuid.uuid4()),
+                "text": action["text"],
+                "priority": action["priority"],
+                "category": action["category"]
+            }
+            for action in llm_response.get("recommended_actions", [])
+        ],
+        "followUpQuestions": [
+            {
+                "id": str(uuid.uuid4()),
+                "text": question["text"]
+            }
+            for question in llm_response.get("follow_up_questions", [])
+        ],
+        "similarCases": [
+            {
+                "caseId": case["case_id"],
+                "similarity": case["similarity"],
+                "diagnosis": case["diagnosis"],
+                "outcome": case.get("outcome")
+            }
+            for case in similar_cases
+        ]
+    }
+
+def build_case_query(diagnosis_data: Dict[str, Any]) -> str:
+    """Build the FAISS query text from patient data"""
+    complaints = diagnosis_data.get("complaints", [])
+    symptoms = diagnosis_data.get("symptoms", [])
+    return f"Patient complaints: {', '.join(complaints)}. Symptoms: {', '.join(symptoms)}"
+
+def extraction_cache_key(content_hash: str, file_path: str) -> str:
+    # The extension picks the extractor, so identical bytes uploaded as
+    # different types are cached separately
+    return f"extraction:{content_hash}{os.path.splitext(file_path)[1].lower()}"
+
+def complete_from_extraction_cache(file_id: str, file_path: str, content_hash: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Store a file's extraction from an earlier upload of the same content.
+    
+    ``file_path`` may be the file name; only its extension is used. Returns
+    the cached content, or None when it has not been extracted yet.
+    """
+    if not content_hash or not file_path:
+        return None
+    
+    content = result_store.get(extraction_cache_key(content_hash, file_path))
+    metrics.record_extraction_cache_lookup(hit=content is not None)
+    if content is None:
+        return None
+    
+    result_store.set(file_id, {
+        "status": "completed",
+        "content": content,
+        "file_id": file_id,
+        "cached": True
+    })
+    report_outcome(file_id, "completed", cached=True)
+    logger.info(f"Reused extraction of content {content_hash[:12]} for file {file_id}")
+    return content
+
+@contextmanager
+def stored_file_path(file_id: str, file_path: Optional[str]) -> Iterator[str]:
+    """Local path of a stored file, fetched into a temporary file from object storage"""
+    if file_path is not None:
+        yield file_path
+        return
+    
+    from app.core.storage import storage_client
+    info = worker_runtime.run(storage_client.get_file_info(file_id))
+    if info is None:
+        raise FileNotFoundError(f"Stored file not found: {file_id}")
+    
+    # Keep the extension; it picks the extractor
+    fd, temp_path = tempfile.mkstemp(suffix=info.extension)
+    os.close(fd)
+    try:
+        worker_runtime.run(storage_client.download_to_path(file_id, temp_path))
+        yield temp_path
+    finally:
+        os.unlink(temp_path)
 
 @celery_app.task(bind=True)
-def extract_file_content(self, file_id: str, file_path: str) -> Dict[str, Any]:
-    """Extract content from uploaded file"""
+def extract_file_content(self, file_id: str, file_path: Optional[str], content_hash: Optional[str] = None) -> Dict[str, Any]:
+    """Extract content from uploaded file.
+    
+    ``file_path`` is None for files in object storage, which are downloaded
+    to a temporary file first.
+    """
+    task_id = self.request.id
+    
     try:
-        self.update_state(state="PROGRESS", meta={"progress": 10, "message": "Starting extraction"})
+        # An identical upload may have finished extracting since this task
+        # was queued
+        cached_content = complete_from_extraction_cache(file_id, file_path, content_hash)
+        if cached_content is not None:
+            return {
+                "status": "completed",
+                "file_id": file_id,
+                "content": cached_content
+            }
         
-        # Mock extraction process
-        import time
-        time.sleep(2)  # Simulate processing time
+        report_progress(self, task_id, file_id, 10, "Starting extraction")
         
-        self.update_state(state="PROGRESS", meta={"progress": 50, "message": "Processing file"})
+        last_percent = 10
         
-        # Mock extracted content based on file type
-        file_extension = file_path.split('.')[-1].lower()
+        def on_progress(pages_done: int, total_pages: Optional[int], fraction: float):
+            nonlocal last_percent
+            percent = 10 + int(80 * fraction)
+            # Large documents yield thousands of pages; only publish when the
+            # reported percentage actually moves
+            if percent > last_percent:
+                last_percent = percent
+                total = f"/{total_pages}" if total_pages else ""
+                report_progress(self, task_id, file_id, percent, f"Extracted page {pages_done}{total}")
         
-        if file_extension == "pdf":
-            extracted_content = {
-                "type": "medical_report",
-                "patient_name": "John Doe",
-                "symptoms": ["chest pain", "shortness of breath"],
-                "diagnosis": "Possible cardiac issue",
-                "medications": ["Aspirin", "Metoprolol"],
-                "text": "Patient presents with chest pain and shortness of breath..."
-            }
-        elif file_extension == "json":
-            # Assume it's structured medical data
-            extracted_content = {
-                "type": "structured_data",
-                "patient_name": "Jane Smith",
-                "symptoms": ["fever", "cough", "fatigue"],
-                "diagnosis": "Upper respiratory infection",
-                "medications": ["Acetaminophen"],
-                "text": "Structured medical data imported"
-            }
-        else:
-            extracted_content = {
-                "type": "unknown",
-                "text": "File content extracted but format not recognized"
-            }
+        with stored_file_path(file_id, file_path) as local_path:
+            extracted_content = extract_document(local_path, on_progress=on_progress)
+        
+        report_progress(self, task_id, file_id, 90, "Finalizing extraction")
         
-        self.update_state(state="PROGRESS", meta={"progress": 90, "message": "Finalizing extraction"})
+        if content_hash:
+            result_store.set(extraction_cache_key(content_hash, local_path), extracted_content)
         
         # Store result
-        task_results[file_id] = {
+        result_store.set(file_id, {
             "status": "completed",
             "content": extracted_content,
             "file_id": file_id
-        }
+        })
+        report_outcome(file_id, "completed")
         
         return {
             "status": "completed",
@@ -87,111 +354,132 @@ def extract_file_content(self, file_id: str, file_path: str) -> Dict[str, Any]:
         
     except Exception as e:
         logger.error(f"File extraction failed for {file_id}: {e}")
-        task_results[file_id] = {
+        result_store.set(file_id, {
             "status": "error",
             "error": str(e),
             "file_id": file_id
-        }
+        })
+        report_outcome(file_id, "error", error=str(e))
         raise
 
-@celery_app.task(bind=True)
-def process_diagnosis(self, session_id: str, diagnosis_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Process diagnosis request asynchronously"""
+async def execute_diagnosis(
+    session_id: str,
+    diagnosis_data: Dict[str, Any],
+    progress: Callable[..., None]
+) -> Dict[str, Any]:
+    """Run the diagnosis pipeline for a session and store its outcome.
+    
+    Shared by the Celery task and the in-process executors. ``progress`` is
+    called as ``progress(percent, message, **extra)``.
+    """
     try:
-        self.update_state(state="PROGRESS", meta={"progress": 10, "message": "Starting diagnosis"})
+        progress(10, "Starting diagnosis")
         
         # Import here to avoid circular imports
         from app.core.faiss_client import faiss_client
         from app.core.kg_client import kg_client
         from app.core.llm_client import llm_client, build_diagnosis_prompt
-        
-        # Initialize clients
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        from app.core.singleflight import diagnosis_flight, canonical_request_key
         
         async def run_diagnosis():
-            await faiss_client.initialize()
-            await kg_client.initialize()
+            symptoms = diagnosis_data.get("symptoms", [])
             
-            self.update_state(state="PROGRESS", meta={"progress": 30, "message": "Searching similar cases"})
+            async def init_faiss(inputs):
+                await faiss_client.initialize()
             
-            # Build query from patient data
-            complaints = diagnosis_data.get("complaints", [])
-            symptoms = diagnosis_data.get("symptoms", [])
-            query_text = f"Patient complaints: {', '.join(complaints)}. Symptoms: {', '.join(symptoms)}"
+            async def init_kg(inputs):
+                await kg_client.initialize()
             
-            # Search similar cases
-            similar_cases = await faiss_client.search(query_text, diagnosis_data.get("top_k", 5))
+            async def embed_query(inputs):
+                return await faiss_client.generate_query_embedding(build_case_query(diagnosis_data))
             
-            self.update_state(state="PROGRESS", meta={"progress": 50, "message": "Analyzing knowledge graph"})
+            async def search_cases(inputs):
+                return await faiss_client.search_by_embedding(inputs["embed"], diagnosis_data.get("top_k", 5))
             
-            # Get relevant triplets
-            kg_triplets = await kg_client.get_top_triplets_for_patient(symptoms, top_k=10)
+            async def find_triplets(inputs):
+                return await kg_client.get_top_triplets_for_patient(symptoms, top_k=10)
             
-            self.update_state(state="PROGRESS", meta={"progress": 70, "message": "Generating diagnosis"})
+            async def build_prompt(inputs):
+                progress(70, "Generating diagnosis")
+                return build_diagnosis_prompt(diagnosis_data, inputs["search"], inputs["triplets"])
             
-            # Build prompt and get LLM response
-            prompt = build_diagnosis_prompt(diagnosis_data, similar_cases, kg_triplets)
-            llm_response = await llm_client.generate_diagnosis(prompt)
+            async def generate(inputs):
+                prompt = inputs["prompt"]
+                
+                if not settings.llm_streaming_enabled:
+                    return await llm_client.generate_diagnosis(prompt)
+                
+                # Surface each differential diagnosis as soon as it is parsed
+                llm_response = None
+                partial_diagnoses = []
+                async for event in llm_client.stream_diagnosis(prompt):
+                    if event["type"] == "diagnosis":
+                        partial_diagnoses.append(event["data"])
+                        progress(70, "Generating diagnosis", partialDiagnoses=list(partial_diagnoses))
+                    elif event["type"] == "complete":
+                        llm_response = event["data"]
+                return llm_response
             
-            self.update_state(state="PROGRESS", meta={"progress": 90, "message": "Finalizing results"})
+            async def format_result(inputs):
+                progress(90, "Finalizing results")
+                return format_diagnosis_result(inputs["llm"], inputs["search"])
             
-            # Format response
-            from datetime import datetime
-            import uuid
+            # Case search and KG lookup are independent, so they run side by
+            # side and either one degrades to an empty result on failure
+            pipeline = StagePipeline([
+                Stage("init_faiss", init_faiss, fallback=None),
+                Stage("init_kg", init_kg, fallback=None),
+                Stage("embed", embed_query, depends_on=("init_faiss",),
+                      timeout_sec=settings.diagnosis_search_timeout_sec, fallback=None),
+                Stage("search", search_cases, depends_on=("embed",),
+                      timeout_sec=settings.diagnosis_search_timeout_sec, fallback=list),
+                Stage("triplets", find_triplets, depends_on=("init_kg",),
+                      timeout_sec=settings.diagnosis_triplets_timeout_sec, fallback=list),
+                Stage("prompt", build_prompt, depends_on=("search", "triplets")),
+                Stage("llm", generate, depends_on=("prompt",), timeout_sec=settings.diagnosis_llm_timeout_sec),
+                Stage("format", format_result, depends_on=("llm", "search"))
+            ], name="diagnosis")
             
-            result = {
-                "differentialDiagnosis": [
-                    {
-                        "condition": diag["condition"],
-                        "confidence": diag["confidence"],
-                        "description": diag["description"],
-                        "icd10": diag.get("icd10")
-                    }
-                    for diag in llm_response.get("differential_diagnosis", [])
-                ],
-                "recommendedActions": [
-                    {
-                        "id": str(uuid.uuid4()),
-                        "text": action["text"],
-                        "priority": action["priority"],
-                        "category": action["category"]
-                    }
-                    for action in llm_response.get("recommended_actions", [])
-                ],
-                "followUpQuestions": [
-                    {
-                        "id": str(uuid.uuid4()),
-                        "text": question["text"]
-                    }
-                    for question in llm_response.get("follow_up_questions", [])
-                ],
-                "similarCases": [
-                    {
-                        "caseId": case["case_id"],
-                        "similarity": case["similarity"],
-                        "diagnosis": case["diagnosis"],
-                        "outcome": case.get("outcome")
-                    }
-                    for case in similar_cases
-                ],
-                "session": {
-                    "sessionId": session_id,
-                    "startedAt": datetime.utcnow().isoformat(),
-                    "durationSec": 5.2  # Mock duration
-                }
+            progress(30, "Searching similar cases and knowledge graph")
+            outcome = await pipeline.run()
+            
+            return {
+                "result": outcome.results["format"],
+                "stages": {name: round(duration, 4) for name, duration in outcome.timings.items()}
             }
+        
+        async def run_deduplicated():
+            if not settings.diagnosis_singleflight_enabled:
+                return await run_diagnosis()
             
-            return result
+            # Concurrent identical requests share one computation
+            key = canonical_request_key(diagnosis_data)
+            return await diagnosis_flight.do(key, run_diagnosis)
         
-        result = loop.run_until_complete(run_diagnosis())
+        started_at = datetime.utcnow()
+        start_time = time.perf_counter()
         
-        # Store result
-        task_results[session_id] = {
+        computed = await run_deduplicated()
+        
+        duration = time.perf_counter() - start_time
+        metrics.record_pipeline_duration("diagnosis", duration)
+        
+        # A deduplicated follower reports the leader's stage spans and its own wall time
+        result = dict(computed["result"])
+        result["session"] = {
+            "sessionId": session_id,
+            "startedAt": started_at.isoformat(),
+            "durationSec": round(duration, 3),
+            "stages": computed["stages"]
+        }
+        
+        # Store result off the loop, which may be the API's own
+        await asyncio.to_thread(result_store.set, session_id, {
             "status": "completed",
             "result": result,
             "session_id": session_id
-        }
+        })
+        report_outcome(session_id, "completed")
         
         return {
             "status": "completed",
@@ -201,25 +489,208 @@ def process_diagnosis(self, session_id: str, diagnosis_data: Dict[str, Any]) ->
         
     except Exception as e:
         logger.error(f"Diagnosis processing failed for {session_id}: {e}")
-        task_results[session_id] = {
+        await asyncio.to_thread(result_store.set, session_id, {
             "status": "error",
             "error": str(e),
             "session_id": session_id
+        })
+        report_outcome(session_id, "error", error=str(e))
+        raise
+
+@celery_app.task(bind=True)
+def process_diagnosis(self, session_id: str, diagnosis_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Process diagnosis request asynchronously"""
+    # Coroutines run on the worker loop thread, where the task request
+    # context is not visible, so progress updates name the task explicitly
+    task_id = self.request.id
+    
+    def progress(percent: int, message: str, **extra):
+        report_progress(self, task_id, session_id, percent, message, **extra)
+    
+    return worker_runtime.run(execute_diagnosis(session_id, diagnosis_data, progress))
+
+async def run_diagnosis_batch(
+    items: List[Dict[str, Any]],
+    llm_concurrency: int = settings.diagnosis_batch_llm_concurrency,
+    on_item: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None
+) -> Dict[str, Dict[str, Any]]:
+    """Diagnose many requests with shared retrieval.
+    
+    Items are ``{"sessionId", "request"}`` dicts. Case search runs as one
+    batched embedding pass and one FAISS call, triplets are ranked from a
+    single scan per distinct symptom, and only the LLM calls fan out, capped
+    at ``llm_concurrency``. Each step keeps the timeout and fallback it has in
+    a single diagnosis. ``on_item`` is awaited as each item finishes.
+    """
+    from app.core.faiss_client import faiss_client
+    from app.core.kg_client import kg_client
+    from app.core.llm_client import llm_client, build_diagnosis_prompt
+    from app.core.singleflight import diagnosis_flight, canonical_request_key
+    
+    requests = [item["request"] for item in items]
+    
+    async def init_faiss(inputs):
+        await faiss_client.initialize()
+    
+    async def init_kg(inputs):
+        await kg_client.initialize()
+    
+    async def search_cases(inputs):
+        return await faiss_client.search_batch(
+            [build_case_query(request) for request in requests],
+            [request.get("top_k", 5) for request in requests]
+        )
+    
+    async def find_triplets(inputs):
+        return await kg_client.get_top_triplets_for_patients(
+            [request.get("symptoms", []) for request in requests], top_k=10
+        )
+    
+    def no_results():
+        return [[] for _ in requests]
+    
+    retrieval = await StagePipeline([
+        Stage("init_faiss", init_faiss, fallback=None),
+        Stage("init_kg", init_kg, fallback=None),
+        Stage("search", search_cases, depends_on=("init_faiss",),
+              timeout_sec=settings.diagnosis_search_timeout_sec, fallback=no_results),
+        Stage("triplets", find_triplets, depends_on=("init_kg",),
+              timeout_sec=settings.diagnosis_triplets_timeout_sec, fallback=no_results)
+    ], name="diagnosis_batch").run()
+    similar_cases = retrieval.results["search"]
+    kg_triplets = retrieval.results["triplets"]
+    
+    semaphore = asyncio.Semaphore(llm_concurrency)
+    outcomes: Dict[str, Dict[str, Any]] = {}
+    
+    async def diagnose(index: int):
+        session_id = items[index]["sessionId"]
+        request = requests[index]
+        started_at = datetime.utcnow()
+        start_time = time.perf_counter()
+        
+        async def build_prompt(inputs):
+            return build_diagnosis_prompt(request, similar_cases[index], kg_triplets[index])
+        
+        async def generate(inputs):
+            return await llm_client.generate_diagnosis(inputs["prompt"])
+        
+        async def format_result(inputs):
+            return format_diagnosis_result(inputs["llm"], similar_cases[index])
+        
+        async def run_item():
+            pipeline = StagePipeline([
+                Stage("prompt", build_prompt),
+                Stage("llm", generate, depends_on=("prompt",), timeout_sec=settings.diagnosis_llm_timeout_sec),
+                Stage("format", format_result, depends_on=("llm",))
+            ], name="diagnosis_batch_item")
+            
+            # The LLM timeout starts once the item holds a slot, not while it queues
+            async with semaphore:
+                outcome = await pipeline.run()
+            return outcome.results["format"]
+        
+        try:
+            if settings.diagnosis_singleflight_enabled:
+                result = dict(await diagnosis_flight.do(canonical_request_key(request), run_item))
+            else:
+                result = await run_item()
+            
+            result["session"] = {
+                "sessionId": session_id,
+                "startedAt": started_at.isoformat(),
+                "durationSec": round(time.perf_counter() - start_time, 3)
+            }
+            outcome = {"status": "completed", "result": result, "session_id": session_id}
+        except Exception as e:
+            logger.error(f"Batch diagnosis failed for {session_id}: {e}")
+            outcome = {"status": "error", "error": str(e), "session_id": session_id}
+        
+        outcomes[session_id] = outcome
+        if on_item:
+            await on_item(session_id, outcome)
+    
+    await asyncio.gather(*(diagnose(index) for index in range(len(items))))
+    return outcomes
+
+async def execute_diagnosis_batch(
+    batch_id: str,
+    items: List[Dict[str, Any]],
+    progress: Callable[..., None]
+) -> Dict[str, Any]:
+    """Run a diagnosis batch and store each item's outcome and the batch's.
+    
+    Shared by the Celery task and the in-process executors. ``progress`` is
+    called as ``progress(percent, message, **extra)``.
+    """
+    try:
+        item_status = {item["sessionId"]: "processing" for item in items}
+        progress(0, "Searching similar cases", items=dict(item_status))
+        
+        async def on_item(session_id: str, outcome: Dict[str, Any]):
+            await asyncio.to_thread(result_store.set, session_id, outcome)
+            report_outcome(session_id, outcome["status"], error=outcome.get("error"))
+            item_status[session_id] = outcome["status"]
+            
+            finished = sum(status != "processing" for status in item_status.values())
+            progress(int(100 * finished / len(items)), f"Diagnosed {finished} of {len(items)}", items=dict(item_status))
+        
+        outcomes = await run_diagnosis_batch(items, on_item=on_item)
+        
+        failed = sum(outcome["status"] == "error" for outcome in outcomes.values())
+        logger.info(f"Batch {batch_id} finished: {len(items) - failed} completed, {failed} failed")
+        
+        await asyncio.to_thread(result_store.set, batch_id, {
+            "status": "completed",
+            "batch_id": batch_id,
+            "items": dict(item_status)
+        })
+        report_outcome(batch_id, "completed", items=dict(item_status))
+        
+        return {
+            "status": "completed",
+            "batch_id": batch_id,
+            "items": dict(item_status)
         }
+        
+    except Exception as e:
+        logger.error(f"Batch diagnosis failed for {batch_id}: {e}")
+        await asyncio.to_thread(result_store.set, batch_id, {
+            "status": "error",
+            "error": str(e),
+            "batch_id": batch_id
+        })
+        report_outcome(batch_id, "error", error=str(e))
         raise
 
+@celery_app.task(bind=True)
+def process_diagnosis_batch(self, batch_id: str, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Process a batch of diagnosis requests with shared retrieval"""
+    task_id = self.request.id
+    
+    def progress(percent: int, message: str, **extra):
+        report_progress(self, task_id, batch_id, percent, message, **extra)
+    
+    return worker_runtime.run(execute_diagnosis_batch(batch_id, items, progress))
+
 @celery_app.task(bind=True)
 def generate_report(self, session_id: str, export_format: str, options: Dict[str, Any]) -> Dict[str, Any]:
-    """Generate diagnosis report in specified format"""
+    """Generate diagnosis report in specified format.
+    
+    Progress and the outcome are keyed by the task id, which the download
+    URL carries, so they never overwrite the diagnosis session's own events.
+    """
+    task_id = self.request.id
+    
     try:
-        self.update_state(state="PROGRESS", meta={"progress": 20, "message": "Preparing report"})
+        report_progress(self, task_id, task_id, 20, "Preparing report")
         
         # Get diagnosis result
-        diagnosis_result = task_results.get(session_id, {}).get("result")
+        diagnosis_result = (result_store.get(session_id) or {}).get("result")
         if not diagnosis_result:
             raise ValueError(f"No diagnosis result found for session {session_id}")
         
-        self.update_state(state="PROGRESS", meta={"progress": 60, "message": "Generating report"})
+        report_progress(self, task_id, task_id, 60, "Generating report")
         
         if export_format == "json":
             report_data = diagnosis_result
@@ -239,22 +710,32 @@ def generate_report(self, session_id: str, export_format: str, options: Dict[str
         else:
             raise ValueError(f"Unsupported export format: {export_format}")
         
-        self.update_state(state="PROGRESS", meta={"progress": 90, "message": "Finalizing report"})
+        report_progress(self, task_id, task_id, 90, "Finalizing report")
         
-        return {
+        report = {
             "status": "completed",
             "format": export_format,
             "download_url": download_url,
             "data": report_data
         }
+        result_store.set(task_id, {**report, "session_id": session_id})
+        report_outcome(task_id, "completed")
+        
+        return report
         
     except Exception as e:
         logger.error(f"Report generation failed for {session_id}: {e}")
+        result_store.set(task_id, {
+            "status": "error",
+            "error": str(e),
+            "session_id": session_id
+        })
+        report_outcome(task_id, "error", error=str(e))
         raise
 
 def get_task_result(task_id: str) -> Optional[Dict[str, Any]]:
     """Get task result from storage"""
-    return task_results.get(task_id)
+    return result_store.get(task_id)
 
 def get_task_status(task_id: str) -> Dict[str, Any]:
     """Get task status from Celery"""
@@ -267,7 +748,9 @@ def get_task_status(task_id: str) -> Dict[str, Any]:
             return {
                 "status": "processing",
                 "progress": result.info.get("progress", 0),
-                "message": result.info.get("message", "")
+                "message": result.info.get("message", ""),
+                "partialDiagnoses": result.info.get("partialDiagnoses", []),
+                "items": result.info.get("items", {})
             }
         elif result.state == "SUCCESS":
             return {"status": "completed", "progress": 100, "result": result.result}
@@ -8,9 +8,13 @@ from loguru import logger
 import sys
 
 from app.config import settings
-from app.api.v1 import health, uploads, extract, patients, diagnosis, kg
+from app.api.v1 import health, uploads, extract, patients, diagnosis, kg, progress, files
 from app.core.faiss_client import faiss_client
 from app.core.kg_client import kg_client
+from app.core.llm_client import llm_client
+from app.core.progress import progress_broker
+from app.core.storage import storage_client
+from app.core.local_executor import get_local_executor
 from app.utils.prometheus_metrics import metrics
 from app.utils.io_helpers import AuthHelper
 
@@ -138,6 +142,17 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down MedRAG API server...")
+    
+    # Close pooled LLM and storage HTTP connections
+    await llm_client.close()
+    await storage_client.close()
+    
+    # Stop the progress event listener
+    await progress_broker.close()
+    
+    # Stop in-process diagnosis workers
+    if settings.execution_mode != "celery":
+        get_local_executor().shutdown()
 
 # Exception handlers
 @app.exception_handler(HTTPException)
@@ -150,7 +165,8 @@ async def http_exception_handler(request: Request, exc: HTTPException):
             "message": exc.detail,
             "status_code": exc.status_code,
             "path": request.url.path
-        }
+        },
+        headers=exc.headers
     )
 
 @app.exception_handler(Exception)
@@ -171,10 +187,12 @@ async def general_exception_handler(request: Request, exc: Exception):
 # Include routers
 app.include_router(health.router, prefix="/api/v1", tags=["Health"])
 app.include_router(uploads.router, prefix="/api/v1", tags=["File Upload"])
+app.include_router(files.router, prefix="/api/v1", tags=["Files"])
 app.include_router(extract.router, prefix="/api/v1", tags=["Extraction"])
 app.include_router(patients.router, prefix="/api/v1", tags=["Patients"])
 app.include_router(diagnosis.router, prefix="/api/v1", tags=["Diagnosis"])
 app.include_router(kg.router, prefix="/api/v1", tags=["Knowledge Graph"])
+app.include_router(progress.router, prefix="/api/v1", tags=["Progress"])
 
 # Root endpoint
 @app.get("/")
@@ -1,12 +1,16 @@
+import hmac
 import json
+import time
 import uuid
-from typing import Dict, Any, Optional
+import hashlib
+from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 from loguru import logger
 
 # Simple in-memory storage for development (use proper DB in production)
 patients_db = {}
 sessions_db = {}
+batches_db = {}
 feedback_db = {}
 
 class DatabaseHelper:
@@ -77,6 +81,34 @@ class DatabaseHelper:
             return True
         return False
     
+    @staticmethod
+    def create_batch(session_ids: List[str]) -> str:
+        """Create a diagnosis batch over existing sessions"""
+        batch_id = str(uuid.uuid4())
+        batches_db[batch_id] = {
+            "id": batch_id,
+            "session_ids": list(session_ids),
+            "task_id": None,
+            "created_at": datetime.utcnow().isoformat()
+        }
+        for session_id in session_ids:
+            DatabaseHelper.update_session(session_id, {"batch_id": batch_id})
+        logger.info(f"Created diagnosis batch {batch_id} with {len(session_ids)} sessions")
+        return batch_id
+    
+    @staticmethod
+    def get_batch(batch_id: str) -> Optional[Dict[str, Any]]:
+        """Get batch record by ID"""
+        return batches_db.get(batch_id)
+    
+    @staticmethod
+    def update_batch(batch_id: str, updates: Dict[str, Any]) -> bool:
+        """Update batch record"""
+        if batch_id in batches_db:
+            batches_db[batch_id].update(updates)
+            return True
+        return False
+    
     @staticmethod
     def create_feedback(session_id: str, feedback_data: Dict[str, Any]) -> str:
         """Create feedback record"""
@@ -144,6 +176,30 @@ class AuthHelper:
         except jwt.JWTError as e:
             logger.warning(f"Token verification failed: {e}")
             return None
+    
+    @staticmethod
+    def file_signature(file_id: str, expires: int) -> str:
+        """HMAC-SHA256 over a file id and its expiry timestamp"""
+        from app.config import settings
+        
+        message = f"{file_id}:{expires}".encode("utf-8")
+        return hmac.new(settings.secret_key.encode("utf-8"), message, hashlib.sha256).hexdigest()
+    
+    @staticmethod
+    def sign_file_url(file_id: str, expires_in: Optional[int] = None) -> str:
+        """Build a download URL that is valid without a bearer token until it expires"""
+        from app.config import settings
+        
+        expires = int(time.time()) + (expires_in if expires_in is not None else settings.file_url_ttl_sec)
+        signature = AuthHelper.file_signature(file_id, expires)
+        return f"/api/v1/files/{file_id}?expires={expires}&signature={signature}"
+    
+    @staticmethod
+    def verify_file_signature(file_id: str, expires: int, signature: str) -> bool:
+        """Check a signed download URL in constant time"""
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(AuthHelper.file_signature(file_id, expires), signature)
 
 class ValidationHelper:
     @staticmethod
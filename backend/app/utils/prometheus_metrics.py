@@ -1,7 +1,7 @@
 from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
 from functools import wraps
 import time
-from typing import Callable
+from typing import Callable, Dict
 from loguru import logger
 
 # Define metrics
@@ -39,6 +39,185 @@ LLM_REQUEST_DURATION = Histogram(
     ['provider']
 )
 
+LLM_PROMPT_TOKENS = Histogram(
+    'medrag_llm_prompt_tokens',
+    'Estimated prompt tokens per section',
+    ['section'],
+    buckets=(0, 25, 50, 100, 200, 400, 800, 1600, 3200, 6400)
+)
+
+LLM_PROMPT_ITEMS_DROPPED = Counter(
+    'medrag_llm_prompt_items_dropped_total',
+    'Retrieved context items left out of the prompt (duplicate or over budget)',
+    ['section']
+)
+
+LLM_CONCURRENCY_LIMIT = Gauge(
+    'medrag_llm_concurrency_limit',
+    'Current adaptive concurrency limit for LLM calls',
+    ['provider']
+)
+
+LLM_IN_FLIGHT = Gauge(
+    'medrag_llm_in_flight',
+    'Number of LLM calls currently in flight',
+    ['provider']
+)
+
+LLM_QUEUE_DEPTH = Gauge(
+    'medrag_llm_queue_depth',
+    'Number of LLM calls waiting for a concurrency slot',
+    ['provider']
+)
+
+LLM_CIRCUIT_STATE = Gauge(
+    'medrag_llm_circuit_state',
+    'LLM circuit breaker state (0=closed, 1=half_open, 2=open)',
+    ['provider']
+)
+
+LLM_REJECTIONS = Counter(
+    'medrag_llm_rejections_total',
+    'Total number of LLM calls rejected before reaching the provider',
+    ['provider', 'reason']
+)
+
+LLM_HEDGES = Counter(
+    'medrag_llm_hedges_total',
+    'Total number of LLM calls by hedging outcome',
+    ['provider', 'outcome']
+)
+
+LLM_HEDGE_RATE = Gauge(
+    'medrag_llm_hedge_rate',
+    'Fraction of LLM calls that sent a hedge request',
+    ['provider']
+)
+
+LLM_HEDGE_LATENCY_SAVED = Histogram(
+    'medrag_llm_hedge_latency_saved_seconds',
+    'Estimated tail latency saved when a hedge request wins in seconds',
+    ['provider']
+)
+
+LLM_HTTP_CONNECTIONS = Counter(
+    'medrag_llm_http_connections_total',
+    'Total number of LLM HTTP connections acquired from the pool',
+    ['provider', 'kind']
+)
+
+LLM_HTTP_POOL_WAIT_DURATION = Histogram(
+    'medrag_llm_http_pool_wait_seconds',
+    'Time spent waiting for a free LLM HTTP pool connection in seconds',
+    ['provider']
+)
+
+LLM_CACHE_REQUESTS = Counter(
+    'medrag_llm_cache_requests_total',
+    'Total number of LLM response cache lookups',
+    ['tier', 'result']
+)
+
+LLM_CACHE_HIT_RATIO = Gauge(
+    'medrag_llm_cache_hit_ratio',
+    'Fraction of LLM response cache lookups served from cache'
+)
+
+LLM_CACHE_LATENCY_SAVED = Counter(
+    'medrag_llm_cache_latency_saved_seconds_total',
+    'Total LLM latency avoided by serving responses from cache in seconds'
+)
+
+DIAGNOSIS_DUPLICATES_SUPPRESSED = Counter(
+    'medrag_diagnosis_duplicates_suppressed_total',
+    'Total number of duplicate diagnosis computations suppressed by single-flight',
+    ['scope']
+)
+
+PIPELINE_STAGE_DURATION = Histogram(
+    'medrag_pipeline_stage_duration_seconds',
+    'Pipeline stage duration in seconds',
+    ['pipeline', 'stage'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+
+PIPELINE_DURATION = Histogram(
+    'medrag_pipeline_duration_seconds',
+    'End-to-end pipeline duration in seconds',
+    ['pipeline'],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+)
+
+PIPELINE_STAGE_FALLBACKS = Counter(
+    'medrag_pipeline_stage_fallbacks_total',
+    'Pipeline stages that failed or timed out and used a partial-result fallback',
+    ['pipeline', 'stage', 'reason']
+)
+
+PROGRESS_SUBSCRIBERS = Gauge(
+    'medrag_progress_subscribers',
+    'Clients currently subscribed to progress events',
+    ['transport']
+)
+
+PROGRESS_EVENTS_DROPPED = Counter(
+    'medrag_progress_events_dropped_total',
+    'Progress events dropped because a subscriber fell behind'
+)
+
+TASK_QUEUE_DEPTH = Gauge(
+    'medrag_task_queue_depth',
+    'Messages waiting in each Celery queue',
+    ['queue']
+)
+
+TASK_QUEUE_WAIT = Histogram(
+    'medrag_task_queue_wait_seconds',
+    'Time tasks spend queued before a worker starts them',
+    ['queue'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 1800.0)
+)
+
+STORAGE_DEDUPLICATED_BYTES = Counter(
+    'medrag_storage_deduplicated_bytes_total',
+    'Uploaded bytes not stored again because identical content already existed'
+)
+
+EXTRACTION_CACHE_REQUESTS = Counter(
+    'medrag_extraction_cache_requests_total',
+    'Extraction result lookups by content hash',
+    ['result']
+)
+
+FILE_DOWNLOADS = Counter(
+    'medrag_file_downloads_total',
+    'File download responses by kind',
+    ['kind']
+)
+
+FILE_DOWNLOAD_BYTES = Counter(
+    'medrag_file_download_bytes_total',
+    'Bytes sent by file downloads'
+)
+
+S3_REQUESTS = Counter(
+    'medrag_s3_requests_total',
+    'S3 API requests by operation and response status',
+    ['operation', 'status']
+)
+
+S3_REQUEST_DURATION = Histogram(
+    'medrag_s3_request_duration_seconds',
+    'S3 API request duration',
+    ['operation']
+)
+
+S3_TRANSFER_BYTES = Counter(
+    'medrag_s3_transfer_bytes_total',
+    'Bytes transferred to and from S3',
+    ['direction']
+)
+
 ACTIVE_SESSIONS = Gauge(
     'medrag_active_sessions',
     'Number of active diagnosis sessions'
@@ -173,6 +352,136 @@ class MetricsCollector:
         LLM_REQUESTS.labels(provider=provider, status=status).inc()
         LLM_REQUEST_DURATION.labels(provider=provider).observe(duration)
     
+    @staticmethod
+    def record_llm_fallback(provider: str):
+        """Record an LLM call answered with the fallback response"""
+        LLM_REQUESTS.labels(provider=provider, status="fallback").inc()
+    
+    @staticmethod
+    def record_prompt_tokens(usage: dict, dropped: dict):
+        """Record per-section prompt token usage and context items left out"""
+        for section, tokens in usage.items():
+            LLM_PROMPT_TOKENS.labels(section=section).observe(tokens)
+        for section, count in dropped.items():
+            if count > 0:
+                LLM_PROMPT_ITEMS_DROPPED.labels(section=section).inc(count)
+    
+    @staticmethod
+    def record_llm_rejection(provider: str, reason: str):
+        """Record an LLM call rejected by the circuit breaker or limiter"""
+        LLM_REJECTIONS.labels(provider=provider, reason=reason).inc()
+    
+    @staticmethod
+    def update_llm_concurrency(provider: str, limit: float, in_flight: int, queued: int):
+        """Update LLM concurrency limiter gauges"""
+        LLM_CONCURRENCY_LIMIT.labels(provider=provider).set(limit)
+        LLM_IN_FLIGHT.labels(provider=provider).set(in_flight)
+        LLM_QUEUE_DEPTH.labels(provider=provider).set(queued)
+    
+    @staticmethod
+    def update_llm_circuit_state(provider: str, state: str):
+        """Update LLM circuit breaker state gauge"""
+        LLM_CIRCUIT_STATE.labels(provider=provider).set({"closed": 0, "half_open": 1, "open": 2}[state])
+    
+    @staticmethod
+    def record_llm_hedge(provider: str, outcome: str, hedge_rate: float, latency_saved: float = 0.0):
+        """Record the outcome of a hedged LLM call"""
+        LLM_HEDGES.labels(provider=provider, outcome=outcome).inc()
+        LLM_HEDGE_RATE.labels(provider=provider).set(hedge_rate)
+        if outcome == "hedge_won":
+            LLM_HEDGE_LATENCY_SAVED.labels(provider=provider).observe(latency_saved)
+    
+    @staticmethod
+    def record_llm_connection(provider: str, reused: bool):
+        """Record an LLM HTTP connection acquisition (new or reused)"""
+        kind = "reused" if reused else "new"
+        LLM_HTTP_CONNECTIONS.labels(provider=provider, kind=kind).inc()
+    
+    @staticmethod
+    def record_llm_pool_wait(provider: str, duration: float):
+        """Record time spent waiting for a pooled LLM HTTP connection"""
+        LLM_HTTP_POOL_WAIT_DURATION.labels(provider=provider).observe(duration)
+    
+    @staticmethod
+    def record_llm_cache_lookup(result: str, tier: str = "none", latency_saved: float = 0.0):
+        """Record an LLM response cache lookup (hit, miss or bypass)"""
+        LLM_CACHE_REQUESTS.labels(tier=tier, result=result).inc()
+        if latency_saved > 0:
+            LLM_CACHE_LATENCY_SAVED.inc(latency_saved)
+    
+    @staticmethod
+    def update_llm_cache_hit_ratio(ratio: float):
+        """Update LLM response cache hit ratio gauge"""
+        LLM_CACHE_HIT_RATIO.set(ratio)
+    
+    @staticmethod
+    def record_duplicate_suppressed(scope: str):
+        """Record a diagnosis that attached to an in-flight duplicate"""
+        DIAGNOSIS_DUPLICATES_SUPPRESSED.labels(scope=scope).inc()
+    
+    @staticmethod
+    def record_pipeline_stage(pipeline: str, stage: str, duration: float):
+        """Record how long one pipeline stage took"""
+        PIPELINE_STAGE_DURATION.labels(pipeline=pipeline, stage=stage).observe(duration)
+    
+    @staticmethod
+    def record_pipeline_duration(pipeline: str, duration: float):
+        """Record end-to-end pipeline duration"""
+        PIPELINE_DURATION.labels(pipeline=pipeline).observe(duration)
+    
+    @staticmethod
+    def record_pipeline_stage_fallback(pipeline: str, stage: str, reason: str):
+        """Record a stage that degraded to its fallback result"""
+        PIPELINE_STAGE_FALLBACKS.labels(pipeline=pipeline, stage=stage, reason=reason).inc()
+    
+    @staticmethod
+    def record_progress_subscriber(transport: str, delta: int):
+        """Track progress subscribers connecting (+1) and leaving (-1)"""
+        PROGRESS_SUBSCRIBERS.labels(transport=transport).inc(delta)
+    
+    @staticmethod
+    def record_progress_event_dropped():
+        """Record a superseded progress event dropped for a slow subscriber"""
+        PROGRESS_EVENTS_DROPPED.inc()
+    
+    @staticmethod
+    def record_task_queue_wait(queue: str, wait: float):
+        """Record how long a task waited in its queue"""
+        TASK_QUEUE_WAIT.labels(queue=queue).observe(wait)
+    
+    @staticmethod
+    def record_queue_depths(depths: Dict[str, int]):
+        """Update the queue depth gauges from a broker sample"""
+        for queue, depth in depths.items():
+            TASK_QUEUE_DEPTH.labels(queue=queue).set(depth)
+    
+    @staticmethod
+    def record_storage_deduplicated(size: int):
+        """Record an upload whose content was already stored"""
+        STORAGE_DEDUPLICATED_BYTES.inc(size)
+    
+    @staticmethod
+    def record_extraction_cache_lookup(hit: bool):
+        """Record an extraction result lookup by content hash"""
+        EXTRACTION_CACHE_REQUESTS.labels(result="hit" if hit else "miss").inc()
+    
+    @staticmethod
+    def record_file_download(kind: str, size: int = 0):
+        """Record a file download (full, partial, not_modified, redirect)"""
+        FILE_DOWNLOADS.labels(kind=kind).inc()
+        FILE_DOWNLOAD_BYTES.inc(size)
+    
+    @staticmethod
+    def record_s3_request(operation: str, status: str, duration: float):
+        """Record an S3 API request"""
+        S3_REQUESTS.labels(operation=operation, status=status).inc()
+        S3_REQUEST_DURATION.labels(operation=operation).observe(duration)
+    
+    @staticmethod
+    def record_s3_transfer(direction: str, size: int):
+        """Record bytes uploaded to or downloaded from S3"""
+        S3_TRANSFER_BYTES.labels(direction=direction).inc(size)
+    
     @staticmethod
     def record_file_upload(file_type: str, success: bool = True):
         """Record file upload metrics"""
@@ -0,0 +1,81 @@
+"""Extraction throughput: one process vs page ranges on the process pool.
+
+Run from backend/:
+
+    python -m benchmarks.extraction_parallel --size-mb 50
+
+Generates a clinical-notes text file of the given size and extracts it with
+1, 2, 4, ... processes up to the core count, reporting the speedup over the
+single-process run. With one range per process and CPU-bound entity
+matching, the speedup should grow close to linearly until the disk or the
+core count becomes the limit.
+"""
+import os
+import time
+import argparse
+import tempfile
+
+from app.config import settings
+from app.core.extraction import (
+    extract_document, get_extraction_pool, shutdown_extraction_pool, parallel_extraction_available
+)
+
+NOTE = (
+    "Patient reports chest pain radiating to the left arm with shortness of breath "
+    "and nausea since this morning. History of hypertension on lisinopril and "
+    "metoprolol; denies fever or cough. Plan: ECG, troponin, aspirin loading dose.\n"
+)
+
+def write_notes(path: str, size_mb: int):
+    line = NOTE.encode("utf-8")
+    repeats = max(1, (size_mb * 1024 * 1024) // len(line))
+    with open(path, "wb") as f:
+        for _ in range(repeats // 1000):
+            f.write(line * 1000)
+        f.write(line * (repeats % 1000))
+
+def process_counts(max_workers: int) -> list:
+    counts = [1]
+    while counts[-1] * 2 <= max_workers:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != max_workers:
+        counts.append(max_workers)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=50)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--pages-per-task", type=int, default=settings.extraction_pages_per_task)
+    args = parser.parse_args()
+    
+    if not parallel_extraction_available():
+        # Every run would fall back to one process and report a flat 1x
+        raise SystemExit("This process cannot start the extraction pool, so no speedup can be measured")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "notes.txt")
+        write_notes(path, args.size_mb)
+        print(f"{os.path.getsize(path) / 1024 / 1024:.0f} MB of notes, {args.pages_per_task} pages per task\n")
+        
+        baseline = None
+        for workers in process_counts(args.max_workers):
+            if workers > 1:
+                # Start the pool outside the timed region; spawn start-up is
+                # paid once per worker process, not per document
+                get_extraction_pool(workers).submit(int).result()
+            
+            start = time.perf_counter()
+            result = extract_document(path, workers=workers, pages_per_task=args.pages_per_task)
+            elapsed = time.perf_counter() - start
+            
+            baseline = baseline or elapsed
+            print(
+                f"{workers:>3} processes  {elapsed:7.2f} s  speedup {baseline / elapsed:5.2f}x"
+                f"  ({result['pages']} pages, {len(result['symptoms'])} symptoms)"
+            )
+        
+        shutdown_extraction_pool()
+
+if __name__ == "__main__":
+    main()
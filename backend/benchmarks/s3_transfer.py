@@ -0,0 +1,81 @@
+"""S3 transfer throughput: sequential vs parallel multipart upload and ranged download.
+
+Run from backend/ against MinIO (docker compose --profile s3 up) or a real
+bucket, with the AWS_* and S3_ENDPOINT_URL settings pointing at it:
+
+    S3_ENDPOINT_URL=http://localhost:9000 AWS_ACCESS_KEY_ID=medrag \\
+    AWS_SECRET_ACCESS_KEY=medrag-secret AWS_BUCKET_NAME=medrag-files \\
+    python -m benchmarks.s3_transfer --size-mb 256
+
+Uploads and downloads one file with 1, 2, 4, ... parts in flight up to
+--max-concurrency and reports MB/s for each. A single stream is bound by
+one connection's round trips; throughput should grow with concurrency
+until the link, the disk behind the server or the server itself saturates.
+"""
+import os
+import time
+import asyncio
+import argparse
+
+from app.config import settings
+from app.core.storage import S3StorageClient
+
+async def chunks(size: int, chunk_size: int):
+    block = os.urandom(chunk_size)
+    sent = 0
+    while sent < size:
+        yield block[:min(chunk_size, size - sent)]
+        sent += chunk_size
+
+def concurrency_levels(max_concurrency: int) -> list:
+    levels = [1]
+    while levels[-1] * 2 <= max_concurrency:
+        levels.append(levels[-1] * 2)
+    if levels[-1] != max_concurrency:
+        levels.append(max_concurrency)
+    return levels
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--part-mb", type=int, default=settings.s3_part_bytes // (1024 * 1024))
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    args = parser.parse_args()
+    
+    if not all([settings.aws_access_key_id, settings.aws_secret_access_key, settings.aws_bucket_name]):
+        parser.error("set AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY and AWS_BUCKET_NAME")
+    
+    size = args.size_mb * 1024 * 1024
+    print(f"{args.size_mb} MB in {args.part_mb} MB parts to {settings.s3_endpoint_url or 'AWS'}\n")
+    
+    for concurrency in concurrency_levels(args.max_concurrency):
+        storage = S3StorageClient(
+            bucket_name=settings.aws_bucket_name,
+            access_key=settings.aws_access_key_id,
+            secret_key=settings.aws_secret_access_key,
+            region=settings.aws_region,
+            endpoint_url=settings.s3_endpoint_url,
+            part_size=args.part_mb * 1024 * 1024,
+            transfer_concurrency=concurrency
+        )
+        try:
+            start = time.perf_counter()
+            file_id = await storage.upload_stream(chunks(size, 1024 * 1024), "benchmark.bin", "application/octet-stream")
+            upload = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            content = await storage.download_file(file_id)
+            download = time.perf_counter() - start
+            assert content is not None and len(content) == size
+            
+            await storage.delete_file(file_id)
+        finally:
+            await storage.close()
+        
+        print(
+            f"{concurrency:>3} in flight  upload {args.size_mb / upload:8.1f} MB/s"
+            f"  download {args.size_mb / download:8.1f} MB/s"
+        )
+
+if __name__ == "__main__":
+    asyncio.run(main())
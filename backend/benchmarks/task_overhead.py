@@ -0,0 +1,103 @@
+"""Per-task async overhead: a fresh event loop per task vs the worker runtime.
+
+Run from backend/:
+
+    python -m benchmarks.task_overhead --tasks 200
+
+Each simulated task makes one LLM call through PerplexityClient against a
+local stub server, so the numbers include HTTP session and connection setup
+that a per-task loop cannot reuse.
+"""
+import time
+import json
+import asyncio
+import argparse
+import statistics
+import threading
+from aiohttp import web
+
+from app.core.async_runtime import AsyncRuntime
+from app.core.llm_client import PerplexityClient
+
+DIAGNOSIS = {
+    "differential_diagnosis": [{"condition": "GERD", "confidence": 80.0, "description": "Reflux"}],
+    "recommended_actions": [],
+    "follow_up_questions": []
+}
+
+def start_stub_server() -> str:
+    """Serve a canned completion from a separate thread and return its URL"""
+    async def handler(request):
+        return web.json_response({"choices": [{"message": {"content": json.dumps(DIAGNOSIS)}}]})
+    
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    address = {}
+    
+    async def serve():
+        app = web.Application()
+        app.router.add_post("/chat/completions", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        address["port"] = runner.addresses[0][1]
+        ready.set()
+    
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(serve())
+        loop.run_forever()
+    
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return f"http://127.0.0.1:{address['port']}/chat/completions"
+
+def legacy_task(coro_fn):
+    """What process_diagnosis used to do: a new, never-closed loop per task"""
+    loop = asyncio.new_event_loop()
+    # Silence the "Unclosed client session" reports for the sessions each
+    # abandoned loop leaks
+    loop.set_exception_handler(lambda loop, context: None)
+    asyncio.set_event_loop(loop)
+    return loop.run_until_complete(coro_fn())
+
+def measure(label: str, run_task, tasks: int) -> list:
+    run_task()  # warm up
+    durations = []
+    for _ in range(tasks):
+        start = time.perf_counter()
+        run_task()
+        durations.append((time.perf_counter() - start) * 1000)
+    
+    durations.sort()
+    p95 = durations[int(len(durations) * 0.95) - 1]
+    print(f"{label:<34} median {statistics.median(durations):7.3f} ms   p95 {p95:7.3f} ms")
+    return durations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=200)
+    args = parser.parse_args()
+    
+    url = start_stub_server()
+    client = PerplexityClient("bench-key", base_url=url)
+    runtime = AsyncRuntime("bench-runtime")
+    
+    async def noop():
+        await asyncio.sleep(0)
+    
+    async def llm_call():
+        return await client.generate_diagnosis("benchmark prompt")
+    
+    print(f"{args.tasks} tasks each\n")
+    measure("no-op, loop per task", lambda: legacy_task(noop), args.tasks)
+    measure("no-op, worker runtime", lambda: runtime.run(noop()), args.tasks)
+    measure("LLM call, loop per task", lambda: legacy_task(llm_call), args.tasks)
+    measure("LLM call, worker runtime", lambda: runtime.run(llm_call()), args.tasks)
+    
+    runtime.add_shutdown_hook(client.close)
+    runtime.shutdown()
+
+if __name__ == "__main__":
+    main()
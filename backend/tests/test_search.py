@@ -69,6 +69,34 @@ class TestFAISSClient:
         
         assert results == []
     
+    @pytest.mark.asyncio
+    async def test_search_batch_uses_one_index_call(self, faiss_client):
+        """Test batch search embeds and searches all queries at once, trimming to each k"""
+        mock_index = Mock()
+        mock_index.search.return_value = (
+            np.array([[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]]),
+            np.array([[0, 1, 2], [2, 1, 0]])
+        )
+        
+        faiss_client.index = mock_index
+        faiss_client.case_metadata = {"0": {"diagnosis": "GERD"}, "1": {"diagnosis": "Pneumonia"}, "2": {"diagnosis": "Anxiety"}}
+        faiss_client._initialized = True
+        
+        from prometheus_client import REGISTRY
+        searches_before = REGISTRY.get_sample_value("medrag_faiss_searches_total") or 0.0
+        
+        with patch.object(faiss_client, 'generate_query_embeddings',
+                         return_value=np.random.rand(2, 384).astype(np.float32)) as mock_embed:
+            
+            results = await faiss_client.search_batch(["chest pain", "palpitations"], [3, 1])
+        
+        mock_embed.assert_called_once()
+        assert REGISTRY.get_sample_value("medrag_faiss_searches_total") - searches_before == 1
+        mock_index.search.assert_called_once()
+        assert mock_index.search.call_args[0][1] == 3
+        assert [r["diagnosis"] for r in results[0]] == ["GERD", "Pneumonia", "Anxiety"]
+        assert [r["diagnosis"] for r in results[1]] == ["Anxiety"]
+    
     def test_get_stats(self, faiss_client):
         """Test getting FAISS statistics"""
         # Test uninitialized
@@ -151,6 +179,24 @@ class TestKnowledgeGraphClient:
         assert all("relevance_score" in t for t in triplets)
         assert triplets[0]["relevance_score"] >= triplets[1]["relevance_score"]
     
+    @pytest.mark.asyncio
+    async def test_get_top_triplets_for_patients_matches_single(self, kg_client):
+        """Test batched triplet ranking agrees with per-patient ranking"""
+        kg_client.triplets = [
+            {"subject": "fever", "predicate": "symptom_of", "object": "pneumonia"},
+            {"subject": "cough", "predicate": "symptom_of", "object": "pneumonia"},
+            {"subject": "headache", "predicate": "symptom_of", "object": "migraine"},
+            {"subject": "fever", "predicate": "causes", "object": "headache"}
+        ]
+        symptom_lists = [["fever", "cough"], ["Headache"], [], ["fever"]]
+        
+        batched = await kg_client.get_top_triplets_for_patients(symptom_lists, top_k=3)
+        
+        for symptoms, triplets in zip(symptom_lists, batched):
+            assert triplets == await kg_client.get_top_triplets_for_patient(symptoms, top_k=3)
+        assert batched[2] == []
+        assert batched[1][0]["relevance_score"] == 1
+    
     @pytest.mark.asyncio
     async def test_get_disease_info(self, kg_client):
         """Test getting disease information"""